@@ -0,0 +1,196 @@
+"""Compare how ranges are read and edits applied, at the call sites that do it, with the splitlines code they replaced.
+
+Run from the continuedev directory with `PYTHONPATH=src python benchmarks/text_document.py [lines]`."""
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, List, Tuple
+
+from continuedev.models.filesystem import FileSystem, RangeInFile
+from continuedev.models.filesystem_edit import EditDiff, FileEdit, FileEditWithFullContents
+from continuedev.models.main import Position, Range
+from continuedev.server.ide import EditFileResponse, IdeProtocolServer
+
+FILEPATH = "/project/main.py"
+LINE = "    result = compute(value, other_value)  # comment\n"
+# Edits made one after another, as a streamed edit inserts its lines
+EDITS = 200
+
+
+def baseline_read_range_in_str(s: str, r: Range) -> str:
+    lines = s.splitlines()[r.start.line:r.end.line + 1]
+    if len(lines) == 0:
+        return ""
+
+    lines[0] = lines[0][r.start.character:]
+    lines[-1] = lines[-1][:r.end.character + 1]
+    return "\n".join(lines)
+
+
+def baseline_apply_edit_to_str(s: str, edit: FileEdit) -> Tuple[str, EditDiff]:
+    original = baseline_read_range_in_str(s, edit.range)
+
+    lines = s.splitlines()
+    if s.startswith("\n"):
+        lines.insert(0, "")
+    if s.endswith("\n"):
+        lines.append("")
+
+    if len(lines) == 0:
+        lines = [""]
+
+    end = Position(line=edit.range.end.line,
+                   character=edit.range.end.character)
+    if edit.range.end.line == len(lines) and edit.range.end.character == 0:
+        end = Position(line=edit.range.end.line - 1,
+                       character=len(lines[min(len(lines) - 1, edit.range.end.line - 1)]))
+
+    before_lines = lines[:edit.range.start.line]
+    after_lines = lines[end.line + 1:]
+    between_str = lines[min(len(lines) - 1, edit.range.start.line)][:edit.range.start.character] + \
+        edit.replacement + \
+        lines[min(len(lines) - 1, end.line)][end.character + 1:]
+
+    new_range = Range(
+        start=edit.range.start,
+        end=Position(
+            line=edit.range.start.line +
+            len(edit.replacement.splitlines()) - 1,
+            character=edit.range.start.character +
+            len(edit.replacement.splitlines()
+                [-1]) if edit.replacement != "" else 0
+        )
+    )
+
+    lines = before_lines + between_str.splitlines() + after_lines
+    return "\n".join(lines), EditDiff(
+        forward=edit,
+        backward=FileEdit(
+            filepath=edit.filepath,
+            range=new_range,
+            replacement=original
+        )
+    )
+
+
+class FakeIde(IdeProtocolServer):
+    """Answers requests at once, with the contents each file had before the edit being made"""
+    files: dict
+    contents_before_edits: List[str]
+
+    def __init__(self, files: dict, contents_before_edits: List[str]):
+        super().__init__(SimpleNamespace())
+        self.files = files
+        self.contents_before_edits = contents_before_edits
+
+    async def _send_and_receive_json(self, data: Any, resp_model, message_type: str, timeout: float = 0):
+        if message_type == "readFile":
+            return resp_model.parse_obj({"contents": self.files[data["filepath"]]})
+        if message_type == "readFiles":
+            return resp_model.parse_obj({"contents": [self.files[filepath] for filepath in data["filepaths"]]})
+        contents = self.contents_before_edits.pop(0)
+        return resp_model(fileEdit=FileEditWithFullContents(fileEdit=FileEdit.parse_obj(data["edit"]), fileContents=contents))
+
+
+class BaselineIde(FakeIde):
+    """The IDE server's reads and edits as they were before TextDocument"""
+
+    async def readRangeInFile(self, range_in_file: RangeInFile) -> str:
+        full_contents = await self.readFile(range_in_file.filepath)
+        return baseline_read_range_in_str(full_contents, range_in_file.range)
+
+    async def readRangesInFiles(self, range_in_files: List[RangeInFile]) -> List[str]:
+        return [await self.readRangeInFile(range_in_file) for range_in_file in range_in_files]
+
+    async def _edit_file(self, edit: FileEdit):
+        resp = await self._send_and_receive_json({"edit": edit.dict()}, EditFileResponse, "editFile")
+        new_contents, diff = baseline_apply_edit_to_str(
+            resp.fileEdit.fileContents, resp.fileEdit.fileEdit)
+        self.documents.set(edit.filepath, new_contents)
+        return resp.fileEdit, diff
+
+
+def timeit(fn: Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def ranges(lines: int) -> List[RangeInFile]:
+    """Ranges spread through the file, as steps read around the code they're working on"""
+    return [RangeInFile(filepath=FILEPATH, range=Range.from_shorthand(line, 4, line + 20, 10))
+            for line in range(0, lines - 20, max(1, lines // 20))]
+
+
+def streamed_edits(contents: str, lines: int) -> Tuple[List[FileEdit], List[str]]:
+    """Insertions of one line after another in the middle of the file, and the file's contents before each"""
+    edits, contents_before = [], []
+    for i in range(EDITS):
+        position = Position(line=lines // 2 + i, character=0)
+        edit = FileEdit.from_insertion(FILEPATH, position, LINE)
+        edits.append(edit)
+        contents_before.append(contents)
+        contents, _ = FileSystem.apply_edit_to_str(contents, edit)
+    return edits, contents_before
+
+
+def run_ide(ide_class, contents: str, lines: int) -> Tuple[float, float, float]:
+    rifs = ranges(lines)
+    edits, contents_before = streamed_edits(contents, lines)
+
+    async def read_each():
+        for rif in rifs:
+            await ide.readRangeInFile(rif)
+
+    async def read_all():
+        await ide.readRangesInFiles(rifs)
+
+    async def edit_all():
+        for edit in edits:
+            await ide._edit_file(edit)
+
+    ide = ide_class({FILEPATH: contents}, [])
+    asyncio.run(ide.readFile(FILEPATH))
+    read_time = timeit(lambda: asyncio.run(read_each()))
+    read_all_time = timeit(lambda: asyncio.run(read_all()))
+
+    def edit_from_start():
+        ide.documents.set(FILEPATH, contents)
+        ide.contents_before_edits = list(contents_before)
+        asyncio.run(edit_all())
+    edit_time = timeit(edit_from_start)
+    return read_time, read_all_time, edit_time
+
+
+if __name__ == "__main__":
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    contents = LINE * lines
+    r = Range.from_shorthand(lines // 2, 4, lines // 2 + 20, 10)
+    edit = FileEdit(filepath=FILEPATH, range=r, replacement=LINE * 3)
+    print(f"{lines} line file, {len(contents) / 1000:.0f} KB")
+
+    results = [
+        ("FileSystem.read_range_in_str",
+         timeit(lambda: baseline_read_range_in_str(contents, r)),
+         timeit(lambda: FileSystem.read_range_in_str(contents, r))),
+        ("FileSystem.apply_edit_to_str",
+         timeit(lambda: baseline_apply_edit_to_str(contents, edit)),
+         timeit(lambda: FileSystem.apply_edit_to_str(contents, edit))),
+    ]
+    baseline_ide = run_ide(BaselineIde, contents, lines)
+    ide = run_ide(FakeIde, contents, lines)
+    results += [
+        (f"readRangeInFile x{len(ranges(lines))}",
+         baseline_ide[0], ide[0]),
+        (f"readRangesInFiles of {len(ranges(lines))}",
+         baseline_ide[1], ide[1]),
+        (f"_edit_file x{EDITS}", baseline_ide[2], ide[2]),
+    ]
+
+    print(f"{'':32} {'before':>10} {'after':>10}")
+    for name, before, after in results:
+        print(f"{name:32} {before * 1000:8.2f}ms {after * 1000:8.2f}ms")
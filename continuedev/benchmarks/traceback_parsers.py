@@ -0,0 +1,51 @@
+"""Compare parse_python_traceback with the boltons parser it replaced on large logs.
+
+Run from the continuedev directory with `PYTHONPATH=src python benchmarks/traceback_parsers.py [megabytes]`."""
+import sys
+import time
+from typing import Callable
+
+from continuedev.libs.util.traceback_parsers import find_python_tracebacks, parse_python_traceback, parse_python_traceback_boltons
+
+TRACEBACK = """Traceback (most recent call last):
+  File "/home/user/project/main.py", line 7, in <module>
+    print(sum(first, second))
+          ^^^^^^^^^^^^^^^^^^
+  File "/home/user/project/sum.py", line 2, in sum
+    return a + b
+           ~~^~~
+TypeError: unsupported operand type(s) for +: 'int' and 'str'
+"""
+
+LOG_LINE = "INFO 2023-05-01 12:00:00,000 server.py:42 handled request GET /api/items in 12ms\n"
+
+
+def make_log(megabytes: float, tracebacks: int = 20) -> str:
+    """A log of the given size with tracebacks spread through it, the first one at the start"""
+    lines_between = int(megabytes * 1_000_000 /
+                        len(LOG_LINE) / tracebacks)
+    return (TRACEBACK + LOG_LINE * lines_between) * tracebacks
+
+
+def timeit(fn: Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    log = make_log(megabytes)
+    print(f"{len(log) / 1_000_000:.1f} MB log")
+
+    boltons_time = timeit(lambda: parse_python_traceback_boltons(log))
+    first_time = timeit(lambda: parse_python_traceback(log))
+    all_time = timeit(lambda: find_python_tracebacks(log))
+
+    print(f"boltons, first traceback:           {boltons_time * 1000:8.1f} ms")
+    print(f"parse_python_traceback, first:      {first_time * 1000:8.1f} ms")
+    print(
+        f"find_python_tracebacks, all {len(find_python_tracebacks(log))}:     {all_time * 1000:8.1f} ms")
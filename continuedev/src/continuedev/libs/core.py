@@ -1,13 +1,18 @@
+import asyncio
+import json
 import traceback
-import time
-from typing import Callable, Coroutine, Dict, Generator, List, Tuple, Union
+from typing import Any, Callable, ClassVar, Coroutine, Dict, Generator, List, Set, Tuple, Union
 from ..models.filesystem_edit import EditDiff, FileEdit, FileEditWithFullContents, FileSystemEdit
-from ..models.filesystem import FileSystem
 from pydantic import BaseModel, parse_file_as, validator
+from pydantic.json import pydantic_encoder
 from .llm import LLM
-from .observation import Observation, UserInputObservation
+from .llm.metrics import current_step_name
+from .observation import Observation, ParallelObservation, TextObservation, UserInputObservation
 from ..server.ide_protocol import AbstractIdeProtocolServer
 from .util.queue import AsyncSubscriptionQueue
+from .util.process import ProcessResult, run_process
+from .util.memo import MemoEntry, ReadRecordingIde, StepMemo, current_reads
+from .util.edit_buffer import ManualEditBuffer
 
 
 class ContinueBaseModel(BaseModel):
@@ -15,35 +20,160 @@ class ContinueBaseModel(BaseModel):
         underscore_attrs_are_private = True
 
 
-class HistoryNode(ContinueBaseModel):
+class HistoryNode:
     """A point in history, a list of which make up History"""
-    step: "Step"
+    __slots__ = ("_step", "observation", "depth", "parent", "size")
+    # A Step, or for nodes restored from disk, a record that is parsed into one the first time it's needed
+    _step: Any
     observation: Union[Observation, None]
     depth: int
+    # The node this is a substep of, and the number of nodes in this one's subtree (including itself).
+    # Set by History, so that a step and its substeps can be found and removed without scanning the timeline.
+    parent: Union["HistoryNode", None]
+    size: int
+
+    def __init__(self, step: Any, observation: Union[Observation, None] = None, depth: int = 0):
+        self._step = step
+        self.observation = observation
+        self.depth = depth
+        self.parent = None
+        self.size = 1
+
+    @property
+    def step(self) -> "Step":
+        if not isinstance(self._step, Step):
+            self._step = self._step.load()
+        return self._step
+
+    def dict(self) -> dict:
+        return {
+            "step": self._step.dict(),
+            "observation": None if self.observation is None else self.observation.dict(),
+            "depth": self.depth
+        }
 
 
 class History(ContinueBaseModel):
     """A history of steps taken and their results"""
-    timeline: List[HistoryNode]
     current_index: int
+    _timeline: List[HistoryNode] = []
+    # Called with (event, data) for every change, so that the history can be persisted and rebuilt
+    _listeners: List[Callable[[str, dict], None]] = []
+
+    class Config:
+        copy_on_model_validation = False
 
-    def add_node(self, node: HistoryNode):
-        self.timeline.insert(self.current_index + 1, node)
-        self.current_index += 1
+    def add_listener(self, listener: Callable[[str, dict], None]):
+        self._listeners.append(listener)
+
+    def _emit(self, event: str, **data):
+        for listener in self._listeners:
+            listener(event, data)
+
+    @property
+    def timeline(self) -> List[HistoryNode]:
+        return self._timeline
+
+    def dict(self, *args, **kwargs) -> dict:
+        return {
+            "timeline": [node.dict() for node in self._timeline],
+            "current_index": self.current_index
+        }
+
+    def _parent_at(self, index: int, depth: int) -> Union[HistoryNode, None]:
+        """The node that a node of the given depth inserted at index would be a substep of"""
+        if index == 0 or depth == 0:
+            return None
+        parent = self._timeline[index - 1]
+        while parent is not None and parent.depth >= depth:
+            parent = parent.parent
+        return parent
+
+    def add_node(self, node: HistoryNode, index: Union[int, None] = None):
+        """Insert a node, by default after the current one. It becomes current, unless it was inserted before the current node."""
+        if index is None:
+            index = self.current_index + 1
+        node.parent = self._parent_at(index, node.depth)
+        node.size = 1
+        if index == len(self._timeline):
+            self._timeline.append(node)
+        else:
+            self._timeline.insert(index, node)
+
+        ancestor = node.parent
+        while ancestor is not None:
+            ancestor.size += 1
+            ancestor = ancestor.parent
+        # Steps running in parallel insert substeps into their own subtrees, which can be before the current node
+        self.current_index = index if index > self.current_index else self.current_index + 1
+        self._emit("add", node=node, index=index)
+
+    def index_of(self, node: HistoryNode) -> int:
+        if 0 <= self.current_index < len(self._timeline) and self._timeline[self.current_index] is node:
+            return self.current_index
+        for index in range(len(self._timeline) - 1, -1, -1):
+            if self._timeline[index] is node:
+                return index
+        raise ValueError("Node is not in history")
+
+    def substep_index(self, parent: HistoryNode) -> int:
+        """The index at which the next substep of parent goes, the end of its subtree"""
+        # Substeps are usually added one after another, leaving the current node last in parent's subtree
+        node = self.get_current()
+        while node is not None and node.depth > parent.depth:
+            node = node.parent
+        next_index = self.current_index + 1
+        if node is parent and (next_index == len(self._timeline) or self._timeline[next_index].depth <= parent.depth):
+            return next_index
+        return self.index_of(parent) + parent.size
 
     def get_current(self) -> Union[HistoryNode, None]:
         if self.current_index < 0:
             return None
-        return self.timeline[self.current_index]
+        return self._timeline[self.current_index]
 
     def remove_current_and_substeps(self):
-        self.timeline.pop(self.current_index)
-        while self.get_current() is not None and self.get_current().depth > 0:
-            self.timeline.pop(self.current_index)
+        """Remove the current node and its subtree, leaving the previous node current so a replacement is added in its place"""
+        index = self.current_index
+        node = self._timeline[index]
+        removed = self._timeline[index:index + node.size]
+        del self._timeline[index:index + node.size]
+
+        ancestor = node.parent
+        while ancestor is not None:
+            ancestor.size -= node.size
+            ancestor = ancestor.parent
+        self.current_index -= 1
+        self._emit("remove", index=index, nodes=removed)
+
+    def set_observation(self, observation: Union[Observation, None], node: Union[HistoryNode, None] = None):
+        """Set the observation of a node, by default the current one"""
+        index = self.current_index if node is None else self.index_of(node)
+        self._timeline[index].observation = observation
+        self._emit("observation", observation=observation, index=index)
+
+    def show_observation(self, observation: Observation, node: HistoryNode):
+        """Show an observation on a node whose step is still running. Listeners are told so the client sees it, but
+        it's marked "live" so it isn't persisted, since the step's result will replace it."""
+        index = self.index_of(node)
+        self._timeline[index].observation = observation
+        self._emit("live_observation", observation=observation, index=index)
+
+    def set_description(self, step: "Step", description: str):
+        step._set_description(description)
+        if len(self._listeners) == 0:
+            return
+        # Steps are usually described soon after they run, so search from the end
+        for index in range(len(self._timeline) - 1, -1, -1):
+            if self._timeline[index]._step is step:
+                self._emit("description", index=index,
+                           description=description)
+                return
 
     def take_next_step(self) -> Union["Step", None]:
         if self.has_future():
             self.current_index += 1
+            self._emit("index", current_index=self.current_index)
             current_state = self.get_current()
             if current_state is None:
                 return None
@@ -54,10 +184,11 @@ class History(ContinueBaseModel):
         return self.current_index
 
     def has_future(self) -> bool:
-        return self.current_index < len(self.timeline) - 1
+        return self.current_index < len(self._timeline) - 1
 
     def step_back(self):
         self.current_index -= 1
+        self._emit("index", current_index=self.current_index)
 
     def last_observation(self) -> Union[Observation, None]:
         state = self.get_current()
@@ -67,7 +198,7 @@ class History(ContinueBaseModel):
 
     @classmethod
     def from_empty(cls):
-        return cls(timeline=[], current_index=-1)
+        return cls(current_index=-1)
 
 
 class FullState(ContinueBaseModel):
@@ -85,33 +216,67 @@ class Policy(ContinueBaseModel):
         raise NotImplementedError
 
 
+# Characters of a running command's output shown on its step
+MAX_LIVE_OUTPUT = 10000
+
+
 class ContinueSDK:
     """The SDK provided as parameters to a step"""
     llm: LLM
     ide: AbstractIdeProtocolServer
     __agent: "Agent"
+    # The history node of the step this SDK was given to, under which its substeps are added
+    __node: Union[HistoryNode, None]
 
-    def __init__(self, agent: "Agent", llm: Union[LLM, None] = None):
+    def __init__(self, agent: "Agent", llm: Union[LLM, None] = None, node: Union[HistoryNode, None] = None):
         if llm is None:
             self.llm = agent.llm
         else:
             self.llm = llm
-        self.ide = agent.ide
+        # Inside a memoized step, note which files are read so its result is only reused while they're unchanged
+        reads = current_reads.get()
+        self.ide = agent.ide if len(reads) == 0 else ReadRecordingIde(
+            agent.ide, reads)
         self.__agent = agent
+        self.__node = node
 
     @property
     def history(self) -> History:
         return self.__agent.history
 
     async def run_step(self, step: "Step") -> Coroutine[Observation, None, None]:
-        return await self.__agent._run_singular_step(step)
+        return await self.__agent._run_singular_step(step, parent=self.__node)
 
     async def apply_filesystem_edit(self, edit: FileSystemEdit):
         await self.run_step(FileSystemEditStep(edit=edit))
 
+    async def record_edit_diff(self, diff: EditDiff):
+        """Add an edit that was already applied (e.g. streamed into the IDE) to history, so it can be reversed"""
+        await self.run_step(EditDiffStep(edit_diff=diff))
+
     async def wait_for_user_input(self) -> str:
         return await self.__agent.wait_for_user_input()
 
+    def start_background_task(self, coro: Coroutine) -> asyncio.Task:
+        """Run a coroutine that may outlive the step, like a process the step doesn't wait for. It is cancelled if the agent is halted."""
+        return self.__agent._start_background_task(coro)
+
+    async def run_command(self, cmd: str, cwd: Union[str, None] = None, timeout: Union[float, None] = None,
+                          on_output: Union[Callable[[str, str], None], None] = None) -> ProcessResult:
+        """Run a command without blocking the server. Output is shown on the step while it runs and passed to on_output as it arrives, and the command is killed if the step is cancelled."""
+        output = ""
+
+        def show_output(stream: str, text: str):
+            nonlocal output
+            output = (output + text)[-MAX_LIVE_OUTPUT:]
+            if self.__node is not None:
+                self.__agent.show_observation(
+                    self.__node, TextObservation(text=output))
+            if on_output is not None:
+                on_output(stream, text)
+
+        return await run_process(cmd.split(), cwd=cwd, timeout=timeout, on_output=show_output)
+
 
 class Agent(ContinueBaseModel):
     llm: LLM
@@ -121,7 +286,9 @@ class Agent(ContinueBaseModel):
     _on_update_callbacks: List[Callable[["FullState"], None]] = []
 
     _active: bool = False
-    _should_halt: bool = False
+    # Tasks running steps for run_from_step, and tasks that steps left running. Halting cancels them all.
+    _run_tasks: Set[asyncio.Task] = set()
+    _background_tasks: Set[asyncio.Task] = set()
     _main_user_input_queue: List[str] = []
 
     _user_input_queue = AsyncSubscriptionQueue()
@@ -141,8 +308,15 @@ class Agent(ContinueBaseModel):
         for callback in self._on_update_callbacks:
             callback(full_state)
 
-    def __get_step_params(self, step: "Step"):
-        return ContinueSDK(agent=self, llm=self.llm.with_system_message(step.system_message))
+    def __get_step_params(self, step: "Step", node: Union[HistoryNode, None] = None):
+        return ContinueSDK(agent=self, llm=self.llm.with_system_message(step.system_message), node=node)
+
+    def show_observation(self, node: HistoryNode, observation: Observation):
+        """Show an observation on a step that is still running. It isn't recorded in history, since the step's result will replace it."""
+        if id(node._step) not in self._running_steps:
+            return
+        self.history.show_observation(observation, node)
+        self.update_subscribers()
 
     def give_user_input(self, input: str, index: int):
         self._user_input_queue.post(index, input)
@@ -154,13 +328,21 @@ class Agent(ContinueBaseModel):
         self._active = True
         self.update_subscribers()
 
-    _manual_edits_buffer: List[FileEditWithFullContents] = []
+    _manual_edits: ManualEditBuffer = ManualEditBuffer()
+
+    # Results of steps with memoize set, reused when they run again on unchanged files
+    _memo: StepMemo = StepMemo()
+
+    # Background tasks generating step descriptions, by id of the step
+    _description_tasks: Dict[int, asyncio.Task] = {}
 
     async def reverse_to_index(self, index: int):
         try:
             while self.history.get_current_index() >= index:
                 current_step = self.history.get_current().step
                 self.history.step_back()
+                if (description_task := self._description_tasks.pop(id(current_step), None)) is not None:
+                    description_task.cancel()
                 if issubclass(current_step.__class__, ReversibleStep):
                     await current_step.reverse(self.__get_step_params(current_step))
 
@@ -168,54 +350,145 @@ class Agent(ContinueBaseModel):
         except Exception as e:
             print(e)
 
-    def handle_manual_edits(self, edits: List[FileEditWithFullContents]):
+    def handle_manual_edits(self, edits: List[FileEditWithFullContents], previous_contents: Union[Dict[str, str], None] = None):
+        """Buffer edits made by the user, given the contents of the files before them where known"""
+        # Edits reported together all come with the contents after the last of them, so only the first to each file is compared with the contents before
+        seen = set()
         for edit in edits:
-            self._manual_edits_buffer.append(edit)
-            # TODO: You're storing a lot of unecessary data here. Can compress into EditDiffs on the spot, and merge.
-            # self._manual_edits_buffer = merge_file_edit(self._manual_edits_buffer, edit)
+            filepath = edit.fileEdit.filepath
+            self._manual_edits.add(edit, None if previous_contents is None or filepath in seen else previous_contents.get(
+                filepath))
+            seen.add(filepath)
 
     def handle_traceback(self, traceback: str):
         raise NotImplementedError
 
-    _step_depth: int = 0
+    # Ids of the steps that have started and not yet returned
+    _running_steps: Set[int] = set()
+
+    async def _describe_step(self, step: "Step"):
+        try:
+            self.history.set_description(step, await step.describe(self.llm))
+            self.update_subscribers()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error while describing step {step.name}: {e}")
+        finally:
+            self._description_tasks.pop(id(step), None)
 
-    async def _run_singular_step(self, step: "Step", is_future_step: bool = False) -> Coroutine[Observation, None, None]:
+    async def _run_singular_step(self, step: "Step", is_future_step: bool = False, parent: Union[HistoryNode, None] = None) -> Coroutine[Observation, None, None]:
+        """Run a step, adding it to history after the current node, or as the last substep of parent"""
         if not is_future_step:
             # Check manual edits buffer, clear out if needed by creating a ManualEditStep
-            if len(self._manual_edits_buffer) > 0:
-                manualEditsStep = ManualEditStep.from_sequence(
-                    self._manual_edits_buffer)
-                self._manual_edits_buffer = []
-                await self._run_singular_step(manualEditsStep)
+            if (manual_edit_diff := self._manual_edits.flush()) is not None:
+                await self._run_singular_step(ManualEditStep(edit_diff=manual_edit_diff), parent=parent)
 
         # Update history - do this first so we get top-first tree ordering
-        self.history.add_node(HistoryNode(
-            step=step, observation=None, depth=self._step_depth))
+        node = HistoryNode(step=step, observation=None,
+                           depth=0 if parent is None else parent.depth + 1)
+        self.history.add_node(
+            node, None if parent is None else self.history.substep_index(parent))
+
+        # Attribute LLM calls made while running and describing the step to it
+        step_name_token = current_step_name.set(step.__class__.__name__)
 
         # Run step
-        self._step_depth += 1
-        observation = await step(self.__get_step_params(step))
-        self._step_depth -= 1
+        self._running_steps.add(id(step))
+        memo_entry = None
+        try:
+            if step.memoize:
+                memo_key = step._memo_key()
+                # Inside another memoized step, the files read to check the result are ones that step depends on too
+                reads = current_reads.get()
+                memo_entry = await self._memo.lookup(
+                    memo_key, self.ide if len(reads) == 0 else ReadRecordingIde(self.ide, reads))
+                if memo_entry is not None:
+                    observation = await self._replay_memoized(step, node, memo_entry)
+                else:
+                    observation = await self._run_memoized(step, node, memo_key)
+            else:
+                observation = await step(self.__get_step_params(step, node))
+        except BaseException:
+            current_step_name.reset(step_name_token)
+            raise
+        finally:
+            self._running_steps.discard(id(step))
 
         # Add observation to history
-        self.history.get_current().observation = observation
+        self.history.set_observation(observation, node)
 
-        # Update its description
-        step._set_description(await step.describe(self.llm))
+        if memo_entry is not None and memo_entry.step._description is not None:
+            self.history.set_description(step, memo_entry.step._description)
+        else:
+            # Update its description in the background, so the next step doesn't wait on it. Until then, the step's name is shown.
+            self._description_tasks[id(step)] = asyncio.create_task(
+                self._describe_step(step))
+        current_step_name.reset(step_name_token)
 
         # Call all subscribed callbacks
         self.update_subscribers()
 
         return observation
 
+    async def _run_memoized(self, step: "Step", node: HistoryNode, memo_key: str) -> Union[Observation, None]:
+        reads = {}
+        reads_token = current_reads.set(current_reads.get() + (reads,))
+        try:
+            observation = await step(self.__get_step_params(step, node))
+        finally:
+            current_reads.reset(reads_token)
+
+        # The edits are found in the substeps that make steps reversible
+        edits = []
+        index = self.history.index_of(node)
+        for substep_node in self.history.timeline[index + 1:index + node.size]:
+            substep = substep_node.step
+            if isinstance(substep, FileSystemEditStep) and substep._diff is not None:
+                edits.append(substep._diff.forward)
+            elif isinstance(substep, EditDiffStep):
+                edits.append(substep.edit_diff.forward)
+        self._memo.record(memo_key, MemoEntry(
+            reads, observation, edits, step))
+        return observation
+
+    async def _replay_memoized(self, step: "Step", node: HistoryNode, memo_entry: MemoEntry) -> Union[Observation, None]:
+        sdk = self.__get_step_params(step, node)
+        for edit in memo_entry.edits:
+            await sdk.apply_filesystem_edit(edit)
+        return memo_entry.observation
+
+    def _start_background_task(self, coro: Coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
     async def run_from_step(self, step: "Step"):
         # if self._active:
         #     raise RuntimeError("Agent is already running")
         self._active = True
 
+        # Steps run in their own task, so that halting can cancel them without cancelling the caller
+        task = asyncio.create_task(self._run_steps(step))
+        self._run_tasks.add(task)
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            self._run_tasks.discard(task)
+            self._active = len(self._run_tasks) > 0
+
+        # Doing this so active can make it to the frontend after steps are done. But want better state syncing tools
+        for callback in self._on_update_callbacks:
+            callback(None)
+
+    async def _run_steps(self, step: "Step"):
         next_step = step
         is_future_step = False
-        while not (next_step is None or self._should_halt):
+        while next_step is not None:
             try:
                 if is_future_step:
                     # If future step, then we are replaying and need to delete the step from history so it can be replaced
@@ -234,12 +507,6 @@ class Agent(ContinueBaseModel):
                     f"Error while running step: \n{''.join(traceback.format_tb(e.__traceback__))}\n{e}")
                 next_step = None
 
-        self._active = False
-
-        # Doing this so active can make it to the frontend after steps are done. But want better state syncing tools
-        for callback in self._on_update_callbacks:
-            callback(None)
-
     async def run_from_observation(self, observation: Observation):
         next_step = self.policy.next(self.history)
         await self.run_from_step(next_step)
@@ -249,12 +516,14 @@ class Agent(ContinueBaseModel):
         await self.run_from_step(first_step)
 
     async def _request_halt(self):
-        if self._active:
-            self._should_halt = True
-            while self._active:
-                time.sleep(0.1)
-        self._should_halt = False
-        return None
+        """Cancel the running steps and everything they started, and wait for them to clean up.
+        In-flight LLM requests are closed and child processes are killed as the cancellation unwinds through them."""
+        tasks = [task for task in [*self._run_tasks, *self._background_tasks]
+                 if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        if len(tasks) > 0:
+            await asyncio.wait(tasks)
 
     async def accept_user_input(self, user_input: str):
         self._main_user_input_queue.append(user_input)
@@ -287,6 +556,11 @@ class Step(ContinueBaseModel):
 
     system_message: Union[str, None] = None
 
+    # Whether to reuse the step's result when it runs again with the same fields and the files it read through sdk.ide
+    # are unchanged, rather than running it. Only for steps whose effects are all edits applied with
+    # sdk.apply_filesystem_edit or recorded with sdk.record_edit_diff, since those are what is replayed.
+    memoize: ClassVar[bool] = False
+
     class Config:
         copy_on_model_validation = False
 
@@ -298,6 +572,12 @@ class Step(ContinueBaseModel):
     def _set_description(self, description: str):
         self._description = description
 
+    def _memo_key(self) -> str:
+        # Not self.dict(), which includes the description generated after the step runs
+        fields = json.dumps(super().dict(), sort_keys=True,
+                            default=pydantic_encoder)
+        return f"{self.__class__.__module__}.{self.__class__.__qualname__}:{fields}"
+
     def dict(self, *args, **kwargs):
         d = super().dict(*args, **kwargs)
         if self._description is not None:
@@ -321,7 +601,7 @@ class Step(ContinueBaseModel):
     def __rshift__(self, other: "Step"):
         steps = []
         if isinstance(self, SequentialStep):
-            steps = self.steps
+            steps = list(self.steps)
         else:
             steps.append(self)
         if isinstance(other, SequentialStep):
@@ -330,6 +610,18 @@ class Step(ContinueBaseModel):
             steps.append(other)
         return SequentialStep(steps=steps)
 
+    def __and__(self, other: "Step"):
+        steps = []
+        if isinstance(self, ParallelStep):
+            steps = list(self.steps)
+        else:
+            steps.append(self)
+        if isinstance(other, ParallelStep):
+            steps += other.steps
+        else:
+            steps.append(other)
+        return ParallelStep(steps=steps)
+
 
 class SequentialStep(Step):
     steps: list[Step]
@@ -341,6 +633,31 @@ class SequentialStep(Step):
         return observation
 
 
+class ParallelStep(Step):
+    """Runs independent steps at the same time. They are added to history as substeps, in the order they start."""
+    steps: list[Step]
+    # Most steps run at once
+    max_concurrency: int = 4
+    hide: bool = True
+
+    async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_step(step: Step) -> Union[Observation, None]:
+            async with semaphore:
+                return await sdk.run_step(step)
+
+        tasks = [asyncio.create_task(run_step(step)) for step in self.steps]
+        try:
+            observations = await asyncio.gather(*tasks)
+        except BaseException:
+            # If one step fails, or this one is cancelled, stop the rest
+            for task in tasks:
+                task.cancel()
+            raise
+        return ParallelObservation.merge(observations)
+
+
 class ReversibleStep(Step):
     async def reverse(self, sdk: ContinueSDK):
         raise NotImplementedError
@@ -361,6 +678,17 @@ class FileSystemEditStep(ReversibleStep):
         # Where and when should file saves happen?
 
 
+class EditDiffStep(ReversibleStep):
+    edit_diff: EditDiff
+    hide: bool = True
+
+    async def run(self, sdk: "ContinueSDK") -> Coroutine[Observation, None, None]:
+        return None
+
+    async def reverse(self, sdk: "ContinueSDK"):
+        await sdk.ide.applyFileSystemEdit(self.edit_diff.backward)
+
+
 class ManualEditStep(ReversibleStep):
     edit_diff: EditDiff
     hide: bool = True
@@ -382,15 +710,6 @@ class ManualEditStep(ReversibleStep):
         #     Maximally concise summary of changes in bullet points (can use markdown):
         # """))
 
-    @classmethod
-    def from_sequence(cls, edits: List[FileEditWithFullContents]) -> "ManualEditStep":
-        diffs = []
-        for edit in edits:
-            _, diff = FileSystem.apply_edit_to_str(
-                edit.fileContents, edit.fileEdit)
-            diffs.append(diff)
-        return cls(edit_diff=EditDiff.from_sequence(diffs))
-
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
         return None
 
@@ -420,4 +739,3 @@ class Validator(Step):
         raise NotImplementedError
 
 
-HistoryNode.update_forward_refs()
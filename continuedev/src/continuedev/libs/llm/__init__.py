@@ -1,15 +1,41 @@
-from typing import Union
+from typing import Any, AsyncGenerator, Dict, List, Union
 from ...models.main import AbstractModel
+from .utils import DEFAULT_CONTEXT_LENGTH
+from .metrics import MetricsCollector
 from pydantic import BaseModel
 
 
 class LLM(BaseModel):
     system_message: Union[str, None] = None
+    # Name of the model, which decides how tokens are counted
+    default_model: Union[str, None] = None
+    # If set, every call is recorded here
+    metrics: Union[MetricsCollector, None] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def context_length(self) -> int:
+        """Number of tokens the prompt and completion together may use"""
+        return DEFAULT_CONTEXT_LENGTH
 
     def complete(self, prompt: str, **kwargs):
         """Return the completion of the text with the given temperature."""
         raise
 
+    async def acomplete(self, prompt: str, **kwargs) -> str:
+        """Return the completion of the text without blocking the event loop."""
+        raise NotImplementedError
+
+    def astream_complete(self, prompt: str, **kwargs) -> AsyncGenerator[str, None]:
+        """Yield the completion of the text as it is generated."""
+        raise NotImplementedError
+
+    def astream_chat(self, messages: List[Dict[str, str]], **kwargs) -> AsyncGenerator[Union[Any, List, Dict], None]:
+        """Yield the response to the chat messages as it is generated."""
+        raise NotImplementedError
+
     def __call__(self, prompt: str, **kwargs):
         return self.complete(prompt, **kwargs)
 
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Union
+from pydantic import root_validator
+from ..llm import LLM
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".continue", "completion_cache.db")
+
+# Hits whose access times are held in memory before they're written, so a hit doesn't wait for a commit
+MAX_PENDING_ACCESSES = 100
+# Seconds to wait for another worker process to finish writing to the cache before giving up
+BUSY_TIMEOUT = 5
+
+
+class CompletionCache:
+    """An on-disk store of completions keyed by a hash of everything that determines them, with LRU and TTL eviction"""
+    path: str
+    max_entries: int
+    ttl: Union[float, None]
+    hits: int = 0
+    misses: int = 0
+    # Access times of hits not yet written to the database, by key
+    _pending_accesses: Dict[str, float]
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10000, ttl: Union[float, None] = 7 * 24 * 60 * 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._pending_accesses = {}
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        if path != ":memory:":
+            # Every worker process shares the file. With a write-ahead log, readers don't block the writer or each other.
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS completions (
+            key TEXT PRIMARY KEY,
+            completion TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_accessed REAL NOT NULL
+        )""")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS completions_last_accessed ON completions (last_accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, system_message: Union[str, None], prompt: str, **kwargs) -> str:
+        """Hash of the model, system message, prompt, and sampling args (including suffix)"""
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        payload = json.dumps({
+            "model": model,
+            "system_message": system_message,
+            "prompt": prompt,
+            "kwargs": kwargs
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Union[str, None]:
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT completion, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        completion, created_at = row
+        if self.ttl is not None and now - created_at > self.ttl:
+            self._try_write(lambda: self._conn.execute(
+                "DELETE FROM completions WHERE key = ?", (key,)))
+            self.misses += 1
+            return None
+
+        self._pending_accesses[key] = now
+        if len(self._pending_accesses) >= MAX_PENDING_ACCESSES:
+            self._try_write(self._write_accesses)
+        self.hits += 1
+        return completion
+
+    def _try_write(self, write: Callable[[], Any]):
+        """Make and commit a write. If other processes keep the database locked for longer than BUSY_TIMEOUT, the
+        write is skipped, since it's only a cache, rather than failing the LLM call."""
+        try:
+            write()
+            self._conn.commit()
+        except sqlite3.OperationalError as e:
+            self._conn.rollback()
+            print("Skipped writing to the completion cache:", e)
+
+    def _write_accesses(self):
+        """Write the access times of recent hits, which eviction orders by. Left to the caller to commit."""
+        if len(self._pending_accesses) == 0:
+            return
+        self._conn.executemany("UPDATE completions SET last_accessed = ? WHERE key = ?",
+                               [(accessed, key) for key, accessed in self._pending_accesses.items()])
+        self._pending_accesses = {}
+
+    def put(self, key: str, completion: str):
+        now = time.time()
+        self._pending_accesses.pop(key, None)
+
+        def write():
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, completion, created_at, last_accessed) VALUES (?, ?, ?, ?)",
+                (key, completion, now, now))
+            self._write_accesses()
+            self._evict()
+        self._try_write(write)
+
+    def _evict(self):
+        if self.ttl is not None:
+            self._conn.execute(
+                "DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl,))
+        count = self._conn.execute(
+            "SELECT COUNT(*) FROM completions").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY last_accessed ASC LIMIT ?)",
+                (count - self.max_entries,))
+
+    def flush(self):
+        """Write the access times of recent hits"""
+        self._try_write(self._write_accesses)
+
+    def clear(self):
+        self._pending_accesses = {}
+        self._conn.execute("DELETE FROM completions")
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        }
+
+
+class CachedLLM(LLM):
+    """Wraps any LLM so that repeated calls with identical inputs are served from a CompletionCache"""
+    llm: LLM
+    cache: CompletionCache
+    # Completions sampled with temperature > 0 are only reused if this is set. Otherwise retrying a call would give
+    # back the same completion, so only calls made with temperature=0 are cached.
+    cache_nondeterministic: bool = False
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @root_validator(skip_on_failure=True)
+    def use_wrapped_model(cls, values):
+        if values.get("default_model") is None:
+            values["default_model"] = values["llm"].default_model
+        return values
+
+    def with_system_message(self, system_message: Union[str, None]):
+        return CachedLLM(llm=self.llm.with_system_message(system_message), cache=self.cache,
+                         system_message=system_message, cache_nondeterministic=self.cache_nondeterministic)
+
+    @property
+    def context_length(self) -> int:
+        return self.llm.context_length
+
+    def _key(self, prompt: str, **kwargs) -> Union[str, None]:
+        if not self.cache_nondeterministic and kwargs.get("temperature") != 0:
+            return None
+        model = kwargs.pop(
+            "model", self.llm.default_model or self.llm.__class__.__name__)
+        return CompletionCache.key(model, self.llm.system_message, prompt, **kwargs)
+
+    def complete(self, prompt: str, **kwargs) -> str:
+        key = self._key(prompt, **kwargs)
+        if key is not None and (cached := self.cache.get(key)) is not None:
+            return cached
+
+        completion = self.llm.complete(prompt, **kwargs)
+        if key is not None:
+            self.cache.put(key, completion)
+        return completion
+
+    async def acomplete(self, prompt: str, **kwargs) -> str:
+        key = self._key(prompt, **kwargs)
+        if key is not None and (cached := self.cache.get(key)) is not None:
+            return cached
+
+        completion = await self.llm.acomplete(prompt, **kwargs)
+        if key is not None:
+            self.cache.put(key, completion)
+        return completion
+
+    async def astream_complete(self, prompt: str, **kwargs) -> AsyncGenerator[str, None]:
+        key = self._key(prompt, **kwargs)
+        if key is not None and (cached := self.cache.get(key)) is not None:
+            yield cached
+            return
+
+        chunks = []
+        async for chunk in self.llm.astream_complete(prompt, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        if key is not None:
+            self.cache.put(key, "".join(chunks))
+
+    def astream_chat(self, messages: List[Dict[str, str]], **kwargs) -> AsyncGenerator[Union[Any, List, Dict], None]:
+        return self.llm.astream_chat(messages, **kwargs)
+
+    def edit(self, inp: str, instruction: str) -> str:
+        return self.llm.edit(inp, instruction)
+
+    async def parallel_edit(self, inputs: List[str], instructions: Union[List[str], str], **kwargs) -> List[str]:
+        return await self.llm.parallel_edit(inputs, instructions, **kwargs)
+
+    async def parallel_complete(self, prompts: List[str], suffixes: Union[List[str], None] = None, **kwargs) -> List[str]:
+        """Only sends each distinct uncached prompt once"""
+        suffixes = suffixes or [None] * len(prompts)
+        keys = [self._key(prompt, suffix=suffix, **kwargs)
+                for prompt, suffix in zip(prompts, suffixes)]
+
+        results: List[Union[str, None]] = [None] * len(prompts)
+        pending: Dict[Any, List[int]] = {}
+        for i, key in enumerate(keys):
+            if key is not None and (cached := self.cache.get(key)) is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(key if key is not None else i, []).append(i)
+
+        if len(pending) > 0:
+            indices = [group[0] for group in pending.values()]
+            completions = await self.llm.parallel_complete(
+                [prompts[i] for i in indices], suffixes=[suffixes[i] for i in indices], **kwargs)
+            for group, completion in zip(pending.values(), completions):
+                for i in group:
+                    results[i] = completion
+                if completion is not None and keys[group[0]] is not None:
+                    self.cache.put(keys[group[0]], completion)
+
+        return results
@@ -0,0 +1,78 @@
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Union
+from pydantic import BaseModel
+
+# Name of the Step class currently running, set by the Agent so LLM calls can be attributed to it
+current_step_name: ContextVar[Union[str, None]] = ContextVar(
+    "current_step_name", default=None)
+
+
+class LLMCallRecord(BaseModel):
+    """Measurements from a single call to an LLM"""
+    model: str
+    step: Union[str, None]
+    prompt_tokens: int
+    completion_tokens: int
+    time_to_first_token: Union[float, None]
+    latency: float
+    price: float
+
+
+class LLMUsage(BaseModel):
+    """Totals over many LLMCallRecords"""
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    streamed_calls: int = 0
+    total_time_to_first_token: float = 0.0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    price: float = 0.0
+
+    def add(self, record: LLMCallRecord):
+        self.calls += 1
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        if record.time_to_first_token is not None:
+            self.streamed_calls += 1
+            self.total_time_to_first_token += record.time_to_first_token
+        self.total_latency += record.latency
+        self.max_latency = max(self.max_latency, record.latency)
+        self.price += record.price
+
+    def dict(self, *args, **kwargs):
+        d = super().dict(*args, **kwargs)
+        d["mean_latency"] = self.total_latency / \
+            self.calls if self.calls > 0 else None
+        d["mean_time_to_first_token"] = self.total_time_to_first_token / \
+            self.streamed_calls if self.streamed_calls > 0 else None
+        return d
+
+
+class MetricsCollector:
+    """Aggregates LLMCallRecords for one session, in total and per Step class"""
+    total: LLMUsage
+    by_step: Dict[str, LLMUsage]
+    by_model: Dict[str, LLMUsage]
+    recent: Deque[LLMCallRecord]
+
+    def __init__(self, max_recent: int = 100):
+        self.total = LLMUsage()
+        self.by_step = {}
+        self.by_model = {}
+        self.recent = deque(maxlen=max_recent)
+
+    def record(self, record: LLMCallRecord):
+        self.total.add(record)
+        self.by_step.setdefault(record.step or "None", LLMUsage()).add(record)
+        self.by_model.setdefault(record.model, LLMUsage()).add(record)
+        self.recent.append(record)
+
+    def dict(self) -> dict:
+        return {
+            "total": self.total.dict(),
+            "by_step": {step: usage.dict() for step, usage in self.by_step.items()},
+            "by_model": {model: usage.dict() for model, usage in self.by_model.items()},
+            "recent": [record.dict() for record in self.recent]
+        }
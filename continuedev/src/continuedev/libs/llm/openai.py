@@ -1,16 +1,57 @@
 import asyncio
+import json
 import time
-from typing import Any, Dict, Generator, List, Union
+from typing import Any, AsyncGenerator, Dict, Generator, List, Union
 import openai
 import aiohttp
 from ..llm import LLM
+from .utils import CONTEXT_LENGTH_FOR_MODEL, DEFAULT_CONTEXT_LENGTH, count_tokens, get_price_for_tokens
+from .metrics import LLMCallRecord, current_step_name
+from ..util.batch import BatchExecutor
 from pydantic import BaseModel, validator
 
+OPENAI_API_BASE = "https://api.openai.com/v1"
+MAX_CONNECTIONS = 100
+KEEPALIVE_TIMEOUT = 60
+REQUEST_TIMEOUT = 300
+
+_session: Union[aiohttp.ClientSession, None] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Return the ClientSession shared by every OpenAI instance in the process, creating it on first use"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=MAX_CONNECTIONS, keepalive_timeout=KEEPALIVE_TIMEOUT),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+    return _session
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Rate limits, server errors, and dropped connections are worth retrying"""
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status == 429 or e.status >= 500
+    return isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 
 class OpenAI(LLM):
     api_key: str
     completion_count: int = 0
     default_model: str = "text-davinci-003"
+    batch_executor: BatchExecutor = BatchExecutor(
+        max_concurrency=16, is_retryable=is_retryable)
+
+    class Config:
+        arbitrary_types_allowed = True
 
     @validator("api_key", pre=True, always=True)
     def validate_api_key(cls, v):
@@ -18,7 +59,140 @@ class OpenAI(LLM):
         return v
 
     def with_system_message(self, system_message: Union[str, None]):
-        return OpenAI(api_key=self.api_key, system_message=system_message)
+        return OpenAI(api_key=self.api_key, system_message=system_message, default_model=self.default_model,
+                      batch_executor=self.batch_executor, metrics=self.metrics)
+
+    @property
+    def context_length(self) -> int:
+        return CONTEXT_LENGTH_FOR_MODEL.get(self.default_model, DEFAULT_CONTEXT_LENGTH)
+
+    @property
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer " + self.api_key
+        }
+
+    def _chat_messages(self, prompt: str) -> List[Dict[str, str]]:
+        messages = [{
+            "role": "user",
+            "content": prompt
+        }]
+        if self.system_message:
+            messages.insert(0, {
+                "role": "system",
+                "content": self.system_message
+            })
+        return messages
+
+    def _record(self, model: str, prompt: str, completion: str, t_start: float, t_first_token: Union[float, None] = None, usage: Union[Dict[str, int], None] = None):
+        """Report a finished call to the metrics collector, if there is one"""
+        if self.metrics is None:
+            return
+        if usage is not None:
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = usage.get("completion_tokens", 0)
+        else:
+            prompt_tokens = count_tokens(prompt, model)
+            completion_tokens = count_tokens(completion, model)
+        self.metrics.record(LLMCallRecord(
+            model=model,
+            step=current_step_name.get(),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            time_to_first_token=None if t_first_token is None else t_first_token - t_start,
+            latency=time.time() - t_start,
+            price=get_price_for_tokens(prompt_tokens + completion_tokens, model)
+        ))
+
+    async def _metered_stream(self, model: str, prompt: str, chunks: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        t1 = time.time()
+        t_first_token = None
+        completion = []
+        async for chunk in chunks:
+            if t_first_token is None:
+                t_first_token = time.time()
+            completion.append(chunk)
+            yield chunk
+        self._record(model, prompt, "".join(completion), t1, t_first_token)
+
+    async def _apost(self, endpoint: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        async with get_session().post(f"{OPENAI_API_BASE}/{endpoint}", headers=self._headers, json=body) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def _apost_stream(self, endpoint: str, body: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """Post a streaming request and yield each server-sent event as a dict"""
+        async with get_session().post(f"{OPENAI_API_BASE}/{endpoint}", headers=self._headers, json=body) as resp:
+            resp.raise_for_status()
+            async for line in resp.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)
+
+    async def astream_chat(self, messages, **kwargs) -> AsyncGenerator[Union[Any, List, Dict], None]:
+        self.completion_count += 1
+        args = {"max_tokens": 512, "temperature": 0.5, "top_p": 1,
+                "frequency_penalty": 0, "presence_penalty": 0} | kwargs
+        args["stream"] = True
+        args["model"] = "gpt-3.5-turbo"
+
+        async def gen():
+            async for chunk in self._apost_stream("chat/completions", {"messages": messages, **args}):
+                delta = chunk["choices"][0]["delta"]
+                if "content" in delta:
+                    yield delta["content"]
+
+        async for content in self._metered_stream(args["model"], "".join(m["content"] for m in messages), gen()):
+            yield content
+
+    async def astream_complete(self, prompt: str, **kwargs) -> AsyncGenerator[Union[Any, List, Dict], None]:
+        self.completion_count += 1
+        args = {"model": self.default_model, "max_tokens": 512, "temperature": 0.5,
+                "top_p": 1, "frequency_penalty": 0, "presence_penalty": 0, "suffix": None} | kwargs
+        args["stream"] = True
+
+        async def gen():
+            if args["model"] == "gpt-3.5-turbo":
+                del args["suffix"]
+                async for chunk in self._apost_stream("chat/completions", {"messages": self._chat_messages(prompt), **args}):
+                    delta = chunk["choices"][0]["delta"]
+                    if "content" in delta:
+                        yield delta["content"]
+            else:
+                async for chunk in self._apost_stream("completions", {"prompt": prompt, **args}):
+                    yield chunk["choices"][0]["text"]
+
+        async for content in self._metered_stream(args["model"], prompt, gen()):
+            yield content
+
+    async def acomplete(self, prompt: str, **kwargs) -> str:
+        t1 = time.time()
+
+        self.completion_count += 1
+        args = {"model": self.default_model, "max_tokens": 512, "temperature": 0.5, "top_p": 1,
+                "frequency_penalty": 0, "presence_penalty": 0, "stream": False} | kwargs
+
+        if args["model"] == "gpt-3.5-turbo":
+            args.pop("suffix", None)
+            endpoint, body = "chat/completions", {
+                "messages": self._chat_messages(prompt), **args}
+        else:
+            endpoint, body = "completions", {"prompt": prompt, **args}
+
+        json = await self._apost(endpoint, body)
+        choice = json["choices"][0]
+        if args["model"] == "gpt-3.5-turbo":
+            resp = choice["message"]["content"]
+        else:
+            resp = choice["text"]
+
+        self._record(args["model"], prompt, resp, t1, usage=json.get("usage"))
+        return resp
 
     def stream_chat(self, messages, **kwargs) -> Generator[Union[Any, List, Dict], None, None]:
         self.completion_count += 1
@@ -68,27 +242,20 @@ class OpenAI(LLM):
                 "frequency_penalty": 0, "presence_penalty": 0, "stream": False} | kwargs
 
         if args["model"] == "gpt-3.5-turbo":
-            messages = [{
-                "role": "user",
-                "content": prompt
-            }]
-            if self.system_message:
-                messages.insert(0, {
-                    "role": "system",
-                    "content": self.system_message
-                })
-            resp = openai.ChatCompletion.create(
-                messages=messages,
+            completion = openai.ChatCompletion.create(
+                messages=self._chat_messages(prompt),
                 **args,
-            ).choices[0].message.content
+            )
+            resp = completion.choices[0].message.content
         else:
-            resp = openai.Completion.create(
+            completion = openai.Completion.create(
                 prompt=prompt,
                 **args,
-            ).choices[0].text
+            )
+            resp = completion.choices[0].text
 
-        t2 = time.time()
-        print("Completion time:", t2 - t1)
+        self._record(args["model"], prompt, resp, t1,
+                     usage=completion.get("usage"))
         return resp
 
     def edit(self, inp: str, instruction: str) -> str:
@@ -103,57 +270,43 @@ class OpenAI(LLM):
             print("OpenAI error:", e)
             raise e
 
-    def parallel_edit(self, inputs: list[str], instructions: Union[List[str], str], **kwargs) -> list[str]:
+    async def parallel_edit(self, inputs: list[str], instructions: Union[List[str], str], **kwargs) -> list[str]:
+        """Raises PartialBatchError if some edits fail after retries"""
         args = {"temperature": 0.5, "top_p": 1} | kwargs
         args['model'] = 'text-davinci-edit-001'
 
-        async def fn():
-            async with aiohttp.ClientSession() as session:
-                tasks = []
-
-                async def get(input, instruction):
-                    async with session.post("https://api.openai.com/v1/edits", headers={
-                        "Content-Type": "application/json",
-                        "Authorization": "Bearer " + self.api_key
-                    }, json={"model": args["model"], "input": input, "instruction": instruction, "temperature": args["temperature"], "max_tokens": args["max_tokens"], "suffix": args["suffix"]}) as resp:
-                        json = await resp.json()
-                        if "error" in json:
-                            print("ERROR IN GPT-3 RESPONSE: ", json)
-                            return None
-                        return json["choices"][0]["text"]
-
-                for i in range(len(inputs)):
-                    tasks.append(get(inputs[i], instructions[i] if isinstance(
-                        instructions, list) else instructions))
-
-                return await asyncio.gather(*tasks)
+        async def get(i: int) -> str:
+            t1 = time.time()
+            json = await self._apost("edits", {
+                "model": args["model"],
+                "input": inputs[i],
+                "instruction": instructions[i] if isinstance(instructions, list) else instructions,
+                "temperature": args["temperature"],
+                "top_p": args["top_p"]
+            })
+            resp = json["choices"][0]["text"]
+            self._record(args["model"], inputs[i], resp,
+                         t1, usage=json.get("usage"))
+            return resp
 
-        return asyncio.run(fn())
+        return await self.batch_executor.run(get, list(range(len(inputs))))
 
-    def parallel_complete(self, prompts: list[str], suffixes: Union[list[str], None] = None, **kwargs) -> list[str]:
+    async def parallel_complete(self, prompts: list[str], suffixes: Union[list[str], None] = None, **kwargs) -> list[str]:
+        """Raises PartialBatchError if some completions fail after retries"""
         self.completion_count += len(prompts)
         args = {"model": self.default_model, "max_tokens": 512, "temperature": 0.5,
                 "top_p": 1, "frequency_penalty": 0, "presence_penalty": 0} | kwargs
 
-        async def fn():
-            async with aiohttp.ClientSession() as session:
-                tasks = []
-
-                async def get(prompt, suffix):
-                    async with session.post("https://api.openai.com/v1/completions", headers={
-                        "Content-Type": "application/json",
-                        "Authorization": "Bearer " + self.api_key
-                    }, json={"model": args["model"], "prompt": prompt, "temperature": args["temperature"], "max_tokens": args["max_tokens"], "suffix": suffix}) as resp:
-                        json = await resp.json()
-                        if "error" in json:
-                            print("ERROR IN GPT-3 RESPONSE: ", json)
-                            return None
-                        return json["choices"][0]["text"]
-
-                for i in range(len(prompts)):
-                    tasks.append(asyncio.ensure_future(
-                        get(prompts[i], suffixes[i] if suffixes else None)))
-
-                return await asyncio.gather(*tasks)
+        async def get(i: int) -> str:
+            t1 = time.time()
+            json = await self._apost("completions", {
+                "prompt": prompts[i],
+                "suffix": suffixes[i] if suffixes else None,
+                **args
+            })
+            resp = json["choices"][0]["text"]
+            self._record(args["model"], prompts[i], resp,
+                         t1, usage=json.get("usage"))
+            return resp
 
-        return asyncio.run(fn())
+        return await self.batch_executor.run(get, list(range(len(prompts))))
@@ -1,6 +1,8 @@
 from typing import Dict, List, Union
+from ...models.main import Position, Range
 from ...models.filesystem import RangeInFileWithContents
-from ...models.filesystem_edit import FileEdit
+from ...models.filesystem_edit import EditDiff, FileEdit
+from .utils import count_tokens_batch
 
 
 class MarkdownStyleEncoderDecoder:
@@ -10,9 +12,13 @@ class MarkdownStyleEncoderDecoder:
     def __init__(self, range_in_files: List[RangeInFileWithContents]):
         self.range_in_files = range_in_files
 
+    @staticmethod
+    def encode_one(rif: RangeInFileWithContents) -> str:
+        return f"File ({rif.filepath})\n```\n{rif.contents}\n```"
+
     def encode(self) -> str:
         return "\n\n".join([
-            f"File ({rif.filepath})\n```\n{rif.contents}\n```"
+            self.encode_one(rif)
             for rif in self.range_in_files
         ])
 
@@ -69,3 +75,257 @@ class MarkdownStyleEncoderDecoder:
         suggestions = self._decode_to_suggestions(completion)
         file_edits = self._suggestions_to_file_edits(suggestions)
         return file_edits
+
+
+class MarkdownStyleStreamDecoder:
+    """Incrementally decodes a streamed completion in the MarkdownStyleEncoderDecoder format into FileEdits.
+
+    Each completed line is inserted just before the original range, and once a file's block is closed the
+    original range is deleted, so the IDE can show the new code as it arrives. If the completion stops before the
+    block is closed, the inserted lines are removed again and the original is left as it was. Ranges are end-inclusive."""
+    range_in_files: List[RangeInFileWithContents]
+
+    def __init__(self, range_in_files: List[RangeInFileWithContents]):
+        self.range_in_files = range_in_files
+        self._buffer = ""
+        self._state = "start"
+        self._current: Union[RangeInFileWithContents, None] = None
+        # Lines written so far for each file, in the order the files were started
+        self._written: Dict[str, List[str]] = {}
+        self._finished: List[str] = []
+
+    def _rif_for(self, filepath: str) -> Union[RangeInFileWithContents, None]:
+        if filepath in self._written:
+            return None
+        matching_rifs = [
+            rif for rif in self.range_in_files if rif.filepath == filepath]
+        return matching_rifs[0] if len(matching_rifs) > 0 else None
+
+    def _start_file(self, rif: Union[RangeInFileWithContents, None]):
+        self._current = rif
+        if rif is not None:
+            self._written[rif.filepath] = []
+
+    def _insert_line(self, line: str) -> List[FileEdit]:
+        if self._current is None:
+            return []
+        rif = self._current
+        lines = self._written[rif.filepath]
+        position = Position(line=rif.range.start.line + len(lines),
+                            character=rif.range.start.character if len(lines) == 0 else 0)
+        lines.append(line)
+        return [FileEdit(
+            filepath=rif.filepath,
+            range=Range(start=position, end=Position(
+                line=position.line, character=position.character - 1)),
+            replacement=line + "\n"
+        )]
+
+    def _end_of_suggestion(self, rif: RangeInFileWithContents, lines: List[str]) -> Position:
+        """Last character (inclusive) of the suggestion once it has replaced the original range"""
+        if len(lines) == 0:
+            return Position(line=rif.range.start.line, character=rif.range.start.character - 1)
+        return Position(line=rif.range.start.line + len(lines) - 1,
+                        character=(rif.range.start.character if len(lines) == 1 else 0) + len(lines[-1]) - 1)
+
+    def _finish_file(self) -> List[FileEdit]:
+        """Delete the original range, along with the newline after the last inserted line"""
+        rif = self._current
+        self._current = None
+        if rif is None:
+            return []
+        self._finished.append(rif.filepath)
+
+        lines = self._written[rif.filepath]
+        n = len(lines)
+        if n == 0:
+            return [FileEdit(filepath=rif.filepath, range=rif.range, replacement="")]
+
+        start = self._end_of_suggestion(rif, lines)
+        start = Position(line=start.line, character=start.character + 1)
+        if rif.range.end.line == rif.range.start.line:
+            end = Position(line=rif.range.start.line + n,
+                           character=rif.range.end.character - rif.range.start.character)
+        else:
+            end = Position(line=rif.range.end.line + n,
+                           character=rif.range.end.character)
+        return [FileEdit(filepath=rif.filepath, range=Range(start=start, end=end), replacement="")]
+
+    def _undo_file(self) -> List[FileEdit]:
+        """Remove the lines inserted into the current file, leaving the original range untouched"""
+        rif = self._current
+        self._current = None
+        if rif is None:
+            return []
+        lines = self._written.pop(rif.filepath)
+        if len(lines) == 0:
+            return []
+        # Up to and including the newline after the last inserted line
+        return [FileEdit(filepath=rif.filepath, range=Range(start=rif.range.start, end=Position(
+            line=rif.range.start.line + len(lines), character=-1)), replacement="")]
+
+    def _handle_line(self, line: str) -> List[FileEdit]:
+        if self._state == "start" or self._state == "between":
+            if line.strip().startswith("File ("):
+                self._start_file(self._rif_for(line.strip()[6:-1]))
+                self._state = "header"
+            elif self._state == "start" and line.startswith("```"):
+                self._start_file(self._rif_for(
+                    self.range_in_files[0].filepath))
+                self._state = "inside"
+            elif self._state == "start" and line.strip() != "":
+                # No file header or fence, so the whole completion is code for the first file
+                self._start_file(self._rif_for(
+                    self.range_in_files[0].filepath))
+                self._state = "unfenced"
+                return self._insert_line(line)
+        elif self._state == "header":
+            if line.startswith("```"):
+                self._state = "inside"
+        elif self._state in ("inside", "unfenced"):
+            if line.startswith("```"):
+                self._state = "between"
+                return self._finish_file()
+            return self._insert_line(line)
+        return []
+
+    def feed(self, chunk: str) -> List[FileEdit]:
+        """Consume a chunk of the completion, returning the edits for any lines it completed"""
+        if len(self.range_in_files) == 0:
+            return []
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        file_edits = []
+        for line in lines:
+            file_edits += self._handle_line(line)
+        return file_edits
+
+    def close(self) -> List[FileEdit]:
+        """Call once the completion is done, returning the remaining edits"""
+        if len(self.range_in_files) == 0:
+            return []
+        file_edits = []
+        if self._buffer != "":
+            file_edits += self._handle_line(self._buffer)
+            self._buffer = ""
+        if self._state == "inside":
+            # The block was never closed, e.g. because the completion hit max_tokens, so the suggestion is incomplete
+            file_edits += self._undo_file()
+        else:
+            # A completion without a fence is all code, as in MarkdownStyleEncoderDecoder
+            file_edits += self._finish_file()
+        return file_edits
+
+    def abort(self) -> List[FileEdit]:
+        """Call if the completion fails or is cancelled, returning the edits that undo the unfinished file"""
+        self._buffer = ""
+        return self._undo_file()
+
+    def edit_diffs(self) -> List[EditDiff]:
+        """The net change made to each file, as if the whole suggestion had been applied in one edit"""
+        diffs = []
+        for filepath in self._finished:
+            rif = [rif for rif in self.range_in_files if rif.filepath == filepath][0]
+            lines = self._written[filepath]
+            diffs.append(EditDiff(
+                forward=FileEdit(filepath=filepath, range=rif.range,
+                                 replacement="\n".join(lines)),
+                backward=FileEdit(filepath=filepath, range=Range(
+                    start=rif.range.start, end=self._end_of_suggestion(rif, lines)), replacement=rif.contents)
+            ))
+        return diffs
+
+
+class ContextPacker:
+    """Fits a set of RangeInFileWithContents into a model's context window, leaving room for a completion about as long as the code"""
+    context_length: int
+    # Model whose tokenizer counts the tokens
+    model: Union[str, None]
+    completion_ratio: float
+    min_completion_tokens: int
+
+    def __init__(self, context_length: int, model: Union[str, None] = None, completion_ratio: float = 1.2, min_completion_tokens: int = 256):
+        self.context_length = context_length
+        self.model = model
+        self.completion_ratio = completion_ratio
+        self.min_completion_tokens = min_completion_tokens
+
+    def code_budget(self, template_tokens: int) -> int:
+        """Tokens available for code, given the tokens in the rest of the prompt"""
+        return max(0, int((self.context_length - template_tokens - self.min_completion_tokens) / (1 + self.completion_ratio)))
+
+    def completion_budget(self, prompt_tokens: int) -> int:
+        """max_tokens for a completion of a prompt containing (mostly) code"""
+        return max(0, min(self.context_length - prompt_tokens,
+                          int(prompt_tokens * self.completion_ratio) + self.min_completion_tokens))
+
+    def _trim(self, rif: RangeInFileWithContents, budget: int, focus_line: Union[int, None]) -> Union[RangeInFileWithContents, None]:
+        """Shrink to the largest window of whole lines around focus_line (a line in the file) that fits in budget"""
+        lines = rif.contents.splitlines()
+        if len(lines) == 0:
+            return rif
+        counts = count_tokens_batch(
+            [line + "\n" for line in lines], self.model)
+        if sum(counts) <= budget:
+            return rif
+
+        if focus_line is None:
+            focus = len(lines) // 2
+        else:
+            focus = min(max(focus_line - rif.range.start.line, 0), len(lines) - 1)
+        if counts[focus] > budget:
+            return None
+
+        lo = hi = focus
+        total = counts[focus]
+        grew = True
+        while grew:
+            grew = False
+            if hi + 1 < len(lines) and total + counts[hi + 1] <= budget:
+                hi += 1
+                total += counts[hi]
+                grew = True
+            if lo - 1 >= 0 and total + counts[lo - 1] <= budget:
+                lo -= 1
+                total += counts[lo]
+                grew = True
+
+        # Ranges are end-inclusive, and the first line of the range may not start at character 0
+        start = rif.range.start if lo == 0 else Position(
+            line=rif.range.start.line + lo, character=0)
+        end = rif.range.end if hi == len(lines) - 1 else Position(
+            line=rif.range.start.line + hi,
+            character=(rif.range.start.character if hi == 0 else 0) + len(lines[hi]) - 1)
+        return RangeInFileWithContents(
+            filepath=rif.filepath,
+            range=Range(start=start, end=end),
+            contents="\n".join(lines[lo:hi + 1])
+        )
+
+    def pack(self, range_in_files: List[RangeInFileWithContents], budget: int, focus_lines: Union[List[Union[int, None]], None] = None) -> List[RangeInFileWithContents]:
+        """Trim range_in_files so that together they encode to at most budget tokens. Ranges that can't fit at all are dropped."""
+        if focus_lines is None:
+            focus_lines = [None] * len(range_in_files)
+
+        overheads = count_tokens_batch([MarkdownStyleEncoderDecoder.encode_one(
+            RangeInFileWithContents(filepath=rif.filepath, range=rif.range, contents="")) for rif in range_in_files], self.model)
+        sizes = count_tokens_batch(
+            [rif.contents for rif in range_in_files], self.model)
+        if sum(sizes) + sum(overheads) <= budget:
+            return range_in_files
+
+        # Ranges smaller than an even share of what's left are kept whole, the rest split the remainder
+        remaining = budget - sum(overheads)
+        shares = [0] * len(range_in_files)
+        order = sorted(range(len(range_in_files)), key=lambda i: sizes[i])
+        for k, i in enumerate(order):
+            shares[i] = min(sizes[i], max(0, remaining) //
+                            (len(range_in_files) - k))
+            remaining -= shares[i]
+
+        packed = []
+        for rif, share, focus_line in zip(range_in_files, shares, focus_lines):
+            trimmed = self._trim(rif, share, focus_line)
+            if trimmed is not None:
+                packed.append(trimmed)
+        return packed
@@ -30,7 +30,7 @@ class Prompter:
     def __call__(self, inp: Any, **kwargs) -> str:
         return self.complete(inp, **kwargs)
 
-    def parallel_complete(self, inps: List[Any]) -> List[str]:
+    async def parallel_complete(self, inps: List[Any]) -> List[str]:
         prompts = []
         prefixes = []
         suffixes = []
@@ -40,7 +40,7 @@ class Prompter:
             prefixes.append(prefix)
             suffixes.append(suffix)
 
-        resps = self.llm.parallel_complete(
+        resps = await self.llm.parallel_complete(
             [prompt + prefix for prompt, prefix in zip(prompts, prefixes)], suffixes=suffixes)
         return [prefix + resp + (suffix or "") for prefix, resp, suffix in zip(prefixes, resps, suffixes)]
 
@@ -92,7 +92,7 @@ class EditPrompter(Prompter):
         inp, instruction = self.prompt_fn(inp)
         return self.llm.edit(inp, instruction, **kwargs)
 
-    def parallel_complete(self, inps: List[Any]) -> List[str]:
+    async def parallel_complete(self, inps: List[Any]) -> List[str]:
         prompts = []
         instructions = []
         for inp in inps:
@@ -100,7 +100,7 @@ class EditPrompter(Prompter):
             prompts.append(prompt)
             instructions.append(instruction)
 
-        return self.llm.parallel_edit(prompts, instructions)
+        return await self.llm.parallel_edit(prompts, instructions)
 
 
 class InsertPrompter(Prompter):
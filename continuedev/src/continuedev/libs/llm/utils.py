@@ -1,9 +1,133 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from transformers import GPT2TokenizerFast
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple, Union
 
-gpt2_tokenizer = GPT2TokenizerFast.from_pretrained("gpt2")
-def count_tokens(text: str) -> int:
-    return len(gpt2_tokenizer.encode(text))
+
+class Tokenizer:
+    encode: Callable[[str], List[int]]
+    encode_batch: Callable[[List[str]], List[List[int]]]
+
+    def __init__(self, encode: Callable[[str], List[int]], encode_batch: Callable[[List[str]], List[List[int]]]):
+        self.encode = encode
+        self.encode_batch = encode_batch
+
+
+def _load_gpt2() -> Tokenizer:
+    from transformers import GPT2TokenizerFast
+    gpt2_tokenizer = GPT2TokenizerFast.from_pretrained("gpt2")
+    return Tokenizer(gpt2_tokenizer.encode, lambda texts: gpt2_tokenizer(texts)["input_ids"])
+
+
+def _load_tiktoken(encoding_name: str) -> Tokenizer:
+    try:
+        import tiktoken
+    except ImportError:
+        return _load_gpt2()
+    encoding = tiktoken.get_encoding(encoding_name)
+    return Tokenizer(lambda text: encoding.encode(text, disallowed_special=()),
+                     lambda texts: encoding.encode_batch(texts, disallowed_special=()))
+
+
+# Tokenizers are only loaded the first time a model of their family is counted
+TOKENIZER_LOADERS: Dict[str, Callable[[], Tokenizer]] = {
+    "gpt2": _load_gpt2,
+    "p50k_base": lambda: _load_tiktoken("p50k_base"),
+    "cl100k_base": lambda: _load_tiktoken("cl100k_base"),
+}
+
+MODEL_FAMILY = {
+    "gpt-3.5-turbo": "cl100k_base",
+    "gpt-4": "cl100k_base",
+    "text-davinci-003": "p50k_base",
+    "text-davinci-002": "p50k_base",
+    "code-davinci-002": "p50k_base",
+}
+DEFAULT_FAMILY = "gpt2"
+
+_tokenizers: Dict[str, Tokenizer] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def model_family(model: Union[str, None]) -> str:
+    """The tokenizer family of a model, including dated snapshots like gpt-4-0314"""
+    if model in MODEL_FAMILY:
+        return MODEL_FAMILY[model]
+    if model is not None:
+        for name, family in MODEL_FAMILY.items():
+            if model.startswith(name + "-"):
+                return family
+    return DEFAULT_FAMILY
+
+
+def get_tokenizer(model: Union[str, None] = None) -> Tokenizer:
+    family = model_family(model)
+    if family not in _tokenizers:
+        with _tokenizers_lock:
+            if family not in _tokenizers:
+                _tokenizers[family] = TOKENIZER_LOADERS[family]()
+    return _tokenizers[family]
+
+
+def load_tokenizer_in_background(model: Union[str, None] = None):
+    """Start loading the tokenizer for a model in a thread, so the first count doesn't wait for it"""
+    if model_family(model) not in _tokenizers:
+        threading.Thread(target=get_tokenizer, args=(model,), daemon=True).start()
+
+
+# LRU cache of token counts. Very long strings aren't cached so the cache can't hold onto whole files.
+TOKEN_COUNT_CACHE_SIZE = 8192
+MAX_CACHED_STRING_LENGTH = 10000
+_token_counts: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+
+
+def _cache_get(key: Tuple[str, str]) -> Union[int, None]:
+    count = _token_counts.get(key)
+    if count is not None:
+        _token_counts.move_to_end(key)
+    return count
+
+
+def _cache_put(key: Tuple[str, str], count: int):
+    if len(key[1]) > MAX_CACHED_STRING_LENGTH:
+        return
+    _token_counts[key] = count
+    if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+        _token_counts.popitem(last=False)
+
+
+def count_tokens(text: str, model: Union[str, None] = None) -> int:
+    key = (model_family(model), text)
+    count = _cache_get(key)
+    if count is None:
+        count = len(get_tokenizer(model).encode(text))
+        _cache_put(key, count)
+    return count
+
+
+def count_tokens_batch(texts: List[str], model: Union[str, None] = None) -> List[int]:
+    """Count tokens in many strings with a single call to the tokenizer for those not already cached"""
+    family = model_family(model)
+    counts: List[Union[int, None]] = [
+        _cache_get((family, text)) for text in texts]
+    missing = [i for i, count in enumerate(counts) if count is None]
+    if len(missing) > 0:
+        encoded = get_tokenizer(model).encode_batch(
+            [texts[i] for i in missing])
+        for i, ids in zip(missing, encoded):
+            counts[i] = len(ids)
+            _cache_put((family, texts[i]), counts[i])
+    return counts
+
+
+# Total tokens (prompt + completion) each model accepts
+CONTEXT_LENGTH_FOR_MODEL = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-4": 8192,
+    "text-davinci-003": 4097,
+    "text-davinci-002": 4097,
+    "code-davinci-002": 8001,
+}
+DEFAULT_CONTEXT_LENGTH = 2048
 
 prices = {
     # All prices are per 1k tokens
@@ -14,6 +138,8 @@ prices = {
         "ada": 0.0004,
     },
     "completion": {
+        "gpt-4": 0.06,
+        "gpt-3.5-turbo": 0.002,
         "davinci": 0.02,
         "curie": 0.002,
         "babbage": 0.0005,
@@ -30,5 +156,16 @@ prices = {
     }
 }
 
+
+def get_price_for_tokens(tokens: int, model: str = "davinci", task: str = "completion") -> float:
+    """Accepts either a price table key (e.g. "davinci") or a full model name (e.g. "text-davinci-003"). Unknown models are free."""
+    table = prices[task]
+    key = model if model in table else next(
+        (k for k in table if k in model), None)
+    if key is None:
+        return 0.0
+    return tokens * table[key] / 1000
+
+
 def get_price(text: str, model: str="davinci", task: str="completion") -> float:
-    return count_tokens(text) * prices[task][model] / 1000
\ No newline at end of file
+    return get_price_for_tokens(count_tokens(text, model), model, task)
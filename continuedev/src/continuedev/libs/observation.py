@@ -1,3 +1,4 @@
+from typing import List, Union
 from pydantic import BaseModel, validator
 from ..models.main import Traceback
 
@@ -33,3 +34,16 @@ class TextObservation(Observation):
         if v is None:
             return ""
         return v
+
+
+class ParallelObservation(Observation):
+    """The observations of steps that ran in parallel, in the order of the steps"""
+    observations: List[Union[Observation, None]]
+
+    @classmethod
+    def merge(cls, observations: List[Union[Observation, None]]) -> Union[Observation, None]:
+        """Combine the observations, or return the only one there is"""
+        present = [observation for observation in observations if observation is not None]
+        if len(present) <= 1:
+            return present[0] if len(present) == 1 else None
+        return cls(observations=observations)
@@ -41,7 +41,7 @@ class AnswerQuestionChroma(Step):
 
             Here is the answer:""")
 
-        answer = sdk.llm.complete(prompt)
+        answer = await sdk.llm.acomplete(prompt)
         print(answer)
         self._answer = answer
 
@@ -9,8 +9,8 @@ class SetupPipelineStep(Step):
     api_description: str  # e.g. "I want to load data from the weatherapi.com API"
 
     async def run(self, sdk: ContinueSDK):
-        source_name = sdk.llm.complete(
-            f"Write a snake_case name for the data source described by {self.api_description}: ").strip()
+        source_name = (await sdk.llm.acomplete(
+            f"Write a snake_case name for the data source described by {self.api_description}: ")).strip()
         filename = f'{source_name}.py'
 
         # running commands to get started when creating a new dlt pipeline
@@ -1,3 +1,4 @@
+import asyncio
 import time
 from typing import Callable, Coroutine, List, Union
 
@@ -6,11 +7,11 @@ from ...models.main import Traceback, Range
 from ...models.filesystem_edit import EditDiff, FileEdit
 from ...models.filesystem import RangeInFile, RangeInFileWithContents
 from ..observation import Observation, TextObservation
-from ..llm.prompt_utils import MarkdownStyleEncoderDecoder
+from ..llm.prompt_utils import ContextPacker, MarkdownStyleEncoderDecoder, MarkdownStyleStreamDecoder
+from ..llm.utils import count_tokens
 from textwrap import dedent
 from ..core import History, Policy, Step, ContinueSDK, Observation
-import subprocess
-from ..util.traceback_parsers import parse_python_traceback
+from ..util.traceback_parsers import TracebackScanner
 from ..observation import TracebackObservation
 import json
 
@@ -29,6 +30,8 @@ class RunPolicyUntilDoneStep(Step):
 class RunCommandStep(Step):
     cmd: str
     name: str = "Run command"
+    # Seconds after which the command is killed
+    timeout: Union[float, None] = None
     _description: str = None
 
     async def describe(self, llm: LLM) -> Coroutine[str, None, None]:
@@ -38,12 +41,13 @@ class RunCommandStep(Step):
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
         cwd = await sdk.ide.getWorkspaceDirectory()
-        result = subprocess.run(
-            self.cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
-        stdout = result.stdout.decode("utf-8")
-        stderr = result.stderr.decode("utf-8")
+        result = await sdk.run_command(self.cmd, cwd=cwd, timeout=self.timeout)
+        stdout = result.stdout
+        stderr = result.stderr
         print(stdout, stderr)
 
+        if result.timed_out:
+            return TextObservation(text=f"{stderr}\nTimed out after {self.timeout} seconds")
         # If it fails, return the error
         if result.returncode != 0:
             return TextObservation(text=stderr)
@@ -81,21 +85,45 @@ class WaitForUserConfirmationStep(Step):
 
 class RunCodeStep(Step):
     cmd: str
+    # Seconds after which the code is killed, even if it keeps running after the step returns. None to wait until halted.
+    timeout: Union[float, None] = 600
 
     async def describe(self, llm: LLM) -> Coroutine[str, None, None]:
         return f"Ran command: `{self.cmd}`"
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
-        result = subprocess.run(
-            self.cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout = result.stdout.decode("utf-8")
-        stderr = result.stderr.decode("utf-8")
-        print(stdout, stderr)
+        scanners = {"stdout": TracebackScanner(), "stderr": TracebackScanner()}
+        traceback_found = asyncio.Event()
+
+        def on_output(stream: str, text: str):
+            if len(scanners[stream].feed(text)) > 0:
+                traceback_found.set()
+
+        # Started in the background so it can keep going after the step returns early. It is still killed on halt or timeout.
+        process = sdk.start_background_task(sdk.run_command(
+            self.cmd, timeout=self.timeout, on_output=on_output))
+        # Nothing waits on it once the step has returned, so make sure a failure isn't reported as never retrieved
+        process.add_done_callback(
+            lambda task: task.cancelled() or task.exception())
+        wait_for_traceback = asyncio.create_task(traceback_found.wait())
+        try:
+            await asyncio.wait([process, wait_for_traceback], return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            process.cancel()
+            raise
+        finally:
+            wait_for_traceback.cancel()
+
+        if process.done():
+            result = process.result()
+            print(result.stdout, result.stderr)
+            for scanner in scanners.values():
+                scanner.close()
 
         # If it fails, return the error
-        tb = parse_python_traceback(stdout) or parse_python_traceback(stderr)
-        if tb:
-            return TracebackObservation(traceback=tb)
+        tracebacks = scanners["stdout"].tracebacks + scanners["stderr"].tracebacks
+        if len(tracebacks) > 0:
+            return TracebackObservation(traceback=tracebacks[0])
         else:
             self.hide = True
             return None
@@ -106,6 +134,8 @@ class EditCodeStep(Step):
     range_in_files: List[RangeInFile]
     prompt: str  # String with {code} somewhere
     name: str = "Edit code"
+    # For each of range_in_files, the line in the file to keep if the range has to be trimmed to fit the prompt
+    focus_lines: Union[List[Union[int, None]], None] = None
 
     _edit_diffs: Union[List[EditDiff], None] = None
     _prompt: Union[str, None] = None
@@ -117,35 +147,50 @@ class EditCodeStep(Step):
         elif len(self._edit_diffs) == 0:
             return "No edits made"
         else:
-            return llm.complete(dedent(f"""{self._prompt}{self._completion}
+            # Deterministic, so that describing the same edit again is served from the completion cache
+            return await llm.acomplete(dedent(f"""{self._prompt}{self._completion}
 
                 Maximally concise summary of changes in bullet points (can use markdown):
-            """))
+            """), temperature=0)
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
-        rif_with_contents = []
-        for range_in_file in self.range_in_files:
-            file_contents = await sdk.ide.readRangeInFile(range_in_file)
-            rif_with_contents.append(
-                RangeInFileWithContents.from_range_in_file(range_in_file, file_contents))
+        rif_with_contents = [
+            RangeInFileWithContents.from_range_in_file(range_in_file, file_contents)
+            for range_in_file, file_contents in zip(self.range_in_files, await sdk.ide.readRangesInFiles(self.range_in_files))
+        ]
+        model = sdk.llm.default_model
+        packer = ContextPacker(sdk.llm.context_length, model)
+        rif_with_contents = packer.pack(rif_with_contents, packer.code_budget(
+            count_tokens(self.prompt.format(code=""), model)), self.focus_lines)
         enc_dec = MarkdownStyleEncoderDecoder(rif_with_contents)
         code_string = enc_dec.encode()
         prompt = self.prompt.format(code=code_string)
 
-        completion = sdk.llm.complete(prompt)
+        # Apply each line to the IDE as soon as it has been generated
+        stream_decoder = MarkdownStyleStreamDecoder(rif_with_contents)
+        completion = ""
+        try:
+            async for chunk in sdk.llm.astream_complete(prompt, max_tokens=packer.completion_budget(count_tokens(prompt, model))):
+                completion += chunk
+                for file_edit in stream_decoder.feed(chunk):
+                    await sdk.ide.editFile(file_edit)
+        except BaseException:
+            # Halted or failed partway through a file, so take out the lines already inserted into it
+            for file_edit in stream_decoder.abort():
+                await sdk.ide.editFile(file_edit)
+            raise
+        for file_edit in stream_decoder.close():
+            await sdk.ide.editFile(file_edit)
 
         # Temporarily doing this to generate description.
         self._prompt = prompt
         self._completion = completion
 
-        file_edits = enc_dec.decode(completion)
-
-        self._edit_diffs = []
-        for file_edit in file_edits:
-            diff = await sdk.apply_filesystem_edit(file_edit)
-            self._edit_diffs.append(diff)
+        self._edit_diffs = stream_decoder.edit_diffs()
+        for diff in self._edit_diffs:
+            await sdk.record_edit_diff(diff)
 
-        for filepath in set([file_edit.filepath for file_edit in file_edits]):
+        for filepath in set([diff.forward.filepath for diff in self._edit_diffs]):
             await sdk.ide.saveFile(filepath)
             await sdk.ide.setFileOpen(filepath)
 
@@ -156,6 +201,7 @@ class EditFileStep(Step):
     filepath: str
     prompt: str
     hide: bool = True
+    memoize = True
 
     async def describe(self, llm: LLM) -> Coroutine[str, None, None]:
         return "Editing file: " + self.filepath
@@ -216,21 +262,25 @@ Respond with only as many edits as needed, and output only the list of json obje
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
         range_in_files = await sdk.ide.getHighlightedCode()
+        # Trimmed to start from the first highlighted line if it doesn't fit
+        focus_lines = [rif.range.start.line for rif in range_in_files]
         if len(range_in_files) == 0:
             # Get the full contents of all open files
             files = await sdk.ide.getOpenFiles()
-            contents = {}
-            for file in files:
-                contents[file] = await sdk.ide.readFile(file)
+            contents = dict(zip(files, await sdk.ide.readFiles(files)))
 
             range_in_files = [RangeInFile.from_entire_file(
                 filepath, content) for filepath, content in contents.items()]
-
-        rif_with_contents = []
-        for range_in_file in range_in_files:
-            file_contents = await sdk.ide.readRangeInFile(range_in_file)
-            rif_with_contents.append(
-                RangeInFileWithContents.from_range_in_file(range_in_file, file_contents))
+            focus_lines = None
+
+        rif_with_contents = [
+            RangeInFileWithContents.from_range_in_file(range_in_file, file_contents)
+            for range_in_file, file_contents in zip(range_in_files, await sdk.ide.readRangesInFiles(range_in_files))
+        ]
+        model = sdk.llm.default_model
+        packer = ContextPacker(sdk.llm.context_length, model)
+        rif_with_contents = packer.pack(rif_with_contents, packer.code_budget(
+            count_tokens(self._prompt.format(code="", user_input=self.user_input), model)), focus_lines)
         enc_dec = MarkdownStyleEncoderDecoder(rif_with_contents)
         code_string = enc_dec.encode()
         prompt = self._prompt.format(
@@ -238,9 +288,10 @@ Respond with only as many edits as needed, and output only the list of json obje
 
         rif_dict = {}
         for rif in rif_with_contents:
-            rif_dict[rif.filepath] = rif.contents
+            rif_dict[rif.filepath] = rif
 
-        completion = sdk.llm.complete(prompt)
+        completion = await sdk.llm.acomplete(
+            prompt, max_tokens=packer.completion_budget(count_tokens(prompt, model)))
 
         # Temporarily doing this to generate description.
         self._prompt = prompt
@@ -249,12 +300,16 @@ Respond with only as many edits as needed, and output only the list of json obje
         # ALTERNATIVE DECODING STEP HERE
         file_edits = []
         obj = json.loads(completion.strip())
+        # Find the ranges of all the edits to a file together, so its lines are only indexed once
+        edits_by_file = {}
         for edit in obj["edits"]:
-            filepath = edit["filepath"]
-            replace_me = edit["replace_me"]
-            replace_with = edit["replace_with"]
-            file_edits.append(
-                FileEdit(filepath=filepath, range=Range.from_snippet_in_file(content=rif_dict[filepath], snippet=replace_me), replacement=replace_with))
+            edits_by_file.setdefault(edit["filepath"], []).append(edit)
+        for filepath, edits in edits_by_file.items():
+            ranges = rif_dict[filepath].ranges_of_snippets(
+                [edit["replace_me"] for edit in edits])
+            for edit, range in zip(edits, ranges):
+                file_edits.append(
+                    FileEdit(filepath=filepath, range=range, replacement=edit["replace_with"]))
         # ------------------------------
 
         self._edit_diffs = []
@@ -288,18 +343,20 @@ This is the code after being changed to perfectly satisfy the user request:
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
         range_in_files = await sdk.ide.getHighlightedCode()
+        # Trimmed to start from the first highlighted line if it doesn't fit
+        focus_lines = [rif.range.start.line for rif in range_in_files]
         if len(range_in_files) == 0:
             # Get the full contents of all open files
             files = await sdk.ide.getOpenFiles()
-            contents = {}
-            for file in files:
-                contents[file] = await sdk.ide.readFile(file)
+            contents = dict(zip(files, await sdk.ide.readFiles(files)))
 
             range_in_files = [RangeInFile.from_entire_file(
                 filepath, content) for filepath, content in contents.items()]
+            focus_lines = None
 
         await sdk.run_step(EditCodeStep(
-            range_in_files=range_in_files, prompt=self._prompt.format(code="{code}", user_input=self.user_input)))
+            range_in_files=range_in_files, prompt=self._prompt.format(code="{code}", user_input=self.user_input),
+            focus_lines=focus_lines))
 
 
 class FindCodeStep(Step):
@@ -318,6 +375,7 @@ class UserInputStep(Step):
 
 class SolveTracebackStep(Step):
     traceback: Traceback
+    memoize = True
 
     async def describe(self, llm: LLM) -> Coroutine[str, None, None]:
         return f"```\n{self.traceback.full_traceback}\n```"
@@ -334,12 +392,16 @@ class SolveTracebackStep(Step):
                 This is what the code should be in order to avoid the problem:
             """).format(traceback=self.traceback.full_traceback, code="{code}")
 
-        range_in_files = []
-        for frame in self.traceback.frames:
-            content = await sdk.ide.readFile(frame.filepath)
-            range_in_files.append(
-                RangeInFile.from_entire_file(frame.filepath, content))
+        filepaths = list(dict.fromkeys(
+            frame.filepath for frame in self.traceback.frames))
+        range_in_files = [
+            RangeInFile.from_entire_file(filepath, content)
+            for filepath, content in zip(filepaths, await sdk.ide.readFiles(filepaths))
+        ]
+        # Keep the line where the error was raised in each file, the innermost frame being last
+        error_lines = {frame.filepath: frame.lineno - 1 for frame in self.traceback.frames}
 
         await sdk.run_step(EditCodeStep(
-            range_in_files=range_in_files, prompt=prompt))
+            range_in_files=range_in_files, prompt=prompt,
+            focus_lines=[error_lines[filepath] for filepath in filepaths]))
         return None
@@ -7,7 +7,7 @@ from ...models.main import Range
 from ...models.filesystem import RangeInFile
 from ...models.filesystem_edit import AddDirectory, AddFile
 from ..observation import Observation, TextObservation
-from ..core import Step, ContinueSDK
+from ..core import ParallelStep, Step, ContinueSDK
 from .main import EditCodeStep, EditFileStep, RunCommandStep, WaitForUserConfirmationStep
 import os
 
@@ -117,17 +117,18 @@ class ImplementAbstractMethodStep(Step):
 
     async def run(self, sdk: ContinueSDK):
         await sdk.run_step(WaitForUserConfirmationStep(prompt="Detected new abstract method. Implement in all subclasses?"))
-        implementations = []
-        for filepath in ["/Users/natesesti/Desktop/continue/extension/examples/python/filesystem/real.py", "/Users/natesesti/Desktop/continue/extension/examples/python/filesystem/virtual.py"]:
-            contents = await sdk.ide.readFile(filepath)
-            implementations.append(
-                RangeInFile.from_entire_file(filepath, contents))
-
-        for implementation in implementations:
-            await sdk.run_step(EditCodeStep(
-                range_in_files=[implementation],
-                prompt=f"{{code}}\nRewrite the class, implementing the method `{self.method_name}`.\n",
-            ))
+        filepaths = ["/Users/natesesti/Desktop/continue/extension/examples/python/filesystem/real.py",
+                     "/Users/natesesti/Desktop/continue/extension/examples/python/filesystem/virtual.py"]
+        implementations = [
+            RangeInFile.from_entire_file(filepath, contents)
+            for filepath, contents in zip(filepaths, await sdk.ide.readFiles(filepaths))
+        ]
+
+        # The files are independent, so edit them at the same time
+        await sdk.run_step(ParallelStep(steps=[EditCodeStep(
+            range_in_files=[implementation],
+            prompt=f"{{code}}\nRewrite the class, implementing the method `{self.method_name}`.\n",
+        ) for implementation in implementations]))
 
 
 class CreateTableStep(Step):
@@ -33,5 +33,5 @@ class WritePytestsStep(Step):
 
             Here is a complete set of pytest unit tests:
         """)
-        tests = sdk.llm.complete(prompt)
+        tests = await sdk.llm.acomplete(prompt)
         await sdk.apply_filesystem_edit(AddFile(filepath=path, content=tests))
@@ -0,0 +1,66 @@
+import asyncio
+import random
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar, Union
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class PartialBatchError(Exception):
+    """Raised when some items of a batch failed after all retries. Successful results are kept, in order."""
+    results: List[Union[Any, None]]
+    errors: Dict[int, BaseException]
+
+    def __init__(self, results: List[Union[Any, None]], errors: Dict[int, BaseException]):
+        self.results = results
+        self.errors = errors
+        super().__init__(
+            f"{len(errors)} of {len(results)} batch items failed: " + "; ".join(
+                f"[{i}] {e!r}" for i, e in sorted(errors.items())))
+
+
+class BatchExecutor:
+    """Runs an async function over many inputs on the current event loop with bounded concurrency and retries"""
+    max_concurrency: int
+    max_retries: int
+    base_delay: float
+    max_delay: float
+    is_retryable: Callable[[BaseException], bool]
+
+    def __init__(self, max_concurrency: int = 16, max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 20.0,
+                 is_retryable: Callable[[BaseException], bool] = lambda e: False):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.is_retryable = is_retryable
+
+    async def _run_with_retries(self, fn: Callable[[T], Awaitable[R]], item: T, semaphore: asyncio.Semaphore) -> R:
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    return await fn(item)
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                # Exponential backoff with jitter, waiting outside of the semaphore so other items can proceed
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+                attempt += 1
+
+    async def run(self, fn: Callable[[T], Awaitable[R]], items: List[T]) -> List[R]:
+        """Return fn(item) for every item, in order. Raises PartialBatchError if any item ultimately failed."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        outcomes = await asyncio.gather(*[
+            self._run_with_retries(fn, item, semaphore) for item in items
+        ], return_exceptions=True)
+
+        errors = {i: outcome for i, outcome in enumerate(
+            outcomes) if isinstance(outcome, BaseException)}
+        if len(errors) > 0:
+            if any(isinstance(e, asyncio.CancelledError) for e in errors.values()):
+                raise asyncio.CancelledError()
+            raise PartialBatchError(
+                [None if i in errors else outcome for i, outcome in enumerate(outcomes)], errors)
+        return outcomes
@@ -0,0 +1,118 @@
+import time
+from typing import Dict, Union
+
+from ...models.filesystem_edit import EditDiff, FileEdit
+from ...models.text_document import TextDocument
+
+
+class Document:
+    version: int
+    updated_at: float
+    # None once it's been moved into the TextDocument
+    _contents: Union[str, None]
+    # Indexed the first time a range is read or an edit is applied, then kept and edited in place
+    _text_document: Union[TextDocument, None]
+
+    def __init__(self, contents: str, version: int):
+        self._contents = contents
+        self._text_document = None
+        self.version = version
+        self.updated_at = time.time()
+
+    @property
+    def contents(self) -> str:
+        if self._text_document is not None:
+            return self._text_document.text()
+        return self._contents
+
+    @property
+    def text_document(self) -> TextDocument:
+        if self._text_document is None:
+            self._text_document = TextDocument(self._contents)
+            self._contents = None
+        return self._text_document
+
+
+class DocumentStore:
+    """In-memory copy of file contents, seeded by reads from the IDE and kept current by the edits it reports.
+
+    Each file's contents are kept in a TextDocument once a range of it is read, and edits made by steps are applied
+    to that, so neither reading ranges nor editing has to index the whole file again. Every change bumps the file's
+    version. A read that was in flight while the file changed is only stored
+    if the version it started from is still current, so stale responses can't overwrite newer contents."""
+    max_age: Union[float, None]
+    _documents: Dict[str, Document]
+    _versions: Dict[str, int]
+
+    def __init__(self, max_age: Union[float, None] = 60):
+        # Files can change on disk without the IDE telling us (e.g. a command run in the terminal), so don't trust old entries forever
+        self.max_age = max_age
+        self._documents = {}
+        self._versions = {}
+
+    def version(self, filepath: str) -> int:
+        return self._versions.get(filepath, 0)
+
+    def _bump(self, filepath: str) -> int:
+        self._versions[filepath] = self.version(filepath) + 1
+        return self._versions[filepath]
+
+    def _get(self, filepath: str) -> Union[Document, None]:
+        document = self._documents.get(filepath)
+        if document is None:
+            return None
+        if self.max_age is not None and time.time() - document.updated_at > self.max_age:
+            del self._documents[filepath]
+            return None
+        return document
+
+    def get(self, filepath: str) -> Union[str, None]:
+        document = self._get(filepath)
+        return None if document is None else document.contents
+
+    def get_text_document(self, filepath: str) -> Union[TextDocument, None]:
+        """The file's contents as a TextDocument, to read ranges from. It mustn't be edited except by apply_edit."""
+        document = self._get(filepath)
+        return None if document is None else document.text_document
+
+    def apply_edit(self, filepath: str, edit: FileEdit) -> Union[EditDiff, None]:
+        """Apply an edit to the stored contents of a file, or return None if they aren't stored"""
+        document = self._get(filepath)
+        if document is None:
+            return None
+        diff = document.text_document.apply_edit(edit)
+        document.version = self._bump(filepath)
+        document.updated_at = time.time()
+        return diff
+
+    def seed(self, filepath: str, contents: str, version: int) -> bool:
+        """Store contents read at the given version. Returns False if the file has changed since."""
+        if self.version(filepath) != version:
+            return False
+        self._documents[filepath] = Document(contents, self._bump(filepath))
+        return True
+
+    def set(self, filepath: str, contents: str):
+        self._documents[filepath] = Document(contents, self._bump(filepath))
+
+    def invalidate(self, filepath: str):
+        self._documents.pop(filepath, None)
+        self._bump(filepath)
+
+    def rename(self, filepath: str, new_filepath: str):
+        document = self._documents.pop(filepath, None)
+        self._bump(filepath)
+        if document is None:
+            self.invalidate(new_filepath)
+        else:
+            self.set(new_filepath, document.contents)
+
+    def invalidate_directory(self, path: str):
+        prefix = path.rstrip("/") + "/"
+        for filepath in list(self._documents.keys()):
+            if filepath.startswith(prefix):
+                self.invalidate(filepath)
+
+    def clear(self):
+        for filepath in list(self._documents.keys()):
+            self.invalidate(filepath)
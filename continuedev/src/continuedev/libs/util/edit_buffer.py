@@ -0,0 +1,175 @@
+from typing import Dict, List, Tuple, Union
+
+from ...models.main import Position, Range
+from ...models.filesystem_edit import EditDiff, FileEdit, FileEditWithFullContents
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # Binary search comparing slices, so the characters are compared in C rather than one by one
+    lo, hi = 0, min(len(a), len(b))
+    if a[:hi] == b[:hi]:
+        return hi
+    hi -= 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_length(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    if a[len(a) - hi:] == b[len(b) - hi:]:
+        return hi
+    hi -= 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:len(a) - lo] == b[len(b) - mid:len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _changed_region(old: str, new: str) -> Tuple[int, int, str]:
+    """The smallest (start, end, text) such that replacing old[start:end] with text gives new"""
+    prefix = _common_prefix_length(old, new)
+    suffix = _common_suffix_length(
+        old, new, min(len(old), len(new)) - prefix)
+    return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+
+def _position_at(contents: str, index: int) -> Position:
+    line = contents.count("\n", 0, index)
+    return Position(line=line, character=index - (contents.rfind("\n", 0, index) + 1))
+
+
+def _end_position(start: Position, text: str) -> Position:
+    """The end of text inserted at start. Ranges are end-inclusive, so this is its last character, or the character
+    before start if it's empty."""
+    lines = text.split("\n")
+    if len(lines) == 1:
+        return Position(line=start.line, character=start.character + len(text) - 1)
+    return Position(line=start.line + len(lines) - 1, character=len(lines[-1]) - 1)
+
+
+class _Hunk:
+    """A region of a file that has been changed, starting at an index into the file's current contents"""
+    __slots__ = ("start", "original", "replacement")
+    start: int
+    original: str
+    replacement: str
+
+    def __init__(self, start: int, original: str, replacement: str):
+        self.start = start
+        self.original = original
+        self.replacement = replacement
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.replacement)
+
+
+class ManualEditBuffer:
+    """The edits made by the user since the last ManualEditStep, merged into as few changed regions as possible.
+
+    Each edit is compared with the file's previous contents as soon as it arrives, and only the changed text is kept,
+    merged with the changes next to or overlapping it. So the buffer grows with the net change to each file rather than
+    with the number of keystrokes. The file's latest contents are also referenced, but that's the same string the IDE
+    server keeps, not a copy."""
+    _contents: Dict[str, str]
+    # Non-overlapping, in order, and never touching, since those are merged
+    _hunks: Dict[str, List[_Hunk]]
+
+    def __init__(self):
+        self._contents = {}
+        self._hunks = {}
+
+    def __len__(self) -> int:
+        return sum(len(hunks) for hunks in self._hunks.values())
+
+    def add(self, edit: FileEditWithFullContents, previous_contents: Union[str, None] = None):
+        """Record an edit from the IDE, given the contents of the file before it if known.
+
+        The IDE reports each edit with the contents after it, so the contents before come from the IDE server, which
+        also sees the edits made by steps, or else from the last edit to the file. The change is found by comparing
+        them rather than from the edit's range, so it doesn't matter how the IDE counts the end of ranges."""
+        filepath = edit.fileEdit.filepath
+        contents = edit.fileContents
+        known_contents = self._contents.get(filepath)
+        self._contents[filepath] = contents
+
+        if previous_contents is not None and known_contents is not None and previous_contents is not known_contents \
+                and previous_contents != known_contents:
+            # The file was changed by something other than the user, like a step, so move the buffered changes to match
+            self._change(filepath, known_contents, previous_contents, manual=False)
+        old = previous_contents if previous_contents is not None else known_contents
+        if old is None:
+            # The text the edit replaced can't be known. Later edits to the file are compared with these contents.
+            return
+        self._change(filepath, old, contents, manual=True)
+
+    def _change(self, filepath: str, old: str, new: str, manual: bool):
+        if old is new or old == new:
+            return
+        start, end, text = _changed_region(old, new)
+        hunks = self._hunks.get(filepath, [])
+
+        # Hunks touching the change
+        i = 0
+        while i < len(hunks) and hunks[i].end < start:
+            i += 1
+        j = i
+        while j < len(hunks) and hunks[j].start <= end:
+            j += 1
+
+        for hunk in hunks[j:]:
+            hunk.start += len(text) - (end - start)
+
+        if not manual:
+            # Changes that aren't the user's can't be untangled from the user's, so those hunks are dropped
+            hunks[i:j] = []
+        else:
+            merged = hunks[i:j]
+            region_start = min([start] + [hunk.start for hunk in merged])
+            region_end = max([end] + [hunk.end for hunk in merged])
+            # The region's text before any of the buffered edits: the merged hunks' originals, and the text between them
+            original = []
+            index = region_start
+            for hunk in merged:
+                original.append(old[index:hunk.start])
+                original.append(hunk.original)
+                index = hunk.end
+            original.append(old[index:region_end])
+            original = "".join(original)
+            replacement = old[region_start:start] + text + old[end:region_end]
+            # Text typed and then deleted again leaves nothing to undo
+            hunks[i:j] = [] if original == replacement else [
+                _Hunk(region_start, original, replacement)]
+
+        if len(hunks) > 0:
+            self._hunks[filepath] = hunks
+        else:
+            self._hunks.pop(filepath, None)
+
+    def flush(self) -> Union[EditDiff, None]:
+        """The buffered edits as one EditDiff, or None if there are none, and empty the buffer"""
+        diffs = []
+        for filepath, hunks in self._hunks.items():
+            contents = self._contents[filepath]
+            # Top to bottom: each forward edit comes after the ones above it have been applied, so its start is the
+            # same as in the current contents. The backward edits are applied in reverse, bottom to top, for the same reason.
+            for hunk in hunks:
+                start = _position_at(contents, hunk.start)
+                diffs.append(EditDiff(
+                    forward=FileEdit(filepath=filepath, range=Range(
+                        start=start, end=_end_position(start, hunk.original)), replacement=hunk.replacement),
+                    backward=FileEdit(filepath=filepath, range=Range(
+                        start=start, end=_end_position(start, hunk.replacement)), replacement=hunk.original)
+                ))
+        self._hunks = {}
+        if len(diffs) == 0:
+            return None
+        return EditDiff.from_sequence(diffs)
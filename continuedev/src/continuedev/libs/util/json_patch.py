@@ -0,0 +1,42 @@
+from typing import Any, Dict, List
+
+
+def _escape(key: Any) -> str:
+    """Escape a key for use in a JSON pointer (RFC 6901)"""
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def make_patch(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """Return a JSON patch (RFC 6902) of add/remove/replace operations that turns old into new. Both must be JSON-serializable."""
+    if type(old) != type(new):
+        return [{"op": "replace", "path": path, "value": new}]
+
+    if isinstance(old, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append(
+                    {"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key not in old:
+                ops.append(
+                    {"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+            else:
+                ops += make_patch(old[key], value, f"{path}/{_escape(key)}")
+        return ops
+
+    if isinstance(old, list):
+        ops = []
+        common = min(len(old), len(new))
+        for i in range(common):
+            ops += make_patch(old[i], new[i], f"{path}/{i}")
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        # Remove from the end so earlier indices stay valid
+        for i in reversed(range(common, len(old))):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        return ops
+
+    if old != new:
+        return [{"op": "replace", "path": path, "value": new}]
+    return []
@@ -0,0 +1,127 @@
+import hashlib
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Tuple, Union
+
+from ...models.main import Range
+from ...models.filesystem import RangeInFile
+from ...models.filesystem_edit import FileSystemEdit
+from ...server.ide_protocol import AbstractIdeProtocolServer
+from ..observation import Observation
+
+# Number of step results kept
+MAX_MEMOIZED_STEPS = 1000
+
+# What a memoized step read: a whole file by path, or a range as (path, start line, start character, end line, end character)
+ReadKey = Union[str, Tuple[str, int, int, int, int]]
+
+# Hashes of the contents read by each memoized step running in this context, outermost first.
+# Substeps read on behalf of every memoized step above them, so each read is recorded in all of them.
+current_reads: ContextVar[Tuple[Dict[ReadKey, str], ...]] = ContextVar(
+    "current_reads", default=())
+
+
+def content_hash(contents: str) -> str:
+    return hashlib.sha1(contents.encode("utf-8")).hexdigest()
+
+
+def _range_key(range_in_file: RangeInFile) -> ReadKey:
+    r = range_in_file.range
+    return (range_in_file.filepath, r.start.line, r.start.character, r.end.line, r.end.character)
+
+
+class ReadRecordingIde:
+    """Passes everything through to the IDE, recording the contents of the files that are read"""
+    _ide: AbstractIdeProtocolServer
+    _reads: Tuple[Dict[ReadKey, str], ...]
+
+    def __init__(self, ide: AbstractIdeProtocolServer, reads: Tuple[Dict[ReadKey, str], ...]):
+        self._ide = ide
+        self._reads = reads
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._ide, name)
+
+    def _record(self, key: ReadKey, contents: str):
+        contents_hash = content_hash(contents)
+        for reads in self._reads:
+            # The result depends on the contents before the step changed anything, so keep the first read
+            reads.setdefault(key, contents_hash)
+
+    async def readFile(self, filepath: str) -> str:
+        contents = await self._ide.readFile(filepath)
+        self._record(filepath, contents)
+        return contents
+
+    async def readFiles(self, filepaths: List[str]) -> List[str]:
+        contents = await self._ide.readFiles(filepaths)
+        for filepath, file_contents in zip(filepaths, contents):
+            self._record(filepath, file_contents)
+        return contents
+
+    async def readRangeInFile(self, range_in_file: RangeInFile) -> str:
+        contents = await self._ide.readRangeInFile(range_in_file)
+        self._record(_range_key(range_in_file), contents)
+        return contents
+
+    async def readRangesInFiles(self, range_in_files: List[RangeInFile]) -> List[str]:
+        contents = await self._ide.readRangesInFiles(range_in_files)
+        for range_in_file, range_contents in zip(range_in_files, contents):
+            self._record(_range_key(range_in_file), range_contents)
+        return contents
+
+
+class MemoEntry:
+    """The result of running a memoized step, and what it depended on"""
+    reads: Dict[ReadKey, str]
+    observation: Union[Observation, None]
+    # Edits made by the step and its substeps, in order
+    edits: List[FileSystemEdit]
+    # The step that ran, whose description can be reused once it has been generated
+    step: Any
+
+    def __init__(self, reads: Dict[ReadKey, str], observation: Union[Observation, None], edits: List[FileSystemEdit], step: Any):
+        self.reads = reads
+        self.observation = observation
+        self.edits = edits
+        self.step = step
+
+
+async def _reads_unchanged(reads: Dict[ReadKey, str], ide: AbstractIdeProtocolServer) -> bool:
+    filepaths = [key for key in reads if isinstance(key, str)]
+    range_keys = [key for key in reads if not isinstance(key, str)]
+    contents = []
+    if len(filepaths) > 0:
+        contents += await ide.readFiles(filepaths)
+    if len(range_keys) > 0:
+        contents += await ide.readRangesInFiles([
+            RangeInFile(filepath=key[0], range=Range.from_shorthand(*key[1:])) for key in range_keys])
+    return all(content_hash(file_contents) == reads[key]
+               for key, file_contents in zip(filepaths + range_keys, contents))
+
+
+class StepMemo:
+    """Results of memoized steps by step key, for as long as the files they read are unchanged"""
+    max_size: int
+    _entries: "OrderedDict[str, MemoEntry]"
+
+    def __init__(self, max_size: int = MAX_MEMOIZED_STEPS):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def record(self, key: str, entry: MemoEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def lookup(self, key: str, ide: AbstractIdeProtocolServer) -> Union[MemoEntry, None]:
+        """The recorded result for the key, if every file it read still has the same contents"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not await _reads_unchanged(entry.reads, ide):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
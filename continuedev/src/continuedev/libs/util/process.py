@@ -0,0 +1,102 @@
+import asyncio
+import codecs
+from typing import Callable, List, Union
+
+# Characters of stdout and of stderr kept from a process. The end is kept, since that's where errors are.
+MAX_OUTPUT = 1_000_000
+# Seconds to wait for the rest of the output once a process exits, in case something it started still holds the pipes open
+EXIT_GRACE_PERIOD = 1.0
+
+
+class ProcessResult:
+    returncode: Union[int, None]
+    stdout: str
+    stderr: str
+    timed_out: bool
+    truncated: bool
+
+    def __init__(self, returncode: Union[int, None], stdout: str, stderr: str, timed_out: bool = False, truncated: bool = False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.truncated = truncated
+
+
+class _Tail:
+    """The last `limit` characters of a stream"""
+    limit: int
+    text: str
+    truncated: bool
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.text = ""
+        self.truncated = False
+
+    def append(self, text: str):
+        self.text += text
+        # Trim only once over twice the limit, so appending stays cheap
+        if len(self.text) > 2 * self.limit:
+            self.text = self.text[-self.limit:]
+            self.truncated = True
+
+    def value(self) -> str:
+        if len(self.text) > self.limit:
+            self.text = self.text[-self.limit:]
+            self.truncated = True
+        return self.text
+
+
+def _kill(process: asyncio.subprocess.Process):
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def run_process(args: List[str], cwd: Union[str, None] = None, timeout: Union[float, None] = None,
+                      max_output: int = MAX_OUTPUT, on_output: Union[Callable[[str, str], None], None] = None) -> ProcessResult:
+    """Run a process without blocking the event loop.
+
+    on_output is called with ("stdout" or "stderr", text) as output arrives. The process is killed if it runs for
+    longer than timeout seconds, or if the calling task is cancelled."""
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=cwd)
+    tails = {"stdout": _Tail(max_output), "stderr": _Tail(max_output)}
+
+    async def read(name: str, stream: asyncio.StreamReader):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            chunk = await stream.read(65536)
+            text = decoder.decode(chunk, final=len(chunk) == 0)
+            if len(text) > 0:
+                tails[name].append(text)
+                if on_output is not None:
+                    on_output(name, text)
+            if len(chunk) == 0:
+                return
+
+    readers = [asyncio.create_task(read("stdout", process.stdout)),
+               asyncio.create_task(read("stderr", process.stderr))]
+    waiter = asyncio.create_task(process.wait())
+    timed_out = False
+    try:
+        await asyncio.wait([waiter], timeout=timeout)
+        if not waiter.done():
+            timed_out = True
+            _kill(process)
+            await waiter
+        await asyncio.wait(readers, timeout=EXIT_GRACE_PERIOD)
+    except asyncio.CancelledError:
+        _kill(process)
+        # Reap it, so its pipes are closed while the event loop is still running
+        await asyncio.wait([waiter, *readers], timeout=EXIT_GRACE_PERIOD)
+        raise
+    finally:
+        for task in readers + [waiter]:
+            task.cancel()
+
+    return ProcessResult(process.returncode, tails["stdout"].value(), tails["stderr"].value(),
+                         timed_out=timed_out,
+                         truncated=tails["stdout"].truncated or tails["stderr"].truncated)
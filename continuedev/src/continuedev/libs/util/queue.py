@@ -1,5 +1,7 @@
 import asyncio
-from typing import Dict
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+from uuid import uuid4
 
 
 class AsyncSubscriptionQueue:
@@ -15,3 +17,35 @@ class AsyncSubscriptionQueue:
         if message_type not in self.queues:
             self.queues.update({message_type: asyncio.Queue()})
         return await self.queues[message_type].get()
+
+
+class PendingRequests:
+    """Matches responses to the requests that caused them by message ID, so many requests can be in flight at once"""
+    _pending: "OrderedDict[str, Tuple[str, asyncio.Future]]"
+
+    def __init__(self):
+        self._pending = OrderedDict()
+
+    def create(self, message_type: str) -> Tuple[str, asyncio.Future]:
+        message_id = str(uuid4())
+        future = asyncio.get_event_loop().create_future()
+        self._pending[message_id] = (message_type, future)
+        return message_id, future
+
+    def resolve(self, message_type: str, data: Any) -> bool:
+        """Resolve the request that data responds to. Returns False if there is no such request."""
+        message_id = data.get("messageId")
+        if message_id is None:
+            # Clients that don't echo IDs answer in order, so give it to the oldest request of this type
+            message_id = next((id for id, (t, _) in self._pending.items()
+                               if t == message_type), None)
+        if message_id is None or message_id not in self._pending:
+            return False
+
+        _, future = self._pending.pop(message_id)
+        if not future.done():
+            future.set_result(data)
+        return True
+
+    def discard(self, message_id: str):
+        self._pending.pop(message_id, None)
@@ -1,5 +1,7 @@
-from typing import Union
-from ...models.main import Traceback
+import re
+from collections import deque
+from typing import Deque, List, Tuple, Union
+from ...models.main import Traceback, TracebackFrame
 from boltons import tbutils
 
 
@@ -8,8 +10,8 @@ def sort_func(items):
     return sorted(items)
 
 
-def parse_python_traceback(stdout: str) -> Union[Traceback, None]:
-    """Parse a python traceback from stdout."""
+def parse_python_traceback_boltons(stdout: str) -> Union[Traceback, None]:
+    """Parse a python traceback from the start of stdout with boltons. Slower than parse_python_traceback, kept for comparison."""
 
     # Sometimes paths are not quoted, but they need to be
     if "File \"" not in stdout:
@@ -22,3 +24,185 @@ def parse_python_traceback(stdout: str) -> Union[Traceback, None]:
 
     except Exception:
         return None
+
+
+TRACEBACK_HEADER = "Traceback (most recent call last):"
+# Paths may or may not be quoted
+_FRAME_RE = re.compile(
+    r'^\s*File "?(?P<filepath>.+?)"?, line (?P<lineno>\d+)(?:, in (?P<function>.+))?$')
+# Lines under the source line pointing at the error, like "    ~~^~~"
+_ANCHOR_RE = re.compile(r"^\s*[~^]+\s*$")
+# Syntax errors are printed without a "Traceback" header when the file fails to compile
+_SYNTAX_ERROR_TYPES = ("SyntaxError", "IndentationError", "TabError")
+_SYNTAX_ERROR_RE = re.compile(
+    r'^[ \t]*File "?(?P<filepath>.+?)"?, line (?P<lineno>\d+)\r?\n(?:[ \t]+.*\r?\n){0,3}?(?P<exception>(?:SyntaxError|IndentationError|TabError)(?::.*)?)$', re.MULTILINE)
+# The lines of the above, for reading them one at a time
+_SYNTAX_ERROR_FILE_RE = re.compile(
+    r'^[ \t]*File "?(?P<filepath>.+?)"?, line (?P<lineno>\d+)$')
+_SYNTAX_ERROR_LINE_RE = re.compile(
+    r'^(?:SyntaxError|IndentationError|TabError)(?::.*)?$')
+# Indented lines, showing the code and where the error is, between the file and the exception
+MAX_SYNTAX_ERROR_CODE_LINES = 3
+
+
+def _parse_exception_line(line: str) -> Tuple[str, str]:
+    error_type, _, message = line.partition(": ")
+    return error_type.strip(), message.strip()
+
+
+def _syntax_error(match: "re.Match", exception: str, full_traceback: str) -> Traceback:
+    error_type, message = _parse_exception_line(exception)
+    frame = TracebackFrame(filepath=match.group("filepath"), lineno=int(match.group("lineno")),
+                           function="", code=None)
+    return Traceback(frames=[frame], message=message, error_type=error_type, full_traceback=full_traceback)
+
+
+def _parse_traceback_lines(lines: List[str]) -> Union[Traceback, None]:
+    """Parse the lines of one traceback after its header, the last being the exception line"""
+    frames = []
+    for line in lines[:-1]:
+        if (match := _FRAME_RE.match(line)) is not None:
+            frames.append(TracebackFrame(filepath=match.group("filepath"), lineno=int(match.group("lineno")),
+                                         function=match.group("function") or "", code=None))
+        elif len(frames) > 0 and frames[-1].code is None and not _ANCHOR_RE.match(line) and not line.lstrip().startswith("[Previous line repeated"):
+            frames[-1].code = line.strip()
+
+    if len(frames) == 0:
+        return None
+    error_type, message = _parse_exception_line(lines[-1])
+    return Traceback(frames=frames, message=message, error_type=error_type,
+                     full_traceback="\n".join([TRACEBACK_HEADER, *lines]))
+
+
+def find_python_tracebacks(text: str) -> List[Traceback]:
+    """Find every Python traceback in text, in the order they appear.
+
+    Chained exceptions ("During handling of the above exception...") are printed as separate tracebacks, so each
+    is returned, innermost first. Text between tracebacks is skipped with str.find rather than read line by line."""
+    tracebacks: List[Tuple[int, Traceback]] = []
+    # Spans of the tracebacks found, so the syntax errors in them aren't found again
+    spans: List[Tuple[int, int]] = []
+
+    pos = text.find(TRACEBACK_HEADER)
+    while pos != -1:
+        line_start = text.find("\n", pos)
+        lines = []
+        end = -1
+        while line_start != -1:
+            line_end = text.find("\n", line_start + 1)
+            line = text[line_start + 1:len(text) if line_end == -1 else line_end].rstrip("\r")
+            if TRACEBACK_HEADER in line:
+                # A new traceback started before this one ended
+                end = line_start
+                lines = []
+                break
+            lines.append(line)
+            if not line.startswith((" ", "\t")):
+                end = len(text) if line_end == -1 else line_end
+                break
+            line_start = line_end
+
+        if len(lines) > 0 and len(lines[-1]) > 0 and not lines[-1].startswith((" ", "\t")):
+            if (traceback := _parse_traceback_lines(lines)) is not None:
+                tracebacks.append((pos, traceback))
+                spans.append((pos, end))
+        pos = text.find(TRACEBACK_HEADER, max(pos + 1, end))
+
+    # The regex is much slower than str.find, so only run it when there could be a match
+    if any(error_type in text for error_type in _SYNTAX_ERROR_TYPES):
+        span_index = 0
+        for match in _SYNTAX_ERROR_RE.finditer(text):
+            while span_index < len(spans) and spans[span_index][1] < match.start():
+                span_index += 1
+            if span_index < len(spans) and spans[span_index][0] <= match.start():
+                continue
+            tracebacks.append((match.start(), _syntax_error(
+                match, match.group("exception"), match.group(0))))
+        tracebacks.sort(key=lambda t: t[0])
+
+    return [traceback for _, traceback in tracebacks]
+
+
+def parse_python_traceback(stdout: str) -> Union[Traceback, None]:
+    """Parse the first python traceback in stdout."""
+    tracebacks = find_python_tracebacks(stdout)
+    return tracebacks[0] if len(tracebacks) > 0 else None
+
+
+# Lines of one traceback that are kept. Deep recursion can print thousands, and the frames nearest the error are last.
+MAX_TRACEBACK_LINES = 500
+# Longest partial line that is kept while waiting for its newline
+MAX_LINE_LENGTH = 10000
+
+
+class TracebackScanner:
+    """Finds Python tracebacks in output as it arrives, one line at a time.
+
+    Only the current partial line and the lines of the traceback being read are held, so it can watch a process
+    that runs for a long time. Each traceback is parsed as soon as its exception line arrives. Syntax errors in the
+    script that was run are printed without a traceback header, and are found as find_python_tracebacks finds them."""
+    tracebacks: List[Traceback]
+    _partial: str
+    _lines: Union[Deque[str], None]
+    _syntax_error_lines: Union[List[str], None]
+
+    def __init__(self, max_lines: int = MAX_TRACEBACK_LINES):
+        self.max_lines = max_lines
+        self.tracebacks = []
+        self._partial = ""
+        # Lines of the traceback being read, or None when not inside one
+        self._lines = None
+        # Lines from a "File ..., line N" that may be followed by a SyntaxError, or None
+        self._syntax_error_lines = None
+
+    def feed(self, text: str) -> List[Traceback]:
+        """Scan more output. Returns the tracebacks it completes."""
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()[-MAX_LINE_LENGTH:]
+        found = []
+        for line in lines:
+            traceback = self._scan_line(line.rstrip("\r"))
+            if traceback is not None:
+                found.append(traceback)
+        self.tracebacks += found
+        return found
+
+    def close(self) -> List[Traceback]:
+        """Scan the last line, for output that doesn't end with a newline"""
+        if len(self._partial) == 0:
+            return []
+        return self.feed("\n")
+
+    def _scan_syntax_error_line(self, line: str) -> Union[Traceback, None]:
+        lines = self._syntax_error_lines
+        if lines is not None:
+            if _SYNTAX_ERROR_LINE_RE.match(line):
+                self._syntax_error_lines = None
+                return _syntax_error(_SYNTAX_ERROR_FILE_RE.match(lines[0]), line, "\n".join([*lines, line]))
+            if line.startswith((" ", "\t")) and len(lines) <= MAX_SYNTAX_ERROR_CODE_LINES:
+                lines.append(line)
+                return None
+            self._syntax_error_lines = None
+        if _SYNTAX_ERROR_FILE_RE.match(line):
+            self._syntax_error_lines = [line]
+        return None
+
+    def _scan_line(self, line: str) -> Union[Traceback, None]:
+        if TRACEBACK_HEADER in line:
+            self._lines = deque(maxlen=self.max_lines)
+            self._syntax_error_lines = None
+            return None
+        if self._lines is None:
+            return self._scan_syntax_error_line(line)
+        if line.startswith((" ", "\t")):
+            self._lines.append(line)
+            return None
+        if len(self._lines) == 0:
+            # Not a traceback after all
+            self._lines = None
+            return None
+
+        # The first unindented line after the frames is the exception
+        lines = [*self._lines, line]
+        self._lines = None
+        return _parse_traceback_lines(lines)
@@ -1,9 +1,10 @@
 from abc import ABC, abstractmethod
 from typing import Dict, List, Tuple
 import os
-from ..models.main import Position, Range, AbstractModel
+from ..models.main import LineIndex, Position, Range, AbstractModel
 from pydantic import BaseModel
 from .filesystem_edit import FileSystemEdit, FileEdit, AddFile, DeleteFile, RenameDirectory, RenameFile, AddDirectory, DeleteDirectory, EditDiff, SequentialFileSystemEdit
+from . import text_document
 
 
 class RangeInFile(BaseModel):
@@ -30,14 +31,29 @@ class RangeInFileWithContents(RangeInFile):
 
     @staticmethod
     def from_entire_file(filepath: str, content: str) -> "RangeInFileWithContents":
-        lines = content.splitlines()
         return RangeInFileWithContents(
             filepath=filepath,
-            range=Range.from_shorthand(
-                0, 0, len(lines) - 1, len(lines[-1]) - 1),
+            range=Range.from_entire_file(content),
             contents=content
         )
 
+    def _to_file(self, position: Position) -> Position:
+        """Position in contents to position in the file"""
+        return Position(
+            line=self.range.start.line + position.line,
+            character=position.character +
+            (self.range.start.character if position.line == 0 else 0)
+        )
+
+    def ranges_of_snippets(self, snippets: List[str]) -> List[Range]:
+        """Ranges of many snippets of contents, indexing the lines of contents once for all of them"""
+        starts = [self.contents.index(snippet) for snippet in snippets]
+        positions = LineIndex(self.contents).positions_of(
+            starts + [start + len(snippet) for start, snippet in zip(starts, snippets)])
+        # Ranges are end-inclusive, so each ends on the character before the end of its snippet
+        return [Range(start=self._to_file(start), end=self._to_file(Position(line=end.line, character=end.character - 1)))
+                for start, end in zip(positions[:len(snippets)], positions[len(snippets):])]
+
     @staticmethod
     def from_range_in_file(rif: RangeInFile, content: str) -> "RangeInFileWithContents":
         return RangeInFileWithContents(
@@ -100,60 +116,11 @@ class FileSystem(AbstractModel):
 
     @classmethod
     def read_range_in_str(self, s: str, r: Range) -> str:
-        lines = s.splitlines()[r.start.line:r.end.line + 1]
-        if len(lines) == 0:
-            return ""
-
-        lines[0] = lines[0][r.start.character:]
-        lines[-1] = lines[-1][:r.end.character + 1]
-        return "\n".join(lines)
+        return text_document.read_range_in_str(s, r)
 
     @classmethod
     def apply_edit_to_str(cls, s: str, edit: FileEdit) -> Tuple[str, EditDiff]:
-        original = cls.read_range_in_str(s, edit.range)
-
-        # Split lines and deal with some edge cases (could obviously be nicer)
-        lines = s.splitlines()
-        if s.startswith("\n"):
-            lines.insert(0, "")
-        if s.endswith("\n"):
-            lines.append("")
-
-        if len(lines) == 0:
-            lines = [""]
-
-        end = Position(line=edit.range.end.line,
-                       character=edit.range.end.character)
-        if edit.range.end.line == len(lines) and edit.range.end.character == 0:
-            end = Position(line=edit.range.end.line - 1,
-                           character=len(lines[min(len(lines) - 1, edit.range.end.line - 1)]))
-
-        before_lines = lines[:edit.range.start.line]
-        after_lines = lines[end.line + 1:]
-        between_str = lines[min(len(lines) - 1, edit.range.start.line)][:edit.range.start.character] + \
-            edit.replacement + \
-            lines[min(len(lines) - 1, end.line)][end.character + 1:]
-
-        new_range = Range(
-            start=edit.range.start,
-            end=Position(
-                line=edit.range.start.line +
-                len(edit.replacement.splitlines()) - 1,
-                character=edit.range.start.character +
-                len(edit.replacement.splitlines()
-                    [-1]) if edit.replacement != "" else 0
-            )
-        )
-
-        lines = before_lines + between_str.splitlines() + after_lines
-        return "\n".join(lines), EditDiff(
-            forward=edit,
-            backward=FileEdit(
-                filepath=edit.filepath,
-                range=new_range,
-                replacement=original
-            )
-        )
+        return text_document.apply_edit_to_str(s, edit)
 
     def reverse_edit_on_str(self, s: str, diff: EditDiff) -> str:
         lines = s.splitlines()
@@ -318,11 +285,8 @@ class VirtualFileSystem(FileSystem):
 
     def apply_file_edit(self, edit: FileEdit) -> EditDiff:
         old_content = self.read(edit.filepath)
-        new_content, original = FileSystem.apply_edit_to_str(old_content, edit)
+        new_content, diff = FileSystem.apply_edit_to_str(old_content, edit)
         self.write(edit.filepath, new_content)
-        return EditDiff(
-            edit=edit,
-            original=original
-        )
+        return diff
 
 # TODO: Uniform errors thrown by any FileSystem subclass.
@@ -35,7 +35,8 @@ class FileEdit(AtomicFileSystemEdit):
 
     @staticmethod
     def from_insertion(filepath: str, position: Position, content: str) -> "FileEdit":
-        return FileEdit(filepath=filepath, range=Range.from_shorthand(position.line, position.character, position.line, position.character), replacement=content)
+        # Ranges are end-inclusive, so an empty range ends on the character before it starts
+        return FileEdit(filepath=filepath, range=Range.from_shorthand(position.line, position.character, position.line, position.character - 1), replacement=content)
 
 
 class FileEditWithFullContents(BaseModel):
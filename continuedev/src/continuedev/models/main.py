@@ -1,5 +1,7 @@
 from abc import ABC
-from typing import List, Union
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, List, Union
 from pydantic import BaseModel, root_validator
 from functools import total_ordering
 
@@ -24,10 +26,13 @@ class Position(BaseModel):
             return False
 
     @staticmethod
-    def from_index(string: str, index: int) -> "Position":
-        """Convert index in string to line and character"""
+    def from_index(string: str, index: int, line_index: Union["LineIndex", None] = None) -> "Position":
+        """Convert index in string to line and character. Pass a LineIndex of the string when converting many indices."""
+        if line_index is not None:
+            return line_index.position_of(index)
+
         line = string.count("\n", 0, index)
-        if line == 1:
+        if line == 0:
             character = index
         else:
             character = index - string.rindex("\n", 0, index) - 1
@@ -35,6 +40,35 @@ class Position(BaseModel):
         return Position(line=line, character=character)
 
 
+class LineIndex:
+    """The offset at which each line of a string starts, so that indices can be converted to positions by bisection
+    instead of counting newlines from the start of the string each time"""
+    __slots__ = ("line_starts", "length")
+    line_starts: List[int]
+    length: int
+
+    def __init__(self, string: str):
+        self.line_starts = list(accumulate(
+            (len(line) + 1 for line in string.split("\n")[:-1]), initial=0))
+        self.length = len(string)
+
+    def position_of(self, index: int) -> Position:
+        line = bisect_right(self.line_starts, index) - 1
+        return Position(line=line, character=index - self.line_starts[line])
+
+    def positions_of(self, indices: Iterable[int]) -> List[Position]:
+        """Convert many indices at once. They're visited in order, so each search starts from the line of the last."""
+        indices = list(indices)
+        positions: List[Union[Position, None]] = [None] * len(indices)
+        line = 0
+        for i in sorted(range(len(indices)), key=indices.__getitem__):
+            index = indices[i]
+            line = bisect_right(self.line_starts, index, line) - 1
+            positions[i] = Position(
+                line=line, character=index - self.line_starts[line])
+        return positions
+
+
 class Range(BaseModel):
     """A range in a file. 0-indexed."""
     start: Position
@@ -56,10 +90,10 @@ class Range(BaseModel):
         return not (self.end < other.start or self.start > other.end)
 
     @staticmethod
-    def from_indices(string: str, start_index: int, end_index: int) -> "Range":
+    def from_indices(string: str, start_index: int, end_index: int, line_index: Union[LineIndex, None] = None) -> "Range":
         return Range(
-            start=Position.from_index(string, start_index),
-            end=Position.from_index(string, end_index)
+            start=Position.from_index(string, start_index, line_index),
+            end=Position.from_index(string, end_index, line_index)
         )
 
     @staticmethod
@@ -76,17 +110,25 @@ class Range(BaseModel):
         )
 
     @staticmethod
-    def from_entire_file(content: str) -> "Range":
-        lines = content.splitlines()
-        if len(lines) == 0:
+    def from_entire_file(content: str, line_index: Union[LineIndex, None] = None) -> "Range":
+        if len(content) == 0:
             return Range.from_shorthand(0, 0, 0, 0)
-        return Range.from_shorthand(0, 0, len(lines) - 1, len(lines[-1]) - 1)
+        # A final line break doesn't start another line
+        end_index = len(content)
+        if content.endswith("\r\n"):
+            end_index -= 2
+        elif content.endswith("\n"):
+            end_index -= 1
+        end = Position.from_index(content, end_index, line_index)
+        return Range.from_shorthand(0, 0, end.line, end.character - 1)
 
     @staticmethod
-    def from_snippet_in_file(content: str, snippet: str) -> "Range":
+    def from_snippet_in_file(content: str, snippet: str, line_index: Union[LineIndex, None] = None) -> "Range":
+        """Range of the first occurrence of snippet in content. The end is the last character of the snippet."""
         start_index = content.index(snippet)
         end_index = start_index + len(snippet)
-        return Range.from_indices(content, start_index, end_index)
+        r = Range.from_indices(content, start_index, end_index, line_index)
+        return Range(start=r.start, end=Position(line=r.end.line, character=r.end.character - 1))
 
 
 class AbstractModel(ABC, BaseModel):
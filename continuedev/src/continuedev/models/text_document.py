@@ -0,0 +1,279 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import List, Tuple, Union
+
+from .main import Position, Range
+from .filesystem_edit import EditDiff, FileEdit
+
+# Pieces after which a document is copied back into a single string, so lookups stay fast after many edits
+MAX_PIECES = 1000
+# Characters whose newlines are counted at once when looking for a line in a string
+SCAN_CHUNK = 4096
+
+
+def newline_offsets(text: str) -> List[int]:
+    """Offsets of the newlines in text"""
+    offsets = []
+    offset = text.find("\n")
+    while offset != -1:
+        offsets.append(offset)
+        offset = text.find("\n", offset + 1)
+    return offsets
+
+
+def _offset_in_str(text: str, position: Position, end: bool = False, line: int = 0, line_start: int = 0) -> Tuple[int, int, int]:
+    """Offset of a position in text, as TextDocument.offset_at finds it, with the line the offset is on and the start
+    of that line. Lines are found from a line already known, so only the text up to the position is scanned: whole
+    chunks of it while the line is further on, counting their newlines in C, then the last newlines with str.find."""
+    if position.line < 0:
+        return 0, 0, 0
+    offset = line_start
+    while line < position.line:
+        newlines = text.count("\n", offset, offset + SCAN_CHUNK)
+        if line + newlines >= position.line or offset + SCAN_CHUNK >= len(text):
+            break
+        line += newlines
+        offset += SCAN_CHUNK
+    while line < position.line:
+        newline = text.find("\n", offset)
+        if newline == -1:
+            return len(text), line, text.rfind("\n") + 1
+        line += 1
+        offset = newline + 1
+    line_start = offset
+    line_end = text.find("\n", line_start)
+    if line_end == -1:
+        line_end = len(text)
+    elif line_end > line_start and text[line_end - 1] == "\r":
+        line_end -= 1
+    character = position.character + 1 if end else position.character
+    return min(line_start + max(character, 0), line_end), line, line_start
+
+
+def _range_offsets_in_str(text: str, range: Range) -> Tuple[int, int, int, int]:
+    """Offsets of the start and end of a range in text, and the line the start is on and that line's start"""
+    start, line, line_start = _offset_in_str(text, range.start)
+    if range.end.line >= line:
+        end, _, _ = _offset_in_str(
+            text, range.end, end=True, line=line, line_start=line_start)
+    else:
+        end, _, _ = _offset_in_str(text, range.end, end=True)
+    return start, max(start, end), line, line_start
+
+
+def read_range_in_str(text: str, range: Range) -> str:
+    """TextDocument(text).read_range(range), for text that's only read once"""
+    start, end, _, _ = _range_offsets_in_str(text, range)
+    return text[start:end]
+
+
+def apply_edit_to_str(text: str, edit: FileEdit) -> Tuple[str, EditDiff]:
+    """TextDocument(text).apply_edit(edit) and the resulting text, for text that's only edited once"""
+    start, end, line, line_start = _range_offsets_in_str(text, edit.range)
+    replacement = edit.replacement
+    # Ranges are end-inclusive, so the range of the replacement ends on its last character
+    newlines = replacement.count("\n")
+    if newlines == 0:
+        replacement_end = Position(
+            line=line, character=start - line_start + len(replacement) - 1)
+    else:
+        replacement_end = Position(line=line + newlines,
+                                   character=len(replacement) - replacement.rfind("\n") - 2)
+    return text[:start] + replacement + text[end:], EditDiff(
+        forward=edit,
+        backward=FileEdit(
+            filepath=edit.filepath,
+            range=Range(start=Position(line=line, character=start - line_start),
+                        end=replacement_end),
+            replacement=text[start:end]
+        )
+    )
+
+
+class _Piece:
+    """A slice of a string, sharing the string's newline offsets with every other piece cut from it"""
+    __slots__ = ("text", "start", "end", "newlines", "newline_count")
+    text: str
+    start: int
+    end: int
+    newlines: List[int]
+    newline_count: int
+
+    def __init__(self, text: str, start: int, end: int, newlines: List[int]):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.newlines = newlines
+        self.newline_count = bisect_left(
+            newlines, end) - bisect_left(newlines, start)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+
+class TextDocument:
+    """Text that FileEdits can be applied to without splitting or copying the whole of it, stored as a piece table.
+
+    Each edit replaces a few pieces, and positions are found by bisecting the offsets of the pieces and the newlines
+    within them, so it takes time logarithmic in the size of the text plus the number of pieces. The text is only
+    joined back into a string when it's asked for.
+
+    Ranges are end-inclusive, as in the rest of the server: the end is the last character replaced or read. Characters
+    past the end of a line are clamped to it, as the IDE does, so an end position can't reach a line's newline. To end
+    just after a newline, the end is given as character -1 of the next line, which is how ranges returned here end."""
+    _pieces: List[_Piece]
+    # Offset and number of newlines before each piece
+    _piece_starts: List[int]
+    _piece_lines: List[int]
+    _length: int
+    _newline_count: int
+    # Joined lazily after edits
+    _text: Union[str, None]
+
+    def __init__(self, text: str = ""):
+        self._pieces = []
+        self._set_text(text)
+
+    def _set_text(self, text: str):
+        self._pieces = [_Piece(text, 0, len(text), newline_offsets(text))] if len(
+            text) > 0 else []
+        self._text = text
+        self._reindex()
+
+    def _reindex(self):
+        self._piece_starts = list(accumulate(
+            [0] + [len(piece) for piece in self._pieces[:-1]]))
+        self._piece_lines = list(accumulate(
+            [0] + [piece.newline_count for piece in self._pieces[:-1]]))
+        self._length = sum(len(piece) for piece in self._pieces)
+        self._newline_count = sum(
+            piece.newline_count for piece in self._pieces)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def line_count(self) -> int:
+        return self._newline_count + 1
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(piece.text[piece.start:piece.end]
+                                 for piece in self._pieces)
+        return self._text
+
+    def _piece_at(self, offset: int) -> int:
+        """Index of the piece containing offset, or of the last piece if it's the end of the text"""
+        return max(0, bisect_right(self._piece_starts, offset) - 1)
+
+    def _newline_offset(self, k: int) -> int:
+        """Offset of the kth newline in the text"""
+        i = bisect_right(self._piece_lines, k) - 1
+        piece = self._pieces[i]
+        newline = piece.newlines[bisect_left(
+            piece.newlines, piece.start) + k - self._piece_lines[i]]
+        return self._piece_starts[i] + newline - piece.start
+
+    def line_start(self, line: int) -> int:
+        if line <= 0:
+            return 0
+        if line > self._newline_count:
+            return self._length
+        return self._newline_offset(line - 1) + 1
+
+    def line_end(self, line: int) -> int:
+        """Offset of the end of a line, before its line break"""
+        if line < 0:
+            return 0
+        if line >= self._newline_count:
+            return self._length
+        end = self._newline_offset(line)
+        # The line break is "\r\n" in files with Windows line endings
+        if end > self.line_start(line) and self.slice(end - 1, end) == "\r":
+            end -= 1
+        return end
+
+    def offset_at(self, position: Position, end: bool = False) -> int:
+        """Offset of a position, or just after it for the end of a range"""
+        if position.line > self._newline_count:
+            return self._length
+        character = position.character + 1 if end else position.character
+        return min(self.line_start(position.line) + max(character, 0), self.line_end(position.line))
+
+    def position_at(self, offset: int, end: bool = False) -> Position:
+        """Position of an offset, or of the character before it for the end of a range"""
+        offset = max(0, min(offset, self._length))
+        line = 0
+        if len(self._pieces) > 0:
+            i = self._piece_at(offset)
+            piece = self._pieces[i]
+            within = piece.start + offset - self._piece_starts[i]
+            line = self._piece_lines[i] + \
+                bisect_left(piece.newlines, within) - \
+                bisect_left(piece.newlines, piece.start)
+        character = offset - self.line_start(line)
+        return Position(line=line, character=character - 1 if end else character)
+
+    def range_at(self, start: int, end: int) -> Range:
+        """The range from offset start up to, but not including, offset end"""
+        return Range(start=self.position_at(start), end=self.position_at(end, end=True))
+
+    def slice(self, start: int, end: int) -> str:
+        if start >= end:
+            return ""
+        i = self._piece_at(start)
+        parts = []
+        while i < len(self._pieces) and self._piece_starts[i] < end:
+            piece = self._pieces[i]
+            piece_start = self._piece_starts[i]
+            parts.append(piece.text[piece.start + max(0, start - piece_start):
+                                    piece.start + min(len(piece), end - piece_start)])
+            i += 1
+        return "".join(parts)
+
+    def replace(self, start: int, end: int, text: str) -> str:
+        """Replace the text between two offsets, returning what was there"""
+        removed = self.slice(start, end)
+        middle = []
+        if len(self._pieces) == 0:
+            i = j = 0
+        else:
+            i = self._piece_at(start)
+            j = self._piece_at(end)
+            first, last = self._pieces[i], self._pieces[j]
+            if start > self._piece_starts[i]:
+                middle.append(_Piece(first.text, first.start,
+                                     first.start + start - self._piece_starts[i], first.newlines))
+        if len(text) > 0:
+            middle.append(_Piece(text, 0, len(text), newline_offsets(text)))
+        if len(self._pieces) > 0:
+            if end < self._piece_starts[j] + len(last):
+                middle.append(_Piece(last.text, last.start + end - self._piece_starts[j],
+                                     last.end, last.newlines))
+            j += 1
+        self._pieces[i:j] = middle
+
+        if len(self._pieces) > MAX_PIECES:
+            self._set_text("".join(piece.text[piece.start:piece.end]
+                                   for piece in self._pieces))
+        else:
+            self._text = None
+            self._reindex()
+        return removed
+
+    def read_range(self, range: Range) -> str:
+        start = self.offset_at(range.start)
+        return self.slice(start, max(start, self.offset_at(range.end, end=True)))
+
+    def apply_edit(self, edit: FileEdit) -> EditDiff:
+        start = self.offset_at(edit.range.start)
+        end = max(start, self.offset_at(edit.range.end, end=True))
+        original = self.replace(start, end, edit.replacement)
+        return EditDiff(
+            forward=edit,
+            backward=FileEdit(
+                filepath=edit.filepath,
+                range=self.range_at(start, start + len(edit.replacement)),
+                replacement=original
+            )
+        )
@@ -1,15 +1,17 @@
 # This is a separate server from server/main.py
 import asyncio
 import os
-from typing import Any, Dict, List, Type, TypeVar, Union
+from typing import Any, Dict, List, Tuple, Type, TypeVar, Union
 import uuid
 from fastapi import WebSocket, Body, APIRouter
 from uvicorn.main import Server
 
-from ..libs.util.queue import AsyncSubscriptionQueue
-from ..models.filesystem import FileSystem, RangeInFile, EditDiff, RealFileSystem
+from ..libs.util.queue import AsyncSubscriptionQueue, PendingRequests
+from ..libs.util.document_store import DocumentStore
+from ..models.filesystem import RangeInFile, EditDiff, RealFileSystem
 from ..models.main import Traceback
 from ..models.filesystem_edit import AddDirectory, AddFile, DeleteDirectory, DeleteFile, FileSystemEdit, FileEdit, FileEditWithFullContents, RenameDirectory, RenameFile, SequentialFileSystemEdit
+from ..models.text_document import TextDocument
 from pydantic import BaseModel
 from .notebook import SessionManager, session_manager
 from .ide_protocol import AbstractIdeProtocolServer
@@ -69,6 +71,11 @@ class ReadFileResponse(BaseModel):
     contents: str
 
 
+class ReadFilesResponse(BaseModel):
+    messageType: str = "readFiles"
+    contents: List[str]
+
+
 class EditFileResponse(BaseModel):
     messageType: str = "editFile"
     fileEdit: FileEditWithFullContents
@@ -81,14 +88,22 @@ class WorkspaceDirectoryResponse(BaseModel):
 
 T = TypeVar("T", bound=BaseModel)
 
+# Seconds to wait for the IDE to respond to a request
+REQUEST_TIMEOUT = 30
+
 
 class IdeProtocolServer(AbstractIdeProtocolServer):
     websocket: WebSocket
     session_manager: SessionManager
     sub_queue: AsyncSubscriptionQueue = AsyncSubscriptionQueue()
+    pending_requests: PendingRequests
+    documents: DocumentStore
 
     def __init__(self, session_manager: SessionManager):
         self.session_manager = session_manager
+        session_manager.ide = self
+        self.pending_requests = PendingRequests()
+        self.documents = DocumentStore()
 
     async def _send_json(self, data: Any):
         await self.websocket.send_json(data)
@@ -96,23 +111,29 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
     async def _receive_json(self, message_type: str) -> Any:
         return await self.sub_queue.get(message_type)
 
-    async def _send_and_receive_json(self, data: Any, resp_model: Type[T], message_type: str) -> T:
-        await self._send_json(data)
-        resp = await self._receive_json(message_type)
+    async def _send_and_receive_json(self, data: Any, resp_model: Type[T], message_type: str, timeout: float = REQUEST_TIMEOUT) -> T:
+        """Send a request tagged with a messageId and wait for the response with the same messageId"""
+        message_id, future = self.pending_requests.create(message_type)
+        try:
+            await self._send_json({**data, "messageId": message_id})
+            resp = await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending_requests.discard(message_id)
         return resp_model.parse_obj(resp)
 
     async def handle_json(self, data: Any):
         t = data["messageType"]
         if t == "openNotebook":
-            await self.openNotebook()
+            await self.openNotebook(data.get("sessionId"))
         elif t == "setFileOpen":
             await self.setFileOpen(data["filepath"], data["open"])
         elif t == "fileEdits":
             fileEdits = list(
                 map(lambda d: FileEditWithFullContents.parse_obj(d), data["fileEdits"]))
             self.onFileEdits(fileEdits)
-        elif t in ["highlightedCode", "openFiles", "readFile", "editFile", "workspaceDirectory"]:
-            self.sub_queue.post(t, data)
+        elif t in ["highlightedCode", "openFiles", "readFile", "readFiles", "editFile", "workspaceDirectory"]:
+            if not self.pending_requests.resolve(t, data):
+                self.sub_queue.post(t, data)
         else:
             raise ValueError("Unknown message type", t)
 
@@ -129,8 +150,9 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
             "open": open
         })
 
-    async def openNotebook(self):
-        session_id = self.session_manager.new_session(self)
+    async def openNotebook(self, session_id: Union[str, None] = None):
+        """Start a new session. The ID can be chosen by the caller, which is how the router picks the worker that owns it."""
+        session_id = self.session_manager.new_session(self, session_id)
         await self._send_json({
             "messageType": "openNotebook",
             "sessionId": session_id
@@ -176,10 +198,20 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
         pass
 
     def onFileEdits(self, edits: List[FileEditWithFullContents]):
+        # The IDE only sends the contents after the change, so agents are given the contents before it from here
+        previous_contents = {}
+        for edit in edits:
+            if edit.fileEdit.filepath not in previous_contents and (contents := self.documents.get(edit.fileEdit.filepath)) is not None:
+                previous_contents[edit.fileEdit.filepath] = contents
+
+        # The IDE sends the contents after the change, so these are always current
+        for edit in edits:
+            self.documents.set(edit.fileEdit.filepath, edit.fileContents)
+
         # Send the file edits to ALL agents.
         # Maybe not ideal behavior
         for _, session in self.session_manager.sessions.items():
-            session.agent.handle_manual_edits(edits)
+            session.agent.handle_manual_edits(edits, previous_contents)
 
     # Request information. Session doesn't matter.
     async def getOpenFiles(self) -> List[str]:
@@ -202,12 +234,35 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
 
     async def readFile(self, filepath: str) -> str:
         """Read a file"""
+        if (contents := self.documents.get(filepath)) is not None:
+            return contents
+
+        version = self.documents.version(filepath)
         resp = await self._send_and_receive_json({
             "messageType": "readFile",
             "filepath": filepath
         }, ReadFileResponse, "readFile")
+        self.documents.seed(filepath, resp.contents, version)
         return resp.contents
 
+    async def readFiles(self, filepaths: List[str]) -> List[str]:
+        """Read many files in a single round trip"""
+        contents = {filepath: self.documents.get(filepath)
+                    for filepath in filepaths}
+        missing = [filepath for filepath,
+                   c in contents.items() if c is None]
+        if len(missing) > 0:
+            versions = [self.documents.version(filepath)
+                        for filepath in missing]
+            resp = await self._send_and_receive_json({
+                "messageType": "readFiles",
+                "filepaths": missing
+            }, ReadFilesResponse, "readFiles")
+            for filepath, version, c in zip(missing, versions, resp.contents):
+                self.documents.seed(filepath, c, version)
+                contents[filepath] = c
+        return [contents[filepath] for filepath in filepaths]
+
     async def saveFile(self, filepath: str):
         """Save a file"""
         await self._send_json({
@@ -215,37 +270,69 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
             "filepath": filepath
         })
 
+    async def _text_documents(self, filepaths: List[str]) -> Dict[str, TextDocument]:
+        """The stored TextDocument of each file, reading the files that aren't stored in a single round trip"""
+        documents = {filepath: self.documents.get_text_document(filepath)
+                     for filepath in filepaths}
+        missing = [filepath for filepath,
+                   document in documents.items() if document is None]
+        if len(missing) > 0:
+            for filepath, contents in zip(missing, await self.readFiles(missing)):
+                # Reading stores the file, unless it changed while the read was in flight
+                document = self.documents.get_text_document(filepath)
+                documents[filepath] = document if document is not None else TextDocument(
+                    contents)
+        return documents
+
     async def readRangeInFile(self, range_in_file: RangeInFile) -> str:
         """Read a range in a file"""
-        full_contents = await self.readFile(range_in_file.filepath)
-        return FileSystem.read_range_in_str(full_contents, range_in_file.range)
+        documents = await self._text_documents([range_in_file.filepath])
+        return documents[range_in_file.filepath].read_range(range_in_file.range)
 
-    async def editFile(self, edit: FileEdit) -> FileEditWithFullContents:
-        """Edit a file"""
+    async def readRangesInFiles(self, range_in_files: List[RangeInFile]) -> List[str]:
+        """Read many ranges in files in a single round trip"""
+        documents = await self._text_documents(
+            list(dict.fromkeys(rif.filepath for rif in range_in_files)))
+        return [documents[rif.filepath].read_range(rif.range) for rif in range_in_files]
+
+    async def _edit_file(self, edit: FileEdit) -> Tuple[FileEditWithFullContents, EditDiff]:
         resp = await self._send_and_receive_json({
             "messageType": "editFile",
             "edit": edit.dict()
         }, EditFileResponse, "editFile")
-        return resp.fileEdit
+        # The IDE doesn't report edits we make ourselves, and responds with the contents from before the edit.
+        # Those should be what's stored, so the edit is applied to the stored document in place, unless the file
+        # isn't stored or has plainly changed without the IDE telling us.
+        document = self.documents.get_text_document(edit.filepath)
+        if document is None or len(document) != len(resp.fileEdit.fileContents):
+            self.documents.set(edit.filepath, resp.fileEdit.fileContents)
+        diff = self.documents.apply_edit(edit.filepath, resp.fileEdit.fileEdit)
+        return resp.fileEdit, diff
+
+    async def editFile(self, edit: FileEdit) -> FileEditWithFullContents:
+        """Edit a file"""
+        file_edit, _ = await self._edit_file(edit)
+        return file_edit
 
     async def applyFileSystemEdit(self, edit: FileSystemEdit) -> EditDiff:
         """Apply a file edit"""
         backward = None
         fs = RealFileSystem()
         if isinstance(edit, FileEdit):
-            file_edit = await self.editFile(edit)
-            _, diff = FileSystem.apply_edit_to_str(
-                file_edit.fileContents, file_edit.fileEdit)
+            _, diff = await self._edit_file(edit)
             backward = diff.backward
         elif isinstance(edit, AddFile):
             fs.write(edit.filepath, edit.content)
+            self.documents.set(edit.filepath, edit.content)
             backward = DeleteFile(filepath=edit.filepath)
         elif isinstance(edit, DeleteFile):
             contents = await self.readFile(edit.filepath)
             backward = AddFile(filepath=edit.filepath, content=contents)
             fs.delete_file(edit.filepath)
+            self.documents.invalidate(edit.filepath)
         elif isinstance(edit, RenameFile):
             fs.rename_file(edit.filepath, edit.new_filepath)
+            self.documents.rename(edit.filepath, edit.new_filepath)
             backward = RenameFile(filepath=edit.new_filepath,
                                   new_filepath=edit.filepath)
         elif isinstance(edit, AddDirectory):
@@ -270,6 +357,7 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
             backward = SequentialFileSystemEdit(edits=backward_edits)
         elif isinstance(edit, RenameDirectory):
             fs.rename_directory(edit.path, edit.new_path)
+            self.documents.invalidate_directory(edit.path)
             backward = RenameDirectory(path=edit.new_path, new_path=edit.path)
         elif isinstance(edit, FileSystemEdit):
             diffs = []
@@ -295,6 +383,8 @@ async def websocket_endpoint(websocket: WebSocket):
     print("Accepted websocket connection from, ", websocket.client)
     await websocket.send_json({"messageType": "connected"})
     ideProtocolServer.websocket = websocket
+    # Anything may have changed while we weren't connected
+    ideProtocolServer.documents.clear()
     while True:
         data = await websocket.receive_json()
         await ideProtocolServer.handle_json(data)
@@ -63,10 +63,18 @@ class AbstractIdeProtocolServer(ABC):
     async def readFile(self, filepath: str) -> str:
         """Read a file"""
 
+    @abstractmethod
+    async def readFiles(self, filepaths: List[str]) -> List[str]:
+        """Read many files in a single round trip"""
+
     @abstractmethod
     async def readRangeInFile(self, range_in_file: RangeInFile) -> str:
         """Read a range in a file"""
 
+    @abstractmethod
+    async def readRangesInFiles(self, range_in_files: List[RangeInFile]) -> List[str]:
+        """Read many ranges in files in a single round trip"""
+
     @abstractmethod
     async def editFile(self, edit: FileEdit):
         """Edit a file"""
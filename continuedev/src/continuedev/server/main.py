@@ -1,7 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .ide import router as ide_router
-from .notebook import router as notebook_router
+from .notebook import router as notebook_router, session_manager, completion_cache
+from ..libs.llm.openai import close_session
 import uvicorn
 import argparse
 
@@ -20,19 +21,46 @@ app.add_middleware(
 )
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    session_manager.close()
+    completion_cache.flush()
+    await close_session()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics():
+    """LLM usage, latency and cost for each session, in total and per step"""
+    return {
+        "sessions": {
+            session_id: session.metrics.dict()
+            for session_id, session in session_manager.sessions.items()
+            if session.metrics is not None
+        },
+        "completion_cache": completion_cache.stats()
+    }
+
+
 # add cli arg for server port
 parser = argparse.ArgumentParser()
 parser.add_argument("-p", "--port", help="server port", type=int, default=8000)
+parser.add_argument("-w", "--workers", help="number of worker processes, each running a share of the sessions on the ports after the server port",
+                    type=int, default=1)
 args = parser.parse_args()
 
 
 def run_server():
-    uvicorn.run(app, host="0.0.0.0", port=args.port, log_config="logging.ini")
+    if args.workers > 1:
+        from .router import run_router
+        run_router(args.port, args.workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=args.port,
+                    log_config="logging.ini")
 
 
 if __name__ == "__main__":
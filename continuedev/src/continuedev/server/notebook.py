@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, Header, WebSocket, APIRouter
+from fastapi import FastAPI, Depends, Header, WebSocket, WebSocketDisconnect, APIRouter
 from typing import Any, Dict, List, Union
 from uuid import uuid4
 from pydantic import BaseModel
@@ -11,17 +11,26 @@ from ..libs.steps.nate import ImplementAbstractMethodStep
 from ..libs.observation import Observation
 from dotenv import load_dotenv
 from ..libs.llm.openai import OpenAI
+from ..libs.llm.cache import CachedLLM, CompletionCache
+from ..libs.llm.metrics import MetricsCollector
+from ..libs.llm.utils import load_tokenizer_in_background
 from .ide_protocol import AbstractIdeProtocolServer
+from .session_store import SessionLog, SessionStore
+from .state_sync import StateSync
 import os
 import asyncio
-import nest_asyncio
-nest_asyncio.apply()
 
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
+completion_cache = CompletionCache()
 
 router = APIRouter(prefix="/notebook", tags=["notebook"])
 
+# Messages waiting to be sent to a websocket. State updates only take up one slot however many are requested.
+MAX_OUTBOX_SIZE = 100
+# Placeholder in the outbox for "send the latest state", which is computed when it's actually sent
+STATE_UPDATE = object()
+
 # Graceful shutdown by closing websockets
 original_handler = Server.handle_exit
 
@@ -43,23 +52,36 @@ class Session:
     session_id: str
     agent: Agent
     ws: Union[WebSocket, None]
-
-    def __init__(self, session_id: str, agent: Agent):
+    metrics: Union[MetricsCollector, None]
+    # Tracks what the websocket was last sent, so that updates can be sent as patches against it
+    state_sync: StateSync
+    state_version: int
+    outbox: Union[asyncio.Queue, None]
+    state_update_pending: bool
+    writer: Union[asyncio.Task, None]
+    log: Union[SessionLog, None]
+
+    def __init__(self, session_id: str, agent: Agent, metrics: Union[MetricsCollector, None] = None, log: Union[SessionLog, None] = None):
         self.session_id = session_id
         self.agent = agent
         self.ws = None
+        self.metrics = metrics
+        self.log = log
+        self.state_sync = StateSync(agent)
+        self.state_version = 0
+        self.outbox = None
+        self.state_update_pending = False
+        self.writer = None
 
 
 class DemoAgent(Agent):
     first_seen: bool = False
     cumulative_edit_string = ""
 
-    def handle_manual_edits(self, edits: List[FileEditWithFullContents]):
+    def handle_manual_edits(self, edits: List[FileEditWithFullContents], previous_contents: Union[Dict[str, str], None] = None):
+        super().handle_manual_edits(edits, previous_contents)
         for edit in edits:
             self.cumulative_edit_string += edit.fileEdit.replacement
-            self._manual_edits_buffer.append(edit)
-            # Note that you're storing a lot of unecessary data here. Can compress into EditDiffs on the spot, and merge.
-            # self._manual_edits_buffer = merge_file_edit(self._manual_edits_buffer, edit)
             # FOR DEMO PURPOSES
             if edit.fileEdit.filepath.endswith("filesystem.py") and "List" in self.cumulative_edit_string and ":" in edit.fileEdit.replacement:
                 self.cumulative_edit_string = ""
@@ -69,54 +91,158 @@ class DemoAgent(Agent):
 
 class SessionManager:
     sessions: Dict[str, Session] = {}
-    _event_loop: Union[asyncio.BaseEventLoop, None] = None
+    store: SessionStore = SessionStore()
+    # The IDE that sessions resumed after a restart are connected to
+    ide: Union[AbstractIdeProtocolServer, None] = None
 
     def get_session(self, session_id: str) -> Session:
-        if session_id not in self.sessions:
+        if session_id not in self.sessions and not self.resume_session(session_id):
             raise KeyError("Session ID not recognized")
         return self.sessions[session_id]
 
-    def new_session(self, ide: AbstractIdeProtocolServer) -> str:
+    def _create_session(self, session_id: str, ide: AbstractIdeProtocolServer, log: SessionLog, history: Union[History, None] = None) -> Session:
         cmd = "python3 /Users/natesesti/Desktop/continue/extension/examples/python/main.py"
-        agent = DemoAgent(llm=OpenAI(api_key=openai_api_key),
-                          policy=DemoPolicy(cmd=cmd), ide=ide)
-        session_id = str(uuid4())
-        session = Session(session_id=session_id, agent=agent)
+        metrics = MetricsCollector()
+        if history is None:
+            history = History.from_empty()
+        agent = DemoAgent(llm=CachedLLM(llm=OpenAI(api_key=openai_api_key, metrics=metrics), cache=completion_cache),
+                          policy=DemoPolicy(cmd=cmd), ide=ide, history=history)
+        load_tokenizer_in_background(agent.llm.default_model)
+        log.attach(agent.history)
+        session = Session(session_id=session_id, agent=agent,
+                          metrics=metrics, log=log)
         self.sessions[session_id] = session
 
         def on_update(state: FullState):
-            session_manager.send_ws_data(session_id, {
-                "messageType": "state",
-                "state": agent.get_full_state().dict()
-            })
+            session_manager.send_state(session_id)
 
         agent.on_update(on_update)
-        asyncio.create_task(agent.run_policy())
+        return session
+
+    def new_session(self, ide: AbstractIdeProtocolServer, session_id: Union[str, None] = None) -> str:
+        if session_id is None:
+            session_id = str(uuid4())
+        session = self._create_session(
+            session_id, ide, self.store.log(session_id))
+        asyncio.create_task(session.agent.run_policy())
         return session_id
 
+    def resume_session(self, session_id: str) -> bool:
+        """Rebuild a session from its log on disk, e.g. after the server restarts. Returns False if there is none."""
+        try:
+            log = self.store.log(session_id)
+        except ValueError:
+            return False
+        if self.ide is None or not log.exists():
+            return False
+        self._create_session(session_id, self.ide, log, log.load())
+        print("Resumed session", session_id)
+        return True
+
     def remove_session(self, session_id: str):
-        del self.sessions[session_id]
+        session = self.sessions.pop(session_id)
+        if session.writer is not None:
+            session.writer.cancel()
+        if session.log is not None:
+            session.log.delete()
+
+    def close(self):
+        """Snapshot every session so they resume quickly after a restart"""
+        for session in self.sessions.values():
+            if session.log is not None:
+                session.log.snapshot()
+                session.log.close()
 
     def register_websocket(self, session_id: str, ws: WebSocket):
-        self.sessions[session_id].ws = ws
+        session = self.sessions[session_id]
+        if session.writer is not None:
+            session.writer.cancel()
+        session.ws = ws
+        # A new client has nothing to patch against
+        session.state_sync.reset()
+        session.outbox = asyncio.Queue(maxsize=MAX_OUTBOX_SIZE)
+        session.state_update_pending = False
+        session.writer = asyncio.create_task(self._write_ws(session))
         print("Registered websocket for session", session_id)
 
-    def send_ws_data(self, session_id: str, data: Any):
-        if self.sessions[session_id].ws is None:
+    def unregister_websocket(self, session_id: str, ws: WebSocket):
+        """Stop sending to a websocket that has closed, unless a newer one has already replaced it"""
+        session = self.sessions.get(session_id)
+        if session is None or session.ws is not ws:
+            return
+        if session.writer is not None:
+            session.writer.cancel()
+        session.ws = None
+        session.outbox = None
+        session.writer = None
+        session.state_update_pending = False
+        print("Unregistered websocket for session", session_id)
+
+    async def _write_ws(self, session: Session):
+        """Send everything put in the session's outbox, in order, until the websocket fails"""
+        while True:
+            data = await session.outbox.get()
+            if data is STATE_UPDATE:
+                # Any updates requested from here on need a new message
+                session.state_update_pending = False
+                data = self.state_message(session.session_id)
+                if data is None:
+                    continue
+            try:
+                await session.ws.send_json(data)
+            except Exception as e:
+                print(f"Stopped sending to websocket for session {session.session_id}:", e)
+                return
+
+    def state_message(self, session_id: str) -> Union[dict, None]:
+        """Return the message that brings the client up to date: the full state if it has none, otherwise a patch against what it was last sent. Returns None if nothing changed."""
+        session = self.sessions[session_id]
+        patch = session.state_sync.patch()
+        if patch is None:
+            message = {
+                "messageType": "state",
+                "state": session.state_sync.full_state(),
+                "version": session.state_version + 1
+            }
+        elif len(patch) == 0:
+            return None
+        else:
+            message = {
+                "messageType": "stateDelta",
+                "baseVersion": session.state_version,
+                "version": session.state_version + 1,
+                "patch": patch
+            }
+        session.state_version += 1
+        return message
+
+    def send_state(self, session_id: str):
+        """Queue an update of the client's state. Updates requested before the last one is sent are coalesced into it."""
+        session = self.sessions[session_id]
+        if session.ws is None:
             print(f"Session {session_id} has no websocket")
             return
+        if session.state_update_pending:
+            return
+        if self._enqueue(session, STATE_UPDATE):
+            session.state_update_pending = True
 
-        async def a():
-            await self.sessions[session_id].ws.send_json(data)
+    def send_ws_data(self, session_id: str, data: Any):
+        """Queue data to be sent to the websocket without waiting for it to be sent"""
+        session = self.sessions[session_id]
+        if session.ws is None:
+            print(f"Session {session_id} has no websocket")
+            return
+        self._enqueue(session, data)
 
-        # Run coroutine in background
-        if self._event_loop is None or self._event_loop.is_closed():
-            self._event_loop = asyncio.new_event_loop()
-            self._event_loop.run_until_complete(a())
-            self._event_loop.close()
-        else:
-            self._event_loop.run_until_complete(a())
-            self._event_loop.close()
+    def _enqueue(self, session: Session, data: Any) -> bool:
+        try:
+            session.outbox.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            print(
+                f"Dropping message for session {session.session_id}, the websocket isn't keeping up")
+            return False
 
 
 session_manager = SessionManager()
@@ -143,41 +269,51 @@ async def websocket_endpoint(websocket: WebSocket, session: Session = Depends(we
     await websocket.accept()
 
     session_manager.register_websocket(session.session_id, websocket)
-    data = await websocket.receive_text()
-    # Update any history that may have happened before connection
-    await websocket.send_json({
-        "messageType": "state",
-        "state": session_manager.get_session(session.session_id).agent.get_full_state().dict()
-    })
-    print("Session started", data)
-    while AppStatus.should_exit is False:
-        data = await websocket.receive_json()
-        print("Received data", data)
-
-        if "messageType" not in data:
-            continue
-        messageType = data["messageType"]
-
+    try:
+        data = await websocket.receive_text()
+        # Update any history that may have happened before connection
+        session_manager.send_state(session.session_id)
+        print("Session started", data)
+        while AppStatus.should_exit is False:
+            # Raises WebSocketDisconnect when the client goes away
+            data = await websocket.receive_json()
+            print("Received data", data)
+
+            if "messageType" not in data:
+                continue
+            messageType = data["messageType"]
+
+            try:
+                if messageType == "main_input":
+                    # Do something with user input
+                    asyncio.create_task(
+                        session.agent.accept_user_input(data["value"]))
+                elif messageType == "step_user_input":
+                    asyncio.create_task(
+                        session.agent.give_user_input(data["value"], data["index"]))
+                elif messageType == "refinement_input":
+                    asyncio.create_task(
+                        session.agent.accept_refinement_input(data["value"], data["index"]))
+                elif messageType == "reverse":
+                    # Reverse the history to the given index
+                    asyncio.create_task(
+                        session.agent.reverse_to_index(data["index"]))
+                elif messageType == "resync":
+                    # The client missed or couldn't apply a patch, so send it the full state
+                    session.state_sync.reset()
+                    session_manager.send_state(session.session_id)
+            except Exception as e:
+                print(e)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        print("Closing websocket")
+        session_manager.unregister_websocket(session.session_id, websocket)
         try:
-            if messageType == "main_input":
-                # Do something with user input
-                asyncio.create_task(
-                    session.agent.accept_user_input(data["value"]))
-            elif messageType == "step_user_input":
-                asyncio.create_task(
-                    session.agent.give_user_input(data["value"], data["index"]))
-            elif messageType == "refinement_input":
-                asyncio.create_task(
-                    session.agent.accept_refinement_input(data["value"], data["index"]))
-            elif messageType == "reverse":
-                # Reverse the history to the given index
-                asyncio.create_task(
-                    session.agent.reverse_to_index(data["index"]))
-        except Exception as e:
-            print(e)
-
-    print("Closing websocket")
-    await websocket.close()
+            await websocket.close()
+        except Exception:
+            # Already closed by the client
+            pass
 
 
 @router.post("/run")
@@ -188,8 +324,8 @@ def request_run(step: Step, session=Depends(session)):
 
 
 @router.get("/history")
-def get_history(session=Depends(session)) -> History:
-    return session.agent.history
+def get_history(session=Depends(session)) -> dict:
+    return session.agent.history.dict()
 
 
 @router.post("/observation")
@@ -0,0 +1,278 @@
+"""Runs the server as several worker processes, with each session pinned to one worker.
+
+The router is the only process the IDE and notebooks talk to. It forwards notebook websockets and HTTP requests to
+the worker that owns the session, and stands in for the IDE on each worker's /ide/ws: requests from workers are
+passed on to the IDE, and the IDE's responses are sent back to the worker that asked, by messageId. IDEs that don't
+echo messageId are assumed to answer requests of each type in the order they were made, so such a response goes to the
+worker with the oldest request of its type still waiting, as PendingRequests does within a worker."""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple, Union
+from urllib.parse import quote
+from uuid import uuid4
+
+import aiohttp
+import uvicorn
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+
+DEFAULT_REGISTRY_PATH = os.path.join(
+    os.path.expanduser("~"), ".continue", "sessions", "registry.db")
+# Seconds to keep trying to connect to a worker that is still starting up
+WORKER_CONNECT_TIMEOUT = 30
+# Number of IDE requests whose worker is remembered while waiting for a response
+MAX_PENDING_REQUESTS = 10000
+
+
+class SessionRegistry:
+    """Which worker each session was created on, kept on disk so that sessions resumed after a restart go back to the worker that has their log"""
+    path: str
+
+    def __init__(self, path: str = DEFAULT_REGISTRY_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            worker INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )""")
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Union[int, None]:
+        row = self._conn.execute(
+            "SELECT worker FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, session_id: str, worker: int):
+        self._conn.execute("INSERT OR REPLACE INTO sessions (session_id, worker, created_at) VALUES (?, ?, ?)",
+                           (session_id, worker, time.time()))
+        self._conn.commit()
+
+
+def hash_worker(session_id: str, workers: int) -> int:
+    # Python's hash() is randomized per process, so use a stable one
+    return int(hashlib.sha1(session_id.encode("utf-8")).hexdigest(), 16) % workers
+
+
+class Router:
+    worker_ports: List[int]
+    registry: SessionRegistry
+    ide: Union[WebSocket, None]
+    _worker_sockets: Dict[int, aiohttp.ClientWebSocketResponse]
+    # Worker that sent each IDE request still waiting for a response, and the request's type, by messageId, oldest first
+    _pending_requests: "OrderedDict[str, Tuple[int, str]]"
+
+    def __init__(self, worker_ports: List[int], registry: SessionRegistry):
+        self.worker_ports = worker_ports
+        self.registry = registry
+        self.ide = None
+        self._worker_sockets = {}
+        self._pending_requests = OrderedDict()
+        self._ide_send_lock = asyncio.Lock()
+        self._http = None
+
+    def owner(self, session_id: str) -> int:
+        worker = self.registry.get(session_id)
+        if worker is None or worker >= len(self.worker_ports):
+            worker = hash_worker(session_id, len(self.worker_ports))
+        return worker
+
+    def worker_url(self, worker: int, path: str, scheme: str = "http") -> str:
+        return f"{scheme}://127.0.0.1:{self.worker_ports[worker]}{path}"
+
+    def http(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+
+    async def _connect_worker(self, worker: int, path: str) -> aiohttp.ClientWebSocketResponse:
+        deadline = time.time() + WORKER_CONNECT_TIMEOUT
+        while True:
+            try:
+                return await self.http().ws_connect(self.worker_url(worker, path, "ws"))
+            except aiohttp.ClientConnectionError:
+                if time.time() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+    # IDE
+
+    async def send_to_ide(self, data: Any):
+        async with self._ide_send_lock:
+            await self.ide.send_json(data)
+
+    async def _forward_from_worker(self, worker: int, ws: aiohttp.ClientWebSocketResponse):
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            data = msg.json()
+            if data.get("messageType") == "connected":
+                continue
+            if (message_id := data.get("messageId")) is not None:
+                self._pending_requests[message_id] = (
+                    worker, data.get("messageType"))
+                if len(self._pending_requests) > MAX_PENDING_REQUESTS:
+                    self._pending_requests.popitem(last=False)
+            await self.send_to_ide(data)
+
+    async def _send_to_worker(self, worker: int, data: Any):
+        await self._worker_sockets[worker].send_json(data)
+
+    def _request_worker(self, data: Any) -> Union[int, None]:
+        """The worker waiting for a response from the IDE, or None if it isn't a response to a request"""
+        message_id = data.get("messageId")
+        if message_id is None:
+            # Answered in order, so it's for the oldest request of this type
+            message_id = next((pending_id for pending_id, (_, t) in self._pending_requests.items()
+                               if t == data.get("messageType")), None)
+        if message_id is None or message_id not in self._pending_requests:
+            return None
+        worker, _ = self._pending_requests.pop(message_id)
+        return worker
+
+    async def handle_ide_message(self, data: Any):
+        t = data.get("messageType")
+        if t == "openNotebook":
+            # Choose the session ID here so the session can be created on the worker that will own it
+            session_id = str(uuid4())
+            worker = hash_worker(session_id, len(self.worker_ports))
+            self.registry.set(session_id, worker)
+            await self._send_to_worker(worker, {**data, "sessionId": session_id})
+        elif (worker := self._request_worker(data)) is not None:
+            await self._send_to_worker(worker, data)
+        else:
+            # Updates like fileEdits are relevant to every session
+            await asyncio.gather(*[self._send_to_worker(worker, data) for worker in self._worker_sockets])
+
+    async def serve_ide(self, websocket: WebSocket):
+        await websocket.accept()
+        self.ide = websocket
+        await websocket.send_json({"messageType": "connected"})
+
+        for ws in self._worker_sockets.values():
+            await ws.close()
+        self._worker_sockets = {worker: await self._connect_worker(worker, "/ide/ws")
+                                for worker in range(len(self.worker_ports))}
+        forwarders = [asyncio.create_task(self._forward_from_worker(worker, ws))
+                      for worker, ws in self._worker_sockets.items()]
+        try:
+            while True:
+                await self.handle_ide_message(await websocket.receive_json())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in forwarders:
+                task.cancel()
+
+    # Notebooks
+
+    async def serve_notebook(self, websocket: WebSocket, session_id: str):
+        await websocket.accept()
+        worker_ws = await self._connect_worker(self.owner(session_id), "/notebook/ws?session_id=" + quote(session_id))
+
+        async def from_worker():
+            async for msg in worker_ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                await websocket.send_text(msg.data)
+
+        async def to_worker():
+            while True:
+                await worker_ws.send_str(await websocket.receive_text())
+
+        tasks = [asyncio.create_task(from_worker()),
+                 asyncio.create_task(to_worker())]
+        try:
+            # When either side closes, close the other
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # The side that closed usually ends with WebSocketDisconnect, which is how it's expected to end
+                if not task.cancelled():
+                    task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await worker_ws.close()
+
+    async def forward_http(self, request: Request, worker: int) -> Response:
+        headers = {k: v for k, v in request.headers.items() if k.lower()
+                   not in ("host", "content-length")}
+        async with self.http().request(request.method, self.worker_url(worker, request.url.path),
+                                       params=request.query_params, headers=headers, data=await request.body()) as resp:
+            return Response(content=await resp.read(), status_code=resp.status,
+                            media_type=resp.headers.get("content-type"))
+
+
+def create_app(router: Router) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await router.close()
+
+    @app.websocket("/ide/ws")
+    async def ide_websocket(websocket: WebSocket):
+        await router.serve_ide(websocket)
+
+    @app.websocket("/notebook/ws")
+    async def notebook_websocket(websocket: WebSocket, session_id: str):
+        await router.serve_notebook(websocket, session_id)
+
+    @app.api_route("/notebook/{path:path}", methods=["GET", "POST"])
+    async def notebook_http(request: Request):
+        session_id = request.headers.get("x-continue-session-id", "anonymous")
+        return await router.forward_http(request, router.owner(session_id))
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @app.get("/metrics")
+    async def metrics():
+        async def worker_metrics(worker: int):
+            async with router.http().get(router.worker_url(worker, "/metrics")) as resp:
+                return await resp.json()
+        return {"workers": await asyncio.gather(*[worker_metrics(worker) for worker in range(len(router.worker_ports))])}
+
+    return app
+
+
+def _run_worker(port: int):
+    uvicorn.run("continuedev.server.main:app", host="127.0.0.1",
+                port=port, log_config="logging.ini")
+
+
+def run_router(port: int, workers: int):
+    """Serve on the given port, with the sessions spread over the given number of worker processes on the ports after it"""
+    worker_ports = [port + 1 + i for i in range(workers)]
+    processes = [multiprocessing.Process(target=_run_worker, args=(worker_port,), daemon=True)
+                 for worker_port in worker_ports]
+    for process in processes:
+        process.start()
+
+    try:
+        uvicorn.run(create_app(Router(worker_ports, SessionRegistry())),
+                    host="0.0.0.0", port=port, log_config="logging.ini")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
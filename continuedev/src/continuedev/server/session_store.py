@@ -0,0 +1,304 @@
+import importlib
+import json
+import os
+import uuid
+from typing import Any, Dict, IO, Iterator, Tuple, Union
+from pydantic.json import pydantic_encoder
+
+from ..libs.core import History, HistoryNode, Step
+from ..libs.observation import Observation, ParallelObservation
+from ..models.filesystem_edit import EditDiff, FileSystemEdit, SequentialFileSystemEdit
+
+DEFAULT_SESSIONS_DIR = os.path.join(
+    os.path.expanduser("~"), ".continue", "sessions")
+# Number of events after which the log is compacted into a snapshot
+SNAPSHOT_EVERY = 200
+
+
+def _class_path(cls: type) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _load_class(path: str, base: type) -> type:
+    """Import a class by the path from _class_path, falling back to base if it no longer exists"""
+    module_name, _, name = path.rpartition(".")
+    try:
+        cls = getattr(importlib.import_module(module_name), name)
+    except (ImportError, AttributeError, ValueError):
+        return base
+    return cls if isinstance(cls, type) and issubclass(cls, base) else base
+
+
+def _edit_record(edit: Union[FileSystemEdit, EditDiff]) -> dict:
+    """An edit or diff with the class of every edit in it, since FileSystemEdit is abstract and can't be parsed back
+    from the fields of its subclasses"""
+    if isinstance(edit, EditDiff):
+        return {"forward": _edit_record(edit.forward), "backward": _edit_record(edit.backward)}
+    if isinstance(edit, SequentialFileSystemEdit):
+        return {"edits": [_edit_record(e) for e in edit.edits]}
+    return {"class": _class_path(edit.__class__), "data": json.loads(json.dumps(edit.dict(), default=pydantic_encoder))}
+
+
+def _load_edit(record: dict) -> Union[FileSystemEdit, EditDiff]:
+    if "forward" in record:
+        return EditDiff(forward=_load_edit(record["forward"]), backward=_load_edit(record["backward"]))
+    if "edits" in record:
+        return SequentialFileSystemEdit(edits=[_load_edit(e) for e in record["edits"]])
+    return _load_class(record["class"], FileSystemEdit).parse_obj(record["data"])
+
+
+def _edit_attributes(step: Step) -> Iterator[Tuple[str, Union[FileSystemEdit, EditDiff]]]:
+    """The step's fields and private attributes that hold edits, which reversing the step needs"""
+    for name in [*step.__fields__, *step.__private_attributes__]:
+        value = getattr(step, name, None)
+        if isinstance(value, (FileSystemEdit, EditDiff)):
+            yield name, value
+
+
+class StepRecord:
+    """A step as stored on disk, parsed into a Step the first time it's needed"""
+    __slots__ = ("step_class", "data", "edits")
+    step_class: str
+    data: Dict[str, Any]
+    # Records of the attributes holding edits, by name
+    edits: Dict[str, dict]
+
+    def __init__(self, step_class: str, data: Dict[str, Any], edits: Union[Dict[str, dict], None] = None):
+        self.step_class = step_class
+        self.data = data
+        self.edits = edits or {}
+
+    @staticmethod
+    def from_step(step: Step) -> "StepRecord":
+        data = step.dict()
+        try:
+            data = json.loads(json.dumps(data, default=pydantic_encoder))
+            edits = {name: _edit_record(value)
+                     for name, value in _edit_attributes(step)}
+        except (TypeError, ValueError):
+            # Keep enough to show the step if its fields can't be stored
+            return StepRecord(_class_path(Step), {"name": step.name, "description": data.get("description")})
+        return StepRecord(_class_path(step.__class__), data, edits)
+
+    def load(self) -> Step:
+        cls = _load_class(self.step_class, Step)
+        try:
+            edits = {name: _load_edit(record)
+                     for name, record in self.edits.items()}
+            step = cls.parse_obj({**self.data, **{name: value for name, value in edits.items()
+                                                  if not name.startswith("_")}})
+            for name, value in edits.items():
+                if name.startswith("_"):
+                    setattr(step, name, value)
+        except Exception:
+            step = Step(name=self.data.get("name"))
+        description = self.data.get("description")
+        if description is not None and description != step.name:
+            step._set_description(description)
+        return step
+
+    def dict(self) -> Dict[str, Any]:
+        return self.data
+
+
+def _observation_record(observation: Union[Observation, None]) -> Union[dict, None]:
+    if observation is None:
+        return None
+    if isinstance(observation, ParallelObservation):
+        # Recorded one by one, since their classes would be lost in the parent's dict
+        return {"class": _class_path(observation.__class__),
+                "observations": [_observation_record(o) for o in observation.observations]}
+    return {"class": _class_path(observation.__class__), "data": observation.dict()}
+
+
+def _load_observation(record: Union[dict, None]) -> Union[Observation, None]:
+    if record is None:
+        return None
+    try:
+        if "observations" in record:
+            return ParallelObservation(observations=[_load_observation(o) for o in record["observations"]])
+        return _load_class(record["class"], Observation).parse_obj(record["data"])
+    except Exception:
+        return None
+
+
+def _node_record(node: HistoryNode) -> dict:
+    step = node._step if isinstance(
+        node._step, StepRecord) else StepRecord.from_step(node._step)
+    return {
+        "step_class": step.step_class,
+        "step": step.data,
+        "edits": step.edits,
+        "observation": _observation_record(node.observation),
+        "depth": node.depth
+    }
+
+
+def _load_node(record: dict) -> HistoryNode:
+    return HistoryNode(step=StepRecord(record["step_class"], record["step"], record.get("edits")),
+                       observation=_load_observation(record["observation"]), depth=record["depth"])
+
+
+class SessionLog:
+    """Append-only log of the changes to one session's History on disk, compacted into a snapshot every so often.
+
+    Every event is numbered, and the snapshot records the number of the last event it includes, so events that
+    were written to the log before a snapshot but not yet truncated from it aren't applied twice."""
+    log_path: str
+    snapshot_path: str
+    snapshot_every: int
+    _seq: int
+    _events_since_snapshot: int
+    _history: Union[History, None]
+    _file: Union[IO, None]
+
+    def __init__(self, directory: str, session_id: str, snapshot_every: int = SNAPSHOT_EVERY):
+        self.log_path = os.path.join(directory, f"{session_id}.log")
+        self.snapshot_path = os.path.join(
+            directory, f"{session_id}.snapshot.json")
+        self.snapshot_every = snapshot_every
+        self._seq = 0
+        self._events_since_snapshot = 0
+        self._history = None
+        self._file = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.log_path)
+
+    def attach(self, history: History):
+        """Record every future change to the history"""
+        self._history = history
+        history.add_listener(self._on_event)
+        # Start a resumed session from a fresh snapshot, which also drops a line left incomplete by a crash
+        if self._events_since_snapshot > 0:
+            self.snapshot()
+
+    def _on_event(self, event: str, data: dict):
+        if event == "live_observation":
+            # Replaced by the step's result when it finishes
+            return
+        record = {"seq": self._seq + 1, "event": event}
+        if event == "add":
+            record["node"] = _node_record(data["node"])
+            record["index"] = data["index"]
+        elif event == "observation":
+            record["observation"] = _observation_record(data["observation"])
+            record["index"] = data["index"]
+            # Steps like FileSystemEditStep only know their diff once they've run, which is when this is set
+            step = self._history.timeline[data["index"]]._step
+            if not isinstance(step, StepRecord):
+                edits = {name: _edit_record(value)
+                         for name, value in _edit_attributes(step)}
+                if len(edits) > 0:
+                    record["edits"] = edits
+        elif event == "remove":
+            # Always the current node and its substeps
+            pass
+        else:
+            record.update(data)
+
+        if self._file is None:
+            self._file = open(self.log_path, "a")
+        self._file.write(json.dumps(record, default=pydantic_encoder) + "\n")
+        self._file.flush()
+        self._seq += 1
+
+        self._events_since_snapshot += 1
+        if self._events_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """Write the whole history to the snapshot file and empty the log"""
+        if self._history is None:
+            return
+        snapshot = {
+            "seq": self._seq,
+            "current_index": self._history.current_index,
+            "timeline": [_node_record(node) for node in self._history.timeline]
+        }
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f, default=pydantic_encoder)
+        os.replace(tmp_path, self.snapshot_path)
+
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.log_path, "w")
+        self._events_since_snapshot = 0
+
+    def load(self) -> History:
+        """Rebuild the history from the snapshot and the events logged after it. Steps are parsed lazily."""
+        history = History.from_empty()
+        self._seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            for record in snapshot["timeline"]:
+                history.add_node(_load_node(record))
+            history.current_index = snapshot["current_index"]
+            self._seq = snapshot["seq"]
+
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # The last line may be incomplete if the server died while writing it
+                        break
+                    if record["seq"] <= self._seq:
+                        continue
+                    self._apply(history, record)
+                    self._seq = record["seq"]
+                    self._events_since_snapshot += 1
+        return history
+
+    def _apply(self, history: History, record: dict):
+        event = record["event"]
+        if event == "add":
+            history.add_node(_load_node(record["node"]), record.get("index"))
+        elif event == "remove":
+            history.remove_current_and_substeps()
+        elif event == "index":
+            history.current_index = record["current_index"]
+        elif event == "observation":
+            index = record.get("index", history.current_index)
+            node = history.timeline[index]
+            node.observation = _load_observation(record["observation"])
+            if "edits" in record:
+                if isinstance(node._step, StepRecord):
+                    node._step.edits.update(record["edits"])
+                else:
+                    for name, edit_record in record["edits"].items():
+                        setattr(node._step, name, _load_edit(edit_record))
+        elif event == "description":
+            node = history.timeline[record["index"]]
+            if isinstance(node._step, StepRecord):
+                node._step.data["description"] = record["description"]
+            else:
+                node._step._set_description(record["description"])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def delete(self):
+        self.close()
+        for path in [self.log_path, self.snapshot_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SessionStore:
+    """Where the SessionLog of each session is kept"""
+    directory: str
+
+    def __init__(self, directory: str = DEFAULT_SESSIONS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def log(self, session_id: str) -> SessionLog:
+        # Session IDs come from clients, so make sure they can't point outside the directory
+        uuid.UUID(session_id)
+        return SessionLog(self.directory, session_id)
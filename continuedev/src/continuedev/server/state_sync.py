@@ -0,0 +1,107 @@
+from typing import Any, Dict, List, Tuple, Union
+
+from ..libs.core import Agent, HistoryNode
+from ..libs.util.json_patch import make_patch
+
+
+class StateSync:
+    """Builds the JSON patches that bring a client's copy of an agent's FullState up to date.
+
+    Rather than serializing and comparing the whole state on every update, it follows the changes reported by the
+    agent's History: nodes added and removed are patched in as they were, and only the nodes whose observation or
+    description changed are serialized again and compared with what the client was last sent."""
+    _agent: Agent
+    # Whether the client has a state to patch, which it doesn't until it's been sent a full one
+    _synced: bool
+    # Nodes added and removed since the last patch, in order: ("add", index, [node]) or ("remove", index, nodes)
+    _changes: List[Tuple[str, int, List[HistoryNode]]]
+    _dirty: List[HistoryNode]
+    # The client's copy of each node, to patch changed nodes against
+    _sent_nodes: Dict[HistoryNode, dict]
+    _sent_current_index: int
+    _sent_active: bool
+    _sent_user_input_queue: List[str]
+
+    def __init__(self, agent: Agent):
+        self._agent = agent
+        self._synced = False
+        self._changes = []
+        self._dirty = []
+        self._sent_nodes = {}
+        agent.history.add_listener(self._on_event)
+
+    def _on_event(self, event: str, data: dict):
+        if not self._synced:
+            return
+        if event == "add":
+            self._changes.append(("add", data["index"], [data["node"]]))
+        elif event == "remove":
+            self._changes.append(("remove", data["index"], data["nodes"]))
+        elif event in ("observation", "live_observation", "description"):
+            self._dirty.append(self._agent.history.timeline[data["index"]])
+
+    def reset(self):
+        """Forget the client's state, e.g. when a new client connects or one misses a patch"""
+        self._synced = False
+        self._changes = []
+        self._dirty = []
+        self._sent_nodes = {}
+
+    def full_state(self) -> dict:
+        """The whole state, which the client starts from, and which later patches are made against"""
+        state = self._agent.get_full_state().dict()
+        self._changes = []
+        self._dirty = []
+        self._sent_nodes = dict(
+            zip(self._agent.history.timeline, state["history"]["timeline"]))
+        self._sent_current_index = state["history"]["current_index"]
+        self._sent_active = state["active"]
+        self._sent_user_input_queue = list(state["user_input_queue"])
+        self._synced = True
+        return state
+
+    def patch(self) -> Union[List[Dict[str, Any]], None]:
+        """A patch from the state the client was last sent to the current state, or None if it needs the full state"""
+        if not self._synced:
+            return None
+        history = self._agent.history
+        patch = []
+        added = set()
+        for change, index, nodes in self._changes:
+            if change == "add":
+                node_dict = nodes[0].dict()
+                self._sent_nodes[nodes[0]] = node_dict
+                added.add(nodes[0])
+                patch.append({"op": "add", "path": f"/history/timeline/{index}", "value": node_dict})
+            else:
+                # Remove from the end so earlier indices stay valid
+                for i in reversed(range(len(nodes))):
+                    self._sent_nodes.pop(nodes[i], None)
+                    patch.append(
+                        {"op": "remove", "path": f"/history/timeline/{index + i}"})
+        self._changes = []
+
+        for node in dict.fromkeys(self._dirty):
+            if node in added or node not in self._sent_nodes:
+                # Sent whole just now, or since removed
+                continue
+            node_dict = node.dict()
+            patch += make_patch(self._sent_nodes[node], node_dict,
+                                f"/history/timeline/{history.index_of(node)}")
+            self._sent_nodes[node] = node_dict
+        self._dirty = []
+
+        if history.current_index != self._sent_current_index:
+            self._sent_current_index = history.current_index
+            patch.append({"op": "replace", "path": "/history/current_index",
+                          "value": history.current_index})
+        state = self._agent.get_full_state()
+        if state.active != self._sent_active:
+            self._sent_active = state.active
+            patch.append(
+                {"op": "replace", "path": "/active", "value": state.active})
+        if state.user_input_queue != self._sent_user_input_queue:
+            self._sent_user_input_queue = list(state.user_input_queue)
+            patch.append({"op": "replace", "path": "/user_input_queue",
+                          "value": self._sent_user_input_queue})
+        return patch
@@ -0,0 +1,116 @@
+from typing import Dict, List
+
+import pytest
+
+from continuedev.libs.core import Agent, History, Policy
+from continuedev.libs.llm import LLM, utils
+from continuedev.models.filesystem import FileSystem, RangeInFile
+from continuedev.models.filesystem_edit import EditDiff, FileEdit, FileSystemEdit
+from continuedev.server.ide_protocol import AbstractIdeProtocolServer
+
+
+@pytest.fixture
+def word_tokenizer(monkeypatch):
+    """Count each whitespace-separated word as a token, instead of loading a real tokenizer"""
+    tokenizer = utils.Tokenizer(lambda text: text.split(),
+                                lambda texts: [text.split() for text in texts])
+    monkeypatch.setattr(utils, "_tokenizers", {
+        family: tokenizer for family in utils.TOKENIZER_LOADERS})
+    monkeypatch.setattr(utils, "_token_counts", utils.OrderedDict())
+    return tokenizer
+
+
+class FakeIde(AbstractIdeProtocolServer):
+    """An IDE whose files are a dict, which steps read and edit through the usual protocol methods"""
+    files: Dict[str, str]
+
+    def __init__(self, files: Dict[str, str]):
+        self.files = files
+
+    async def handle_json(self, data):
+        pass
+
+    def showSuggestion(self):
+        pass
+
+    async def getWorkspaceDirectory(self) -> str:
+        return "/"
+
+    async def setFileOpen(self, filepath: str, open: bool = True):
+        pass
+
+    async def openNotebook(self):
+        pass
+
+    async def showSuggestionsAndWait(self, suggestions: List[FileEdit]) -> bool:
+        return True
+
+    def onAcceptRejectSuggestion(self, suggestionId: str, accepted: bool):
+        pass
+
+    def onTraceback(self, traceback):
+        pass
+
+    def onFileSystemUpdate(self, update: FileSystemEdit):
+        pass
+
+    def onCloseNotebook(self, session_id: str):
+        pass
+
+    def onOpenNotebookRequest(self):
+        pass
+
+    async def getOpenFiles(self) -> List[str]:
+        return list(self.files)
+
+    async def getHighlightedCode(self) -> List[RangeInFile]:
+        return []
+
+    async def readFile(self, filepath: str) -> str:
+        return self.files[filepath]
+
+    async def readFiles(self, filepaths: List[str]) -> List[str]:
+        return [self.files[filepath] for filepath in filepaths]
+
+    async def readRangeInFile(self, range_in_file: RangeInFile) -> str:
+        return FileSystem.read_range_in_str(self.files[range_in_file.filepath], range_in_file.range)
+
+    async def readRangesInFiles(self, range_in_files: List[RangeInFile]) -> List[str]:
+        return [await self.readRangeInFile(range_in_file) for range_in_file in range_in_files]
+
+    async def editFile(self, edit: FileEdit):
+        await self.applyFileSystemEdit(edit)
+
+    async def applyFileSystemEdit(self, edit: FileSystemEdit) -> EditDiff:
+        if isinstance(edit, FileEdit):
+            self.files[edit.filepath], diff = FileSystem.apply_edit_to_str(
+                self.files[edit.filepath], edit)
+            return diff
+        return EditDiff.from_sequence([await self.applyFileSystemEdit(e) for e in edit.next_edit()])
+
+    async def saveFile(self, filepath: str):
+        pass
+
+
+class FakeLLM(LLM):
+    """Fails if a completion is requested, for steps that don't use one"""
+
+    def with_system_message(self, system_message):
+        return self
+
+
+class StopPolicy(Policy):
+    """Runs only the step it's given"""
+
+    def next(self, history: History = History.from_empty()):
+        return None
+
+
+@pytest.fixture
+def ide() -> FakeIde:
+    return FakeIde({})
+
+
+@pytest.fixture
+def agent(ide: FakeIde) -> Agent:
+    return Agent(llm=FakeLLM(), policy=StopPolicy(), ide=ide)
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from continuedev.libs.util.batch import BatchExecutor, PartialBatchError
+
+
+class Flaky(Exception):
+    pass
+
+
+def test_results_in_order_with_bounded_concurrency():
+    running = 0
+    most_running = 0
+
+    async def double(x: int) -> int:
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        # Later items finish first
+        await asyncio.sleep(0.001 * (10 - x))
+        running -= 1
+        return x * 2
+
+    executor = BatchExecutor(max_concurrency=3)
+    assert asyncio.run(executor.run(double, list(range(10)))) == [
+        x * 2 for x in range(10)]
+    assert most_running == 3
+
+
+def test_retryable_errors_are_retried():
+    attempts = {}
+
+    async def flaky(x: int) -> int:
+        attempts[x] = attempts.get(x, 0) + 1
+        if attempts[x] < 3:
+            raise Flaky()
+        return x
+
+    executor = BatchExecutor(base_delay=0, is_retryable=lambda e: isinstance(e, Flaky))
+    assert asyncio.run(executor.run(flaky, [1, 2])) == [1, 2]
+    assert attempts == {1: 3, 2: 3}
+
+
+def test_failures_keep_successful_results():
+    async def fail_odd(x: int) -> int:
+        if x % 2 == 1:
+            raise ValueError(x)
+        return x
+
+    executor = BatchExecutor(base_delay=0, is_retryable=lambda e: isinstance(e, Flaky))
+    with pytest.raises(PartialBatchError) as info:
+        asyncio.run(executor.run(fail_odd, [0, 1, 2, 3]))
+    assert info.value.results == [0, None, 2, None]
+    assert sorted(info.value.errors) == [1, 3]
+
+
+def test_retries_are_limited():
+    attempts = 0
+
+    async def always_flaky(x: int) -> int:
+        nonlocal attempts
+        attempts += 1
+        raise Flaky()
+
+    executor = BatchExecutor(max_retries=2, base_delay=0,
+                             is_retryable=lambda e: isinstance(e, Flaky))
+    with pytest.raises(PartialBatchError):
+        asyncio.run(executor.run(always_flaky, [0]))
+    assert attempts == 3
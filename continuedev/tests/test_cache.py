@@ -0,0 +1,86 @@
+import asyncio
+import sqlite3
+import time
+
+from continuedev.libs.llm import LLM
+from continuedev.libs.llm import cache as cache_module
+from continuedev.libs.llm.cache import CachedLLM, CompletionCache
+
+
+class CountingLLM(LLM):
+    calls: int = 0
+
+    async def acomplete(self, prompt: str, **kwargs) -> str:
+        self.calls += 1
+        return f"{prompt} {self.calls}"
+
+    def edit(self, inp: str, instruction: str) -> str:
+        return inp + instruction
+
+    async def parallel_edit(self, inputs, instructions, **kwargs):
+        return [inp + instructions for inp in inputs]
+
+
+def test_hit_and_miss():
+    cache = CompletionCache(":memory:")
+    assert cache.get("a") is None
+    cache.put("a", "A")
+    assert cache.get("a") == "A"
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_evicts_least_recently_accessed():
+    cache = CompletionCache(":memory:", max_entries=2)
+    cache.put("a", "A")
+    time.sleep(0.01)
+    cache.put("b", "B")
+    time.sleep(0.01)
+    # Not yet written, but must still count when evicting
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("a") == "A"
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+
+
+def test_expires_after_ttl():
+    cache = CompletionCache(":memory:", ttl=0)
+    cache.put("a", "A")
+    time.sleep(0.01)
+    assert cache.get("a") is None
+
+
+def test_only_deterministic_calls_are_cached():
+    llm = CachedLLM(llm=CountingLLM(), cache=CompletionCache(":memory:"))
+
+    async def run():
+        assert await llm.acomplete("x") == "x 1"
+        assert await llm.acomplete("x") == "x 2"
+        assert await llm.acomplete("y", temperature=0) == "y 3"
+        assert await llm.acomplete("y", temperature=0) == "y 3"
+    asyncio.run(run())
+
+
+def test_forwards_edits():
+    llm = CachedLLM(llm=CountingLLM(), cache=CompletionCache(":memory:"))
+    assert llm.edit("a", "b") == "ab"
+    assert asyncio.run(llm.parallel_edit(["a", "c"], "b")) == ["ab", "cb"]
+
+
+def test_shared_file_uses_write_ahead_log(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.db"))
+    assert cache._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_write_skipped_while_another_process_holds_the_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "BUSY_TIMEOUT", 0.1)
+    path = str(tmp_path / "cache.db")
+    cache = CompletionCache(path)
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+
+    cache.put("a", "A")
+    other.rollback()
+    assert cache.get("a") is None
+    cache.put("a", "A")
+    assert CompletionCache(path).get("a") == "A"
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from continuedev.libs.core import ParallelStep, SequentialStep, Step
+from continuedev.libs.observation import ParallelObservation, TextObservation
+
+
+class NamedStep(Step):
+    async def run(self, sdk):
+        pass
+
+
+# What the SlowSteps in a test did, in order
+log = []
+
+
+class SlowStep(Step):
+    """Waits, then runs a substep and returns its name as its observation"""
+    delay: float = 0
+
+    async def run(self, sdk):
+        log.append(("start", self.name))
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            log.append(("cancelled", self.name))
+            raise
+        await sdk.run_step(NamedStep(name=self.name + " substep"))
+        log.append(("end", self.name))
+        return TextObservation(text=self.name)
+
+
+class FailingStep(Step):
+    async def run(self, sdk):
+        await asyncio.sleep(0.01)
+        raise ValueError()
+
+
+def run_parallel(agent, step: ParallelStep):
+    log.clear()
+    asyncio.run(agent.run_from_step(step))
+    return [(node.step.name, node.depth) for node in agent.history.timeline]
+
+
+def test_parallel_steps_are_substeps_in_start_order(agent):
+    timeline = run_parallel(agent, ParallelStep(steps=[
+        SlowStep(name="a", delay=0.02), SlowStep(name="b", delay=0.01)]))
+    # b finishes first, but each substep stays under the step that ran it
+    assert timeline[1:] == [("a", 1), ("a substep", 2),
+                            ("b", 1), ("b substep", 2)]
+    assert agent.history.timeline[0].depth == 0
+
+
+def test_parallel_steps_are_limited_to_max_concurrency(agent):
+    run_parallel(agent, ParallelStep(steps=[SlowStep(name=str(i), delay=0.01) for i in range(5)],
+                                     max_concurrency=2))
+    running = most_running = 0
+    for event, _ in log:
+        running += 1 if event == "start" else -1
+        most_running = max(most_running, running)
+    assert most_running == 2
+    assert len(log) == 10
+
+
+def test_parallel_observations_are_merged_in_step_order(agent):
+    run_parallel(agent, ParallelStep(steps=[
+        SlowStep(name="a", delay=0.02), NamedStep(name="none"), SlowStep(name="b")]))
+    observation = agent.history.timeline[0].observation
+    assert isinstance(observation, ParallelObservation)
+    assert [o and o.text for o in observation.observations] == ["a", None, "b"]
+
+    assert ParallelObservation.merge([None, TextObservation(text="a")]).text == "a"
+    assert ParallelObservation.merge([None, None]) is None
+
+
+def test_failing_step_cancels_siblings(agent):
+    run_parallel(agent, ParallelStep(steps=[
+        SlowStep(name="a", delay=10), FailingStep(name="fail")]))
+    assert log == [("start", "a"), ("cancelled", "a")]
+
+
+def test_combining_steps_leaves_them_unchanged():
+    a, b, c = NamedStep(name="a"), NamedStep(name="b"), NamedStep(name="c")
+    parallel = a & b
+    assert [step.name for step in (parallel & c).steps] == ["a", "b", "c"]
+    assert [step.name for step in parallel.steps] == ["a", "b"]
+
+    sequential = a >> b
+    assert [step.name for step in (sequential >> c).steps] == ["a", "b", "c"]
+    assert [step.name for step in sequential.steps] == ["a", "b"]
+
+
+class LongRunningStep(Step):
+    """Starts a background task and a process, then waits"""
+    script: str
+
+    async def run(self, sdk):
+        sdk.start_background_task(asyncio.sleep(10))
+        try:
+            await sdk.run_command(f"{sys.executable} {self.script}")
+        except asyncio.CancelledError:
+            log.append(("cancelled", self.name))
+            raise
+
+
+def test_halt_cancels_steps_and_what_they_started(agent, tmp_path):
+    pid_file = tmp_path / "pid"
+    script = tmp_path / "main.py"
+    script.write_text(
+        f"import os, time\nopen({str(pid_file)!r}, 'w').write(str(os.getpid()))\ntime.sleep(10)\n")
+    log.clear()
+
+    async def run():
+        start = time.time()
+        running = asyncio.create_task(agent.run_from_step(
+            LongRunningStep(name="long", script=str(script))))
+        while not pid_file.exists() or pid_file.read_text() == "":
+            await asyncio.sleep(0.01)
+        background = list(agent._background_tasks)
+        assert len(background) == 1 and len(agent._run_tasks) == 1
+
+        await agent._request_halt()
+        assert log == [("cancelled", "long")]
+        assert background[0].cancelled()
+        # The caller only sees the steps end
+        await running
+        assert not running.cancelled()
+        assert not agent._active
+        assert time.time() - start < 5
+
+    asyncio.run(run())
+    # The process was killed
+    pid = int(pid_file.read_text())
+    with pytest.raises(ProcessLookupError):
+        for _ in range(100):
+            os.kill(pid, 0)
+            time.sleep(0.01)
+
+
+def test_halt_from_a_step_does_not_cancel_itself(agent):
+    class HaltingStep(Step):
+        async def run(self, sdk):
+            task = sdk.start_background_task(asyncio.sleep(10))
+            await agent._request_halt()
+            log.append(("halted", task.cancelled()))
+
+    log.clear()
+    asyncio.run(agent.run_from_step(HaltingStep(name="halting")))
+    assert log == [("halted", True)]
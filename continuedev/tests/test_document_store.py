@@ -0,0 +1,48 @@
+from continuedev.libs.util.document_store import DocumentStore
+from continuedev.models.filesystem_edit import FileEdit
+from continuedev.models.main import Position, Range
+
+
+def test_stale_reads_are_not_stored():
+    store = DocumentStore()
+    version = store.version("/a.py")
+    # The IDE reports an edit while a read is in flight
+    store.set("/a.py", "new")
+    assert not store.seed("/a.py", "old", version)
+    assert store.get("/a.py") == "new"
+
+
+def test_edits_apply_to_the_stored_document():
+    store = DocumentStore()
+    assert store.apply_edit("/a.py", FileEdit.from_insertion(
+        "/a.py", Position(line=0, character=0), "x")) is None
+
+    store.set("/a.py", "a\nb\n")
+    document = store.get_text_document("/a.py")
+    version = store.version("/a.py")
+    diff = store.apply_edit("/a.py", FileEdit(filepath="/a.py", range=Range.from_shorthand(1, 0, 1, 0),
+                                               replacement="bb"))
+    assert store.get("/a.py") == "a\nbb\n"
+    assert store.version("/a.py") > version
+    # The same document is edited in place rather than indexed again
+    assert store.get_text_document("/a.py") is document
+
+    store.apply_edit("/a.py", diff.backward)
+    assert store.get("/a.py") == "a\nb\n"
+
+
+def test_old_documents_expire():
+    store = DocumentStore(max_age=0)
+    store.set("/a.py", "a")
+    assert store.get("/a.py") is None
+    assert store.get_text_document("/a.py") is None
+
+
+def test_rename_and_invalidate():
+    store = DocumentStore()
+    store.set("/d/a.py", "a")
+    store.rename("/d/a.py", "/d/b.py")
+    assert store.get("/d/a.py") is None
+    assert store.get("/d/b.py") == "a"
+    store.invalidate_directory("/d")
+    assert store.get("/d/b.py") is None
@@ -0,0 +1,93 @@
+import random
+
+from continuedev.libs.util.edit_buffer import ManualEditBuffer
+from continuedev.models.filesystem import FileSystem
+from continuedev.models.filesystem_edit import FileEdit, FileEditWithFullContents
+from continuedev.models.main import Range
+
+ORIGINAL = "def f():\n    return 1\n\ndef g():\n    return 2\n"
+
+
+def ide_edit(contents: str, filepath: str = "/a.py") -> FileEditWithFullContents:
+    # The buffer compares contents, so the range the IDE reports doesn't matter
+    return FileEditWithFullContents(fileEdit=FileEdit(filepath=filepath, range=Range.from_shorthand(0, 0, 0, 0),
+                                                      replacement=""), fileContents=contents)
+
+
+def apply(contents: str, edit) -> str:
+    for file_edit in edit.next_edit():
+        contents, _ = FileSystem.apply_edit_to_str(contents, file_edit)
+    return contents
+
+
+def typed(buffer: ManualEditBuffer, contents: str, new_contents: str) -> str:
+    buffer.add(ide_edit(new_contents), contents)
+    return new_contents
+
+
+def test_keystrokes_merge_into_one_hunk():
+    buffer = ManualEditBuffer()
+    contents = ORIGINAL
+    for i in range(1, 4):
+        contents = typed(buffer, contents, contents.replace(
+            "return 1" + "0" * (i - 1), "return 1" + "0" * i, 1))
+    assert contents == ORIGINAL.replace("return 1", "return 1000")
+    assert len(buffer) == 1
+
+    diff = buffer.flush()
+    assert apply(ORIGINAL, diff.forward) == contents
+    assert apply(contents, diff.backward) == ORIGINAL
+    assert buffer.flush() is None
+
+
+def test_separate_changes_stay_separate():
+    buffer = ManualEditBuffer()
+    contents = typed(buffer, ORIGINAL, ORIGINAL.replace("def f", "def first"))
+    contents = typed(buffer, contents, contents.replace("return 2", "return 20"))
+    assert len(buffer) == 2
+
+    diff = buffer.flush()
+    assert apply(ORIGINAL, diff.forward) == contents
+    assert apply(contents, diff.backward) == ORIGINAL
+
+
+def test_typing_and_deleting_leaves_nothing():
+    buffer = ManualEditBuffer()
+    contents = typed(buffer, ORIGINAL, ORIGINAL.replace("f()", "ff()"))
+    typed(buffer, contents, ORIGINAL)
+    assert len(buffer) == 0
+    assert buffer.flush() is None
+
+
+def test_changes_by_steps_are_not_undone():
+    buffer = ManualEditBuffer()
+    contents = typed(buffer, ORIGINAL, ORIGINAL.replace("return 2", "return 20"))
+    # A step changes the top of the file, then the user edits again
+    stepped = contents.replace("def f():", "# comment\ndef f():")
+    contents = typed(buffer, stepped, stepped.replace(
+        "return 20", "return 200"))
+
+    # Undoing the user's edits keeps the step's
+    diff = buffer.flush()
+    without_user_edits = stepped.replace("return 20", "return 2")
+    assert apply(contents, diff.backward) == without_user_edits
+    assert apply(without_user_edits, diff.forward) == contents
+
+
+def test_random_edits_round_trip():
+    rng = random.Random(0)
+    for _ in range(50):
+        buffer = ManualEditBuffer()
+        contents = ORIGINAL
+        for _ in range(rng.randint(1, 20)):
+            start = rng.randint(0, len(contents))
+            end = rng.randint(start, min(len(contents), start + 5))
+            text = rng.choice(["", "x", "\n", "ab\ncd", "  "])
+            contents = typed(buffer, contents,
+                             contents[:start] + text + contents[end:])
+        diff = buffer.flush()
+        if diff is None:
+            assert contents == ORIGINAL
+            continue
+        assert apply(ORIGINAL, diff.forward) == contents
+        assert apply(contents, diff.backward) == ORIGINAL
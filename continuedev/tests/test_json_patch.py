@@ -0,0 +1,67 @@
+import copy
+import random
+
+from continuedev.libs.util.json_patch import make_patch
+
+
+def apply_patch(document, patch):
+    for op in patch:
+        if op["path"] == "":
+            document = op["value"]
+            continue
+        *parents, last = [key.replace("~1", "/").replace("~0", "~")
+                          for key in op["path"].split("/")[1:]]
+        target = document
+        for key in parents:
+            target = target[int(key) if isinstance(target, list) else key]
+        key = int(last) if isinstance(target, list) else last
+        if op["op"] == "add" and isinstance(target, list):
+            target.insert(key, op["value"])
+        elif op["op"] == "remove":
+            del target[key]
+        else:
+            target[key] = op["value"]
+    return document
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    kind = rng.choice(["int", "str", "none", "list", "dict"]
+                      if depth < 3 else ["int", "str", "none"])
+    if kind == "int":
+        return rng.randint(0, 3)
+    if kind == "str":
+        return rng.choice(["a", "b", ""])
+    if kind == "none":
+        return None
+    if kind == "list":
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {rng.choice(["x", "y", "a/b", "m~n"]): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+
+
+def test_no_change_no_patch():
+    value = {"a": [1, {"b": None}], "c": "d"}
+    assert make_patch(value, copy.deepcopy(value)) == []
+
+
+def test_patch_touches_only_changes():
+    patch = make_patch({"a": [1, 2, 3], "b": {"c": 1}, "d": 1},
+                       {"a": [1, 5], "b": {"c": 1}, "e": 1})
+    assert patch == [
+        {"op": "remove", "path": "/d"},
+        {"op": "replace", "path": "/a/1", "value": 5},
+        {"op": "remove", "path": "/a/2"},
+        {"op": "add", "path": "/e", "value": 1},
+    ]
+
+
+def test_keys_are_escaped():
+    assert make_patch({}, {"a/b~c": 1}) == [
+        {"op": "add", "path": "/a~1b~0c", "value": 1}]
+
+
+def test_random_patches_reproduce_new_value():
+    rng = random.Random(0)
+    for _ in range(500):
+        old, new = random_value(rng), random_value(rng)
+        patch = make_patch(old, new)
+        assert apply_patch(copy.deepcopy(old), patch) == new
@@ -0,0 +1,36 @@
+from continuedev.libs.llm import utils
+
+
+def test_model_family():
+    assert utils.model_family("gpt-4") == "cl100k_base"
+    assert utils.model_family("gpt-4-0314") == "cl100k_base"
+    assert utils.model_family("text-davinci-003") == "p50k_base"
+    assert utils.model_family("davinci") == utils.DEFAULT_FAMILY
+    assert utils.model_family(None) == utils.DEFAULT_FAMILY
+
+
+def test_tokenizers_load_lazily_per_family(monkeypatch):
+    loaded = []
+
+    def loader(family):
+        def load():
+            loaded.append(family)
+            return utils.Tokenizer(lambda text: list(text), lambda texts: [list(text) for text in texts])
+        return load
+    monkeypatch.setattr(utils, "TOKENIZER_LOADERS", {
+        family: loader(family) for family in utils.TOKENIZER_LOADERS})
+    monkeypatch.setattr(utils, "_tokenizers", {})
+    monkeypatch.setattr(utils, "_token_counts", utils.OrderedDict())
+
+    assert loaded == []
+    assert utils.count_tokens("abc", "gpt-4") == 3
+    assert utils.count_tokens_batch(["a", "bc", "abc"], "gpt-4-0314") == [1, 2, 3]
+    assert loaded == ["cl100k_base"]
+    utils.count_tokens("abc", "text-davinci-003")
+    assert loaded == ["cl100k_base", "p50k_base"]
+
+
+def test_counts_are_cached(word_tokenizer, monkeypatch):
+    assert utils.count_tokens("a b c") == 3
+    monkeypatch.setattr(word_tokenizer, "encode", None)
+    assert utils.count_tokens("a b c") == 3
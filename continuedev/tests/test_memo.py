@@ -0,0 +1,71 @@
+import asyncio
+from typing import Dict, List
+
+from continuedev.libs.util.memo import MemoEntry, ReadRecordingIde, StepMemo, content_hash
+from continuedev.models.filesystem import FileSystem, RangeInFile
+
+
+class FakeIde:
+    files: Dict[str, str]
+
+    def __init__(self, files: Dict[str, str]):
+        self.files = files
+
+    async def readFile(self, filepath: str) -> str:
+        return self.files[filepath]
+
+    async def readFiles(self, filepaths: List[str]) -> List[str]:
+        return [self.files[filepath] for filepath in filepaths]
+
+    async def readRangeInFile(self, range_in_file: RangeInFile) -> str:
+        return FileSystem.read_range_in_str(self.files[range_in_file.filepath], range_in_file.range)
+
+    async def readRangesInFiles(self, range_in_files: List[RangeInFile]) -> List[str]:
+        return [await self.readRangeInFile(range_in_file) for range_in_file in range_in_files]
+
+
+def memo_with_entry(ide: FakeIde) -> StepMemo:
+    """A memo holding the result of a step that read all of /a.py and the first line of /b.py"""
+    memo = StepMemo()
+    reads = {}
+    recording = ReadRecordingIde(ide, (reads,))
+    asyncio.run(recording.readFile("/a.py"))
+    asyncio.run(recording.readRangeInFile(RangeInFile.from_entire_file("/b.py", "b1")))
+    memo.record("step", MemoEntry(reads, None, [], None))
+    return memo
+
+
+def test_lookup_while_files_unchanged():
+    ide = FakeIde({"/a.py": "a", "/b.py": "b1\nb2"})
+    memo = memo_with_entry(ide)
+    assert asyncio.run(memo.lookup("step", ide)) is not None
+
+    # Changes outside the range read don't matter
+    ide.files["/b.py"] = "b1\nchanged"
+    assert asyncio.run(memo.lookup("step", ide)) is not None
+
+    ide.files["/a.py"] = "changed"
+    assert asyncio.run(memo.lookup("step", ide)) is None
+    # The stale entry is dropped
+    ide.files["/a.py"] = "a"
+    assert asyncio.run(memo.lookup("step", ide)) is None
+
+
+def test_lookup_inside_memoized_step_records_reads():
+    ide = FakeIde({"/a.py": "a", "/b.py": "b1\nb2"})
+    memo = memo_with_entry(ide)
+    outer_reads = {}
+    entry = asyncio.run(memo.lookup(
+        "step", ReadRecordingIde(ide, (outer_reads,))))
+    assert outer_reads == entry.reads
+    assert outer_reads["/a.py"] == content_hash("a")
+
+
+def test_recording_keeps_first_read():
+    ide = FakeIde({"/a.py": "a"})
+    outer, inner = {}, {}
+    recording = ReadRecordingIde(ide, (outer, inner))
+    asyncio.run(recording.readFile("/a.py"))
+    ide.files["/a.py"] = "changed"
+    asyncio.run(recording.readFiles(["/a.py"]))
+    assert outer == inner == {"/a.py": content_hash("a")}
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+from continuedev.libs.llm.metrics import LLMCallRecord, MetricsCollector, current_step_name
+from continuedev.libs.llm.openai import OpenAI
+from continuedev.libs.llm.utils import get_price_for_tokens
+
+
+def call(model: str, step, latency: float, time_to_first_token=None, tokens: int = 10) -> LLMCallRecord:
+    return LLMCallRecord(model=model, step=step, prompt_tokens=tokens, completion_tokens=2 * tokens,
+                         time_to_first_token=time_to_first_token, latency=latency, price=0.5)
+
+
+def test_usage_is_aggregated_in_total_by_step_and_by_model():
+    metrics = MetricsCollector(max_recent=2)
+    metrics.record(call("gpt-4", "EditCodeStep", 1.0, 0.25))
+    metrics.record(call("gpt-4", "EditCodeStep", 3.0))
+    metrics.record(call("gpt-3.5-turbo", None, 2.0, 0.75))
+
+    total = metrics.dict()["total"]
+    assert (total["calls"], total["prompt_tokens"], total["completion_tokens"]) == (3, 30, 60)
+    assert (total["mean_latency"], total["max_latency"], total["price"]) == (2.0, 3.0, 1.5)
+    # Only streamed calls have a time to first token
+    assert total["mean_time_to_first_token"] == 0.5
+
+    assert {step: usage.calls for step, usage in metrics.by_step.items()} == {
+        "EditCodeStep": 2, "None": 1}
+    assert {model: usage.calls for model, usage in metrics.by_model.items()} == {
+        "gpt-4": 2, "gpt-3.5-turbo": 1}
+    assert metrics.by_step["EditCodeStep"].dict()["mean_time_to_first_token"] == 0.25
+    assert [record["model"] for record in metrics.dict()["recent"]] == [
+        "gpt-4", "gpt-3.5-turbo"]
+
+
+def test_empty_payload_is_json():
+    payload = json.loads(json.dumps(MetricsCollector().dict()))
+    assert payload["total"]["calls"] == 0
+    assert payload["total"]["mean_latency"] is None
+    assert payload["by_step"] == {} and payload["recent"] == []
+
+
+def test_openai_calls_are_recorded_for_the_running_step(word_tokenizer):
+    metrics = MetricsCollector()
+    llm = OpenAI(api_key="", metrics=metrics)
+    token = current_step_name.set("EditCodeStep")
+    try:
+        llm._record("gpt-4", "a b c", "d e", 0.0,
+                    usage={"prompt_tokens": 7, "completion_tokens": 3})
+    finally:
+        current_step_name.reset(token)
+
+    async def chunks():
+        for chunk in ["one ", "two"]:
+            yield chunk
+
+    async def stream():
+        return [chunk async for chunk in llm.with_system_message("system")._metered_stream("gpt-4", "a b c", chunks())]
+
+    assert asyncio.run(stream()) == ["one ", "two"]
+
+    reported, streamed = metrics.recent
+    assert (reported.step, reported.prompt_tokens, reported.completion_tokens) == ("EditCodeStep", 7, 3)
+    assert reported.price == get_price_for_tokens(10, "gpt-4")
+    assert reported.time_to_first_token is None
+    # Without usage from the API, tokens are counted
+    assert (streamed.step, streamed.prompt_tokens, streamed.completion_tokens) == (None, 3, 2)
+    assert streamed.time_to_first_token is not None
+    assert metrics.total.calls == 2
+
+
+def test_no_collector_records_nothing(word_tokenizer):
+    OpenAI(api_key="")._record("gpt-4", "a", "b", 0.0)
@@ -0,0 +1,65 @@
+import random
+
+from continuedev.models.filesystem import FileSystem
+from continuedev.models.main import LineIndex, Position, Range
+
+
+def position_by_counting(string: str, index: int) -> Position:
+    before = string[:index].split("\n")
+    return Position(line=len(before) - 1, character=len(before[-1]))
+
+
+def random_string(rng: random.Random) -> str:
+    return "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 30)))
+
+
+def test_position_from_index():
+    rng = random.Random(0)
+    for _ in range(200):
+        string = random_string(rng)
+        line_index = LineIndex(string)
+        for index in range(len(string) + 1):
+            expected = position_by_counting(string, index)
+            assert Position.from_index(string, index) == expected
+            assert Position.from_index(string, index, line_index) == expected
+
+
+def test_first_line_characters_count_from_start():
+    assert Position.from_index("abc\nd", 2) == Position(line=0, character=2)
+    assert Position.from_index("\nabc", 0) == Position(line=0, character=0)
+
+
+def test_positions_of_keeps_order_of_indices():
+    rng = random.Random(1)
+    for _ in range(100):
+        string = random_string(rng)
+        indices = [rng.randint(0, len(string)) for _ in range(10)]
+        assert LineIndex(string).positions_of(indices) == [
+            position_by_counting(string, index) for index in indices]
+    assert LineIndex("a").positions_of([]) == []
+
+
+def test_entire_file_range():
+    rng = random.Random(2)
+    for _ in range(200):
+        content = random_string(rng)
+        r = Range.from_entire_file(content)
+        assert r == Range.from_entire_file(content, LineIndex(content))
+        if len(content) == 0:
+            assert r == Range.from_shorthand(0, 0, 0, 0)
+            continue
+        lines = content.split("\n")
+        if content.endswith("\n"):
+            lines = lines[:-1]
+        assert r == Range.from_shorthand(
+            0, 0, len(lines) - 1, len(lines[-1]) - 1)
+    assert Range.from_entire_file("a\r\nbc\r\n") == Range.from_shorthand(0, 0, 1, 1)
+
+
+def test_snippet_range_ends_on_its_last_character():
+    content = "def f():\n    return 1\n\nf()\n"
+    assert Range.from_snippet_in_file(content, "return") == Range.from_shorthand(1, 4, 1, 9)
+    for snippet in ["def", "return 1", "f():\n    return", "1\n\nf", "f()\n"]:
+        r = Range.from_snippet_in_file(content, snippet)
+        assert r == Range.from_snippet_in_file(content, snippet, LineIndex(content))
+        assert FileSystem.read_range_in_str(content, r) == snippet
@@ -0,0 +1,59 @@
+import asyncio
+import sys
+import time
+
+from continuedev.libs.observation import TracebackObservation
+from continuedev.libs.steps.main import RunCodeStep
+from continuedev.libs.util.process import run_process
+
+FAILING_SCRIPT = """import sys, time
+print('Traceback (most recent call last):\\n  File "main.py", line 1, in <module>\\n    f()\\nNameError: f', file=sys.stderr, flush=True)
+time.sleep(10)
+"""
+
+
+def test_output_and_returncode():
+    result = asyncio.run(run_process(
+        [sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"]))
+    assert (result.returncode, result.stdout, result.stderr) == (3, "out\n", "err\n")
+    assert not result.timed_out and not result.truncated
+
+
+def test_timeout_kills_process():
+    start = time.time()
+    result = asyncio.run(run_process(
+        [sys.executable, "-c", "import time; print('started', flush=True); time.sleep(10)"], timeout=0.5))
+    assert result.timed_out
+    assert result.stdout == "started\n"
+    assert time.time() - start < 5
+
+
+def test_output_keeps_the_end():
+    result = asyncio.run(run_process(
+        [sys.executable, "-c", "print('a' * 100 + 'end')"], max_output=10))
+    assert result.truncated
+    assert result.stdout == "aaaaaaend\n"
+
+
+def test_run_code_returns_traceback_before_process_ends(agent, tmp_path):
+    script = tmp_path / "main.py"
+    script.write_text(FAILING_SCRIPT)
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context))
+        start = time.time()
+        await agent.run_from_step(RunCodeStep(cmd=f"{sys.executable} {script}", timeout=1))
+        assert time.time() - start < 1
+        observation = agent.history.timeline[0].observation
+        assert isinstance(observation, TracebackObservation)
+        assert observation.traceback.error_type == "NameError"
+
+        # The process keeps running until it times out
+        assert len(agent._background_tasks) == 1
+        await asyncio.wait(list(agent._background_tasks))
+        assert time.time() - start < 5
+
+    asyncio.run(run())
+    assert errors == []
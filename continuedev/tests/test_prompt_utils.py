@@ -0,0 +1,76 @@
+from continuedev.libs.llm.prompt_utils import ContextPacker, MarkdownStyleStreamDecoder
+from continuedev.models.filesystem import RangeInFileWithContents
+from continuedev.models.main import Range
+from continuedev.models.text_document import TextDocument
+
+
+def numbered_file(n: int) -> RangeInFileWithContents:
+    contents = "\n".join(f"line{i}" for i in range(n))
+    return RangeInFileWithContents(filepath="/a.py", range=Range.from_entire_file(contents), contents=contents)
+
+
+def test_pack_keeps_everything_that_fits(word_tokenizer):
+    rif = numbered_file(10)
+    assert ContextPacker(1000).pack([rif], 100) == [rif]
+
+
+def test_pack_trims_around_focus_line(word_tokenizer):
+    packed = ContextPacker(1000).pack([numbered_file(100)], 13, [80])
+    assert len(packed) == 1
+    lines = packed[0].contents.splitlines()
+    assert "line80" in lines
+    assert len(lines) < 100
+    assert packed[0].range.start.line == int(lines[0][4:])
+    assert packed[0].range.end.line == int(lines[-1][4:])
+
+
+def test_pack_trims_around_middle_without_focus(word_tokenizer):
+    packed = ContextPacker(1000).pack([numbered_file(100)], 13)
+    assert "line50" in packed[0].contents.splitlines()
+
+
+ORIGINAL = "import os\n\ndef f():\n    return 1\n\nprint(f())\n"
+# The body of f, lines 2-3
+F_RANGE = Range.from_shorthand(2, 0, 3, 11)
+
+
+def stream(completion: str, chunk_size: int = 3, close: bool = True) -> str:
+    """Apply the edits decoded from a completion streamed in small chunks, returning the file's contents"""
+    rif = RangeInFileWithContents(filepath="/a.py", range=F_RANGE,
+                                  contents=TextDocument(ORIGINAL).read_range(F_RANGE))
+    decoder = MarkdownStyleStreamDecoder([rif])
+    document = TextDocument(ORIGINAL)
+    for i in range(0, len(completion), chunk_size):
+        for edit in decoder.feed(completion[i:i + chunk_size]):
+            document.apply_edit(edit)
+    for edit in decoder.close() if close else decoder.abort():
+        document.apply_edit(edit)
+    return document.text()
+
+
+def test_stream_replaces_range_once_block_closes():
+    completion = "File (/a.py)\n```\ndef f():\n    x = 2\n    return x\n```\n"
+    assert stream(completion) == "import os\n\ndef f():\n    x = 2\n    return x\n\nprint(f())\n"
+
+
+def test_stream_without_fence_is_all_code():
+    assert stream("def g():\n    return 2") == "import os\n\ndef g():\n    return 2\n\nprint(f())\n"
+
+
+def test_truncated_stream_leaves_file_unchanged():
+    completion = "File (/a.py)\n```\ndef f():\n    x = 2\n    ret"
+    assert stream(completion) == ORIGINAL
+
+
+def test_aborted_stream_leaves_file_unchanged():
+    completion = "File (/a.py)\n```\ndef f():\n    x = 2\n"
+    assert stream(completion, close=False) == ORIGINAL
+
+
+def test_truncated_stream_has_no_edit_diffs():
+    rif = RangeInFileWithContents(
+        filepath="/a.py", range=F_RANGE, contents="def f():\n    return 1")
+    decoder = MarkdownStyleStreamDecoder([rif])
+    decoder.feed("File (/a.py)\n```\ndef f():\n")
+    decoder.close()
+    assert decoder.edit_diffs() == []
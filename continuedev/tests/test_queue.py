@@ -0,0 +1,44 @@
+import asyncio
+
+from continuedev.libs.util.queue import PendingRequests
+
+
+def test_responses_resolve_by_message_id():
+    async def run():
+        pending = PendingRequests()
+        first_id, first = pending.create("readFile")
+        second_id, second = pending.create("readFile")
+        # Answered out of order
+        assert pending.resolve("readFile", {"messageId": second_id, "contents": "b"})
+        assert pending.resolve("readFile", {"messageId": first_id, "contents": "a"})
+        assert (await first)["contents"] == "a"
+        assert (await second)["contents"] == "b"
+
+    asyncio.run(run())
+
+
+def test_responses_without_id_resolve_oldest_of_type():
+    async def run():
+        pending = PendingRequests()
+        _, files = pending.create("openFiles")
+        _, first = pending.create("readFile")
+        _, second = pending.create("readFile")
+        assert pending.resolve("readFile", {"contents": "a"})
+        assert first.done() and not second.done() and not files.done()
+        assert (await first)["contents"] == "a"
+
+    asyncio.run(run())
+
+
+def test_unknown_and_discarded_responses_are_not_resolved():
+    async def run():
+        pending = PendingRequests()
+        assert not pending.resolve("readFile", {"messageId": "unknown"})
+        message_id, future = pending.create("readFile")
+        # The request timed out
+        pending.discard(message_id)
+        assert not pending.resolve("readFile", {"messageId": message_id})
+        assert not pending.resolve("readFile", {})
+        assert not future.done()
+
+    asyncio.run(run())
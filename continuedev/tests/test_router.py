@@ -0,0 +1,165 @@
+import asyncio
+import gc
+import json
+
+import aiohttp
+from fastapi import WebSocketDisconnect
+
+from continuedev.server.router import Router, SessionRegistry, hash_worker
+
+
+class FakeSocket:
+    """Stands in for the IDE's websocket and the workers' /ide/ws connections"""
+
+    def __init__(self, incoming=(), stay_open=False):
+        self.sent = []
+        self.incoming = list(incoming)
+        self.stay_open = stay_open
+        self.closed = False
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def send_str(self, data):
+        self.sent.append(data)
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def receive_text(self):
+        if not self.incoming:
+            raise WebSocketDisconnect()
+        return self.incoming.pop(0)
+
+    async def accept(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.incoming and self.stay_open:
+            await asyncio.Event().wait()
+        if not self.incoming:
+            raise StopAsyncIteration
+        return aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, json.dumps(self.incoming.pop(0)), None)
+
+
+def make_router(workers: int = 2) -> Router:
+    router = Router([0] * workers, SessionRegistry(":memory:"))
+    router.ide = FakeSocket()
+    router._worker_sockets = {worker: FakeSocket()
+                              for worker in range(workers)}
+    return router
+
+
+async def request(router: Router, worker: int, data):
+    await router._forward_from_worker(worker, FakeSocket([data]))
+
+
+def test_responses_go_to_the_worker_that_asked():
+    async def run():
+        router = make_router()
+        await request(router, 0, {"messageType": "readFile", "messageId": "a"})
+        await request(router, 1, {"messageType": "readFile", "messageId": "b"})
+        assert [data["messageId"] for data in router.ide.sent] == ["a", "b"]
+
+        await router.handle_ide_message({"messageType": "readFile", "messageId": "b", "contents": "1"})
+        await router.handle_ide_message({"messageType": "readFile", "messageId": "a", "contents": "0"})
+        assert router._worker_sockets[0].sent == [
+            {"messageType": "readFile", "messageId": "a", "contents": "0"}]
+        assert router._worker_sockets[1].sent == [
+            {"messageType": "readFile", "messageId": "b", "contents": "1"}]
+
+    asyncio.run(run())
+
+
+def test_responses_without_id_go_to_oldest_request_of_type():
+    async def run():
+        router = make_router()
+        await request(router, 1, {"messageType": "openFiles", "messageId": "a"})
+        await request(router, 0, {"messageType": "readFile", "messageId": "b"})
+        await request(router, 1, {"messageType": "readFile", "messageId": "c"})
+
+        await router.handle_ide_message({"messageType": "readFile", "contents": "0"})
+        await router.handle_ide_message({"messageType": "readFile", "contents": "1"})
+        assert router._worker_sockets[0].sent == [
+            {"messageType": "readFile", "contents": "0"}]
+        assert router._worker_sockets[1].sent == [
+            {"messageType": "readFile", "contents": "1"}]
+        assert list(router._pending_requests) == ["a"]
+
+    asyncio.run(run())
+
+
+def test_updates_are_broadcast():
+    async def run():
+        router = make_router()
+        update = {"messageType": "fileEdits", "fileEdits": []}
+        await router.handle_ide_message(update)
+        # A response that no worker is waiting for is treated the same way
+        await router.handle_ide_message({"messageType": "readFile", "messageId": "unknown"})
+        for socket in router._worker_sockets.values():
+            assert socket.sent == [
+                update, {"messageType": "readFile", "messageId": "unknown"}]
+
+    asyncio.run(run())
+
+
+def test_new_sessions_are_registered_to_their_worker():
+    async def run():
+        router = make_router(3)
+        for _ in range(5):
+            await router.handle_ide_message({"messageType": "openNotebook"})
+        for worker, socket in router._worker_sockets.items():
+            for data in socket.sent:
+                assert router.registry.get(data["sessionId"]) == worker
+                assert router.owner(data["sessionId"]) == worker
+
+    asyncio.run(run())
+
+
+def test_registry_persists(tmp_path):
+    path = str(tmp_path / "sessions" / "registry.db")
+    registry = SessionRegistry(path)
+    assert registry.get("a") is None
+    registry.set("a", 1)
+    registry.set("a", 2)
+    assert SessionRegistry(path).get("a") == 2
+
+
+def test_owner_falls_back_to_hash():
+    router = make_router(2)
+    assert router.owner("unknown") == hash_worker("unknown", 2)
+    # Registered when there were more workers
+    router.registry.set("session", 5)
+    assert router.owner("session") == hash_worker("session", 2)
+    router.registry.set("session", 1)
+    assert router.owner("session") == 1
+
+
+def test_closed_notebook_leaves_no_unretrieved_exception():
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context))
+        router = make_router()
+        worker_ws = FakeSocket([{"state": 1}], stay_open=True)
+
+        async def connect_worker(worker, path):
+            return worker_ws
+
+        router._connect_worker = connect_worker
+        notebook = FakeSocket(['{"messageType": "main_input"}'])
+        await router.serve_notebook(notebook, "session")
+        assert notebook.sent == ['{"state": 1}']
+        assert worker_ws.sent == ['{"messageType": "main_input"}']
+        assert worker_ws.closed
+        gc.collect()
+
+    asyncio.run(run())
+    assert errors == []
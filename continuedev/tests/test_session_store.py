@@ -0,0 +1,119 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from conftest import FakeLLM, StopPolicy
+from continuedev.libs.core import Agent, EditDiffStep, FileSystemEditStep, History, HistoryNode, ManualEditStep, Step
+from continuedev.libs.observation import TextObservation
+from continuedev.models.filesystem_edit import FileEdit, FileEditWithFullContents
+from continuedev.models.main import Position, Range
+from continuedev.server.session_store import SessionLog
+
+
+class NamedStep(Step):
+    async def run(self, sdk):
+        pass
+
+
+def as_json(history: History) -> dict:
+    return json.loads(json.dumps(history.dict(), default=str))
+
+
+def change_randomly(history: History, rng: random.Random, i: int):
+    current = history.get_current()
+    choice = rng.random()
+    if current is None or choice < 0.4:
+        depth = 0 if current is None else rng.randint(0, current.depth + 1)
+        history.add_node(HistoryNode(NamedStep(name=f"step {i}"), depth=depth))
+    elif choice < 0.55:
+        history.set_observation(TextObservation(text=f"observation {i}"))
+    elif choice < 0.7:
+        history.set_description(current.step, f"description {i}")
+    elif choice < 0.8 and current.depth == 0:
+        history.remove_current_and_substeps()
+    elif choice < 0.9 and history.current_index > 0:
+        history.step_back()
+    else:
+        history.take_next_step()
+
+
+@pytest.mark.parametrize("snapshot_every", [1, 7, 1000])
+def test_load_replays_history(tmp_path, snapshot_every):
+    rng = random.Random(snapshot_every)
+    history = History.from_empty()
+    log = SessionLog(str(tmp_path), "session", snapshot_every=snapshot_every)
+    log.attach(history)
+    for i in range(100):
+        change_randomly(history, rng, i)
+        if i % 10 == 0:
+            assert as_json(SessionLog(str(tmp_path), "session").load()) == as_json(history)
+    log.close()
+    assert as_json(SessionLog(str(tmp_path), "session").load()) == as_json(history)
+
+
+def test_resumed_session_keeps_logging(tmp_path):
+    rng = random.Random(0)
+    history = History.from_empty()
+    log = SessionLog(str(tmp_path), "session")
+    log.attach(history)
+    for i in range(20):
+        change_randomly(history, rng, i)
+    log.close()
+
+    resumed_log = SessionLog(str(tmp_path), "session")
+    resumed = resumed_log.load()
+    resumed_log.attach(resumed)
+    for i in range(20, 40):
+        change_randomly(resumed, rng, i)
+    resumed_log.close()
+    assert as_json(SessionLog(str(tmp_path), "session").load()) == as_json(resumed)
+
+
+def test_incomplete_last_line_is_ignored(tmp_path):
+    history = History.from_empty()
+    log = SessionLog(str(tmp_path), "session")
+    log.attach(history)
+    history.add_node(HistoryNode(NamedStep(name="first")))
+    log.close()
+    expected = as_json(history)
+
+    with open(log.log_path, "a") as f:
+        f.write('{"seq": 2, "event": "add", "no')
+    assert as_json(SessionLog(str(tmp_path), "session").load()) == expected
+
+
+class EditingStep(Step):
+    """Edits a file in each of the ways steps do"""
+
+    async def run(self, sdk):
+        await sdk.apply_filesystem_edit(FileEdit.from_insertion("/a.py", Position(line=0, character=0), "# step\n"))
+        # Streamed into the IDE, then recorded
+        diff = await sdk.ide.applyFileSystemEdit(FileEdit.from_insertion(
+            "/a.py", Position(line=1, character=0), "# streamed\n"))
+        await sdk.record_edit_diff(diff)
+
+
+@pytest.mark.parametrize("snapshot_every", [1, 1000])
+def test_resumed_session_reverses_edits(tmp_path, agent, ide, snapshot_every):
+    ide.files["/a.py"] = "a = 1\n"
+    log = SessionLog(str(tmp_path), "session", snapshot_every=snapshot_every)
+    log.attach(agent.history)
+
+    # The user edits the file, which is recorded when the next step runs
+    agent.handle_manual_edits([FileEditWithFullContents(fileEdit=FileEdit(filepath="/a.py", range=Range.from_shorthand(0, 4, 0, 4),
+                                                                          replacement="2"), fileContents="a = 2\n")],
+                              {"/a.py": ide.files["/a.py"]})
+    ide.files["/a.py"] = "a = 2\n"
+    asyncio.run(agent.run_from_step(EditingStep()))
+    log.close()
+    assert ide.files["/a.py"] == "# step\n# streamed\na = 2\n"
+
+    resumed = Agent(llm=FakeLLM(), policy=StopPolicy(), ide=ide,
+                    history=SessionLog(str(tmp_path), "session").load())
+    step_classes = [node.step.__class__ for node in resumed.history.timeline]
+    assert step_classes == [ManualEditStep, EditingStep, FileSystemEditStep, EditDiffStep]
+
+    asyncio.run(resumed.reverse_to_index(0))
+    assert ide.files["/a.py"] == "a = 1\n"
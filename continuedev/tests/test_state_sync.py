@@ -0,0 +1,143 @@
+import asyncio
+import copy
+import json
+import random
+import sys
+
+from continuedev.libs.core import FullState, History, HistoryNode, Step
+from continuedev.libs.observation import TextObservation
+from continuedev.server.state_sync import StateSync
+
+
+class NamedStep(Step):
+    async def run(self, sdk):
+        pass
+
+
+class FakeAgent:
+    """What StateSync needs of an Agent"""
+
+    def __init__(self):
+        self.history = History.from_empty()
+        self.active = False
+        self.user_input_queue = []
+
+    def get_full_state(self) -> FullState:
+        return FullState(history=self.history, active=self.active, user_input_queue=self.user_input_queue)
+
+
+def apply_patch(document, patch):
+    for op in patch:
+        *parents, last = op["path"].split("/")[1:]
+        target = document
+        for key in parents:
+            target = target[int(key) if isinstance(target, list) else key]
+        key = int(last) if isinstance(target, list) else last
+        if op["op"] == "add" and isinstance(target, list):
+            target.insert(key, op["value"])
+        elif op["op"] == "remove":
+            del target[key]
+        else:
+            target[key] = op["value"]
+    return document
+
+
+def as_json(value):
+    return json.loads(json.dumps(value, default=str))
+
+
+def test_patches_reproduce_state():
+    rng = random.Random(0)
+    agent = FakeAgent()
+    sync = StateSync(agent)
+    # Changes before the client connects are in the full state
+    agent.history.add_node(HistoryNode(NamedStep(name="first")))
+    client = as_json(sync.full_state())
+
+    for i in range(300):
+        history = agent.history
+        action = rng.random()
+        if action < 0.4 or len(history.timeline) == 0:
+            current = history.get_current()
+            depth = rng.randint(0, current.depth + 1) if current else 0
+            history.add_node(HistoryNode(NamedStep(name=f"step{i}"), depth=depth))
+        elif action < 0.6:
+            history.set_observation(TextObservation(text=f"output {i}"),
+                                    rng.choice(history.timeline))
+        elif action < 0.7:
+            history.set_description(rng.choice(history.timeline).step, f"description {i}")
+        elif action < 0.8 and history.current_index >= 0:
+            history.remove_current_and_substeps()
+        elif action < 0.85 and history.current_index >= 0:
+            history.step_back()
+        elif action < 0.9:
+            agent.active = not agent.active
+        else:
+            agent.user_input_queue.append(f"input {i}")
+
+        if rng.random() < 0.3:
+            patch = sync.patch()
+            client = apply_patch(client, copy.deepcopy(as_json(patch)))
+            assert client == as_json(agent.get_full_state().dict())
+
+
+def test_patch_only_contains_changes():
+    agent = FakeAgent()
+    sync = StateSync(agent)
+    for i in range(50):
+        agent.history.add_node(HistoryNode(NamedStep(name=f"step{i}")))
+    sync.full_state()
+    assert sync.patch() == []
+
+    agent.history.set_observation(TextObservation(text="done"))
+    patch = sync.patch()
+    assert all(op["path"].startswith("/history/timeline/49/") for op in patch)
+
+
+def test_needs_full_state_until_sent():
+    agent = FakeAgent()
+    sync = StateSync(agent)
+    assert sync.patch() is None
+    sync.full_state()
+    assert sync.patch() == []
+    sync.reset()
+    assert sync.patch() is None
+
+
+OUTPUT_SCRIPT = """import time
+for line in ["hello", "bye", "end"]:
+    print(line, flush=True)
+    time.sleep(0.2)
+"""
+
+
+class CommandStep(Step):
+    command: str
+
+    async def run(self, sdk):
+        await sdk.run_command(self.command)
+        return TextObservation(text="finished")
+
+
+def test_live_command_output_is_patched(agent, tmp_path):
+    script = tmp_path / "output.py"
+    script.write_text(OUTPUT_SCRIPT)
+    sync = StateSync(agent)
+    client = as_json(sync.full_state())
+    patches = []
+
+    def on_update(state):
+        patch = sync.patch()
+        patches.append(patch)
+        nonlocal client
+        client = apply_patch(client, copy.deepcopy(as_json(patch)))
+
+    agent.on_update(on_update)
+    asyncio.run(agent.run_from_step(CommandStep(command=f"{sys.executable} {script}")))
+
+    # The output so far is shown on the step after each line
+    sent = json.dumps(patches)
+    for output in ["hello\n", "hello\nbye\n", "hello\nbye\nend\n"]:
+        assert json.dumps(output) in sent
+    assert client == as_json(agent.get_full_state().dict())
+    assert client["history"]["timeline"][-1]["observation"]["text"] == "finished"
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from continuedev.models import text_document
+from continuedev.models.filesystem_edit import FileEdit
+from continuedev.models.main import Position, Range
+from continuedev.models.text_document import TextDocument, apply_edit_to_str, newline_offsets, read_range_in_str
+
+TEXT = "def f():\n    return 1\n\nprint(f())\n"
+
+
+def random_text(rng: random.Random) -> str:
+    return "".join(rng.choice(["a", "b", "\n", "\r\n", "cd"]) for _ in range(rng.randint(0, 12)))
+
+
+def random_range(rng: random.Random) -> Range:
+    return Range.from_shorthand(rng.randint(-1, 5), rng.randint(-2, 5), rng.randint(-1, 5), rng.randint(-2, 5))
+
+
+def random_edit(rng: random.Random) -> FileEdit:
+    return FileEdit(filepath="/a.py", range=random_range(rng), replacement=rng.choice(["", "x", "\n", "y\nzz", "\n\n"]))
+
+
+def test_newline_offsets():
+    assert newline_offsets("") == []
+    assert newline_offsets("a\nbc\n\nd") == [1, 4, 5]
+
+
+def test_read_range_is_end_inclusive():
+    document = TextDocument(TEXT)
+    assert document.read_range(Range.from_shorthand(1, 4, 1, 9)) == "return"
+    # Characters past the end of a line are clamped to it
+    assert document.read_range(Range.from_shorthand(0, 0, 1, 100)) == "def f():\n    return 1"
+    # Ending just after a newline
+    assert document.read_range(Range.from_shorthand(0, 0, 1, -1)) == "def f():\n"
+
+
+def test_crlf_line_breaks_are_not_read_as_line_contents():
+    document = TextDocument("ab\r\ncd\r\n")
+    assert document.read_range(Range.from_shorthand(0, 0, 0, 100)) == "ab"
+    assert document.read_range(Range.from_shorthand(0, 0, 1, -1)) == "ab\r\n"
+
+
+def test_edits_and_their_reversals():
+    rng = random.Random(0)
+    for _ in range(200):
+        original = random_text(rng)
+        document = TextDocument(original)
+        diffs = []
+        for _ in range(rng.randint(1, 10)):
+            diffs.append(document.apply_edit(random_edit(rng)))
+            assert len(document) == len(document.text())
+            assert document.line_count == document.text().count("\n") + 1
+        for diff in reversed(diffs):
+            document.apply_edit(diff.backward)
+        assert document.text() == original
+
+
+def test_many_edits_compact_the_pieces(monkeypatch):
+    monkeypatch.setattr(text_document, "MAX_PIECES", 4)
+    document = TextDocument(TEXT)
+    for i in range(20):
+        document.apply_edit(FileEdit.from_insertion(
+            "/a.py", Position(line=1, character=0), f"# {i}\n"))
+    assert len(document._pieces) <= 4
+    assert document.text() == "def f():\n" + \
+        "".join(f"# {i}\n" for i in reversed(range(20))) + TEXT[9:]
+
+
+@pytest.mark.parametrize("scan_chunk", [3, text_document.SCAN_CHUNK])
+def test_str_functions_match_text_document(monkeypatch, scan_chunk):
+    monkeypatch.setattr(text_document, "SCAN_CHUNK", scan_chunk)
+    rng = random.Random(scan_chunk)
+    for _ in range(2000):
+        text = random_text(rng)
+        r = random_range(rng)
+        assert read_range_in_str(text, r) == TextDocument(text).read_range(r)
+
+        edit = random_edit(rng)
+        document = TextDocument(text)
+        diff = document.apply_edit(edit)
+        assert apply_edit_to_str(text, edit) == (document.text(), diff)
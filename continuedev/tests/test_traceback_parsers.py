@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from continuedev.libs.util.traceback_parsers import TracebackScanner, find_python_tracebacks
+
+RUNTIME_ERROR = """Traceback (most recent call last):
+  File "/a/main.py", line 10, in <module>
+    main()
+  File "/a/main.py", line 7, in main
+    return 1 / 0
+ZeroDivisionError: division by zero
+"""
+
+SYNTAX_ERROR = """  File "/a/b.py", line 3
+    x = (
+        ^
+SyntaxError: '(' was never closed
+"""
+
+IMPORTED_SYNTAX_ERROR = """Traceback (most recent call last):
+  File "/a/main.py", line 1, in <module>
+    import b
+  File "/a/b.py", line 3
+    x = (
+        ^
+SyntaxError: '(' was never closed
+"""
+
+OUTPUTS = [
+    RUNTIME_ERROR,
+    SYNTAX_ERROR,
+    IMPORTED_SYNTAX_ERROR,
+    "starting\n" + SYNTAX_ERROR + "done\n",
+    "output\n" + RUNTIME_ERROR + "more output\n" + SYNTAX_ERROR,
+    # Too many lines between the file and the exception to be a syntax error
+    '  File "/a/b.py", line 3\n    a\n    b\n    c\n    d\nSyntaxError: invalid syntax\n',
+    '  File "/a/b.py", line 3\nnot indented\nSyntaxError: invalid syntax\n',
+    "no errors here\n",
+]
+
+
+def scan(text: str, chunk_sizes) -> list:
+    scanner = TracebackScanner()
+    tracebacks = []
+    start = 0
+    while start < len(text):
+        end = start + next(chunk_sizes)
+        tracebacks += scanner.feed(text[start:end])
+        start = end
+    return tracebacks + scanner.close()
+
+
+@pytest.mark.parametrize("text", OUTPUTS)
+def test_scanner_fed_lines_matches_find(text):
+    lines = text.splitlines(keepends=True)
+    scanner = TracebackScanner()
+    tracebacks = []
+    for line in lines:
+        tracebacks += scanner.feed(line)
+    tracebacks += scanner.close()
+    assert tracebacks == find_python_tracebacks(text)
+
+
+@pytest.mark.parametrize("text", OUTPUTS)
+def test_scanner_fed_chunks_matches_find(text):
+    rng = random.Random(0)
+    for _ in range(20):
+        assert scan(text, iter(lambda: rng.randint(1, 8), None)) == \
+            find_python_tracebacks(text)
+
+
+def test_scanner_finds_syntax_error_without_header():
+    tracebacks = scan(SYNTAX_ERROR, iter(lambda: 1, None))
+    assert len(tracebacks) == 1
+    assert tracebacks[0].error_type == "SyntaxError"
+    assert tracebacks[0].frames[0].filepath == "/a/b.py"
+    assert tracebacks[0].frames[0].lineno == 3
+
+
+def test_scanner_finds_traceback_without_trailing_newline():
+    assert scan(RUNTIME_ERROR.rstrip("\n"), iter(lambda: 5, None)) == \
+        find_python_tracebacks(RUNTIME_ERROR)
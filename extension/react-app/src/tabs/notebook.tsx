@@ -14,6 +14,7 @@ import StepContainer from "../components/StepContainer";
 import { useSelector } from "react-redux";
 import { RootStore } from "../redux/store";
 import useContinueWebsocket from "../hooks/useWebsocket";
+import { applyPatch } from "../util/jsonPatch";
 
 let TopNotebookDiv = styled.div`
   display: grid;
@@ -157,12 +158,33 @@ function Notebook(props: NotebookProps) {
   // } as any
   // );
 
+  // Last full state received and its version, which incoming patches are applied to
+  const stateRef = useRef<{ state: any; version: number } | undefined>();
+  const resyncRequested = useRef(false);
+
+  const updateState = (state: any, version: number) => {
+    stateRef.current = { state, version };
+    setWaitingForSteps(state.active);
+    setHistory(state.history);
+    setUserInputQueue(state.user_input_queue);
+  };
+
   const { send: websocketSend } = useContinueWebsocket(serverUrl, (msg) => {
     let data = JSON.parse(msg.data);
     if (data.messageType === "state") {
-      setWaitingForSteps(data.state.active);
-      setHistory(data.state.history);
-      setUserInputQueue(data.state.user_input_queue);
+      resyncRequested.current = false;
+      updateState(data.state, data.version);
+    } else if (data.messageType === "stateDelta") {
+      if (stateRef.current?.version === data.baseVersion) {
+        updateState(
+          applyPatch(stateRef.current.state, data.patch),
+          data.version
+        );
+      } else if (!resyncRequested.current) {
+        // Missed an update, so ask for the whole state again
+        resyncRequested.current = true;
+        websocketSend({ messageType: "resync" });
+      }
     }
   });
 
@@ -0,0 +1,59 @@
+export interface PatchOperation {
+  op: "add" | "remove" | "replace";
+  path: string;
+  value?: any;
+}
+
+function parsePath(path: string): string[] {
+  if (path === "") {
+    return [];
+  }
+  return path
+    .slice(1)
+    .split("/")
+    .map((key) => key.replace(/~1/g, "/").replace(/~0/g, "~"));
+}
+
+function applyOperation(doc: any, keys: string[], operation: PatchOperation): any {
+  if (keys.length === 0) {
+    return operation.op === "remove" ? undefined : operation.value;
+  }
+
+  // Copy only the containers along the path, so unchanged subtrees keep their identity
+  const [key, ...rest] = keys;
+  if (Array.isArray(doc)) {
+    const copy = [...doc];
+    const index = key === "-" ? copy.length : parseInt(key);
+    if (rest.length > 0) {
+      copy[index] = applyOperation(copy[index], rest, operation);
+    } else if (operation.op === "add") {
+      copy.splice(index, 0, operation.value);
+    } else if (operation.op === "remove") {
+      copy.splice(index, 1);
+    } else {
+      copy[index] = operation.value;
+    }
+    return copy;
+  }
+
+  const copy = { ...doc };
+  if (rest.length > 0) {
+    copy[key] = applyOperation(copy[key], rest, operation);
+  } else if (operation.op === "remove") {
+    delete copy[key];
+  } else {
+    copy[key] = operation.value;
+  }
+  return copy;
+}
+
+/**
+ * Apply a JSON patch (RFC 6902, add/remove/replace only) without mutating the original document
+ */
+export function applyPatch(doc: any, patch: PatchOperation[]): any {
+  return patch.reduce(
+    (current, operation) =>
+      applyOperation(current, parsePath(operation.path), operation),
+    doc
+  );
+}
@@ -138,26 +138,40 @@ class IdeProtocolClient {
     switch (message.messageType) {
       case "highlightedCode":
         this.send("highlightedCode", {
+          messageId: message.messageId,
           highlightedCode: this.getHighlightedCode(),
         });
         break;
       case "workspaceDirectory":
         this.send("workspaceDirectory", {
+          messageId: message.messageId,
           workspaceDirectory: this.getWorkspaceDirectory(),
         });
+        break;
       case "openFiles":
         this.send("openFiles", {
+          messageId: message.messageId,
           openFiles: this.getOpenFiles(),
         });
         break;
       case "readFile":
         this.send("readFile", {
+          messageId: message.messageId,
           contents: this.readFile(message.filepath),
         });
         break;
+      case "readFiles":
+        this.send("readFiles", {
+          messageId: message.messageId,
+          contents: message.filepaths.map((filepath: string) =>
+            this.readFile(filepath)
+          ),
+        });
+        break;
       case "editFile":
         let fileEdit = await this.editFile(message.edit);
         this.send("editFile", {
+          messageId: message.messageId,
           fileEdit,
         });
         break;